@@ -29,7 +29,7 @@ def main() -> int:
 
     print("Getting Access Token....")
     # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
+    ibm_iam_access_token = iam.get_ibm_iam_access_token(
         ibm_api_key=args.ibmcloud_api_key
     )
     print(f'Access Token Found - {ibm_iam_access_token}')
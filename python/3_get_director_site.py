@@ -6,6 +6,7 @@ import uuid
 
 import lib.iam as iam
 import lib.vcfaas as vcfass
+import lib.context as context
 
 def parse_arg() -> argparse.Namespace:
     """Parse input arguments.
@@ -32,31 +33,22 @@ def main() -> int:
 
     print("Getting Access Token....")
     # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
+    ibm_iam_access_token = iam.get_ibm_iam_access_token(
         ibm_api_key=args.ibmcloud_api_key
     )
 
     #--------------------------------------------------------------
-    # List Director Sites
+    # Resolve director site id
     #--------------------------------------------------------------
 
-    print("Getting Director Sites....")
-    director_sites = vcfass.list_director_sites(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['director_sites']
-
-    director_site_names = [d["name"] for d in director_sites]
-    if args.director_site_name not in director_site_names:
-        print(f'Error: Site not found : {args.director_site_name}')
+    print("Resolving Director Site....")
+    try:
+        director_site_id = context.resolve_site(args.ibmcloud_api_key, args.ibmcloud_region,
+                                                args.director_site_name)["id"]
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
         exit(1)
 
-    #--------------------------------------------------------------
-    # Extract director site id
-    #--------------------------------------------------------------
-
-    director_site_id = [d for d in director_sites if d.get('name') == args.director_site_name][0]['id']
-
     #--------------------------------------------------------------
     # Get Director Site
     #--------------------------------------------------------------
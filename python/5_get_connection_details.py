@@ -6,6 +6,7 @@ import uuid
 
 import lib.iam as iam
 import lib.vcfaas as vcfass
+import lib.context as context
 from urllib.parse import urlparse
 
 
@@ -31,52 +32,19 @@ def main() -> int:
     args = parse_arg()
 
     #--------------------------------------------------------------
-    # Get Session Token
+    # Resolve Director Site, Virtual Data Center and ORG
     #--------------------------------------------------------------
 
-    print("Getting Access Token....")
-    # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
-        ibm_api_key=args.ibmcloud_api_key
-    )
+    print("Resolving Director Site and Virtual Data Center....")
+    try:
+        ctx = context.resolve_context(args.ibmcloud_api_key, args.ibmcloud_region,
+                                      args.director_site_name, args.vdc_name)
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
+        exit(1)
 
-    #--------------------------------------------------------------
-    # List Director Sites
-    #--------------------------------------------------------------
-
-    print("Getting Director Sites....")
-    director_sites = vcfass.list_director_sites(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['director_sites']
-
-    #--------------------------------------------------------------
-    # Extract director site id
-    #--------------------------------------------------------------
-
-    director_site_id = [d for d in director_sites if d.get('name') == args.director_site_name][0]['id']
-
-    #--------------------------------------------------------------
-    # List Virtual Data Centres
-    #--------------------------------------------------------------
-    print("Listing Virtual Data Centers")
-    vdcs = vcfass.list_vcfaas_vdcs(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['vdcs']
-
-    #--------------------------------------------------------------
-    # Get VDC based on vdc_name
-    #--------------------------------------------------------------
-
-    vdc =  [v for v in vdcs if v['director_site']['id'] == director_site_id][0]
-
-    #--------------------------------------------------------------
-    # Extract VMware Director URL and ORG 
-    #--------------------------------------------------------------
-
-    director_url = urlparse(vdc['director_site']['url']).scheme + "://" + urlparse(vdc['director_site']['url']).netloc
-    org_name = vdc['org_name']
+    director_url = ctx.director_url
+    org_name = ctx.org_name
 
     print("")
     print(f'Director URL : {director_url}')
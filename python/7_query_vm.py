@@ -6,6 +6,7 @@ import uuid
 
 import lib.iam as iam
 import lib.vcfaas as vcfass
+import lib.context as context
 import lib.cloud_director as cloud_director
 
 from urllib.parse import urlparse
@@ -23,6 +24,7 @@ def parse_arg() -> argparse.Namespace:
     parser.add_argument("-r", dest="ibmcloud_region", help="IBM Cloud Region", required=True)
     parser.add_argument("-s", dest="director_site_name", help="Cloud Director Site Name", required=True)
     parser.add_argument("-v", dest="vdc_name", help="Virtual Data Center Name", required=True)
+    parser.add_argument("-c", dest="concurrency", help="Query pages fetched in parallel", type=int, default=1)
 
     return parser.parse_args()
 
@@ -33,61 +35,23 @@ def main() -> int:
     args = parse_arg()
 
     #--------------------------------------------------------------
-    # Get Session Token
+    # Resolve Director Site, Virtual Data Center and ORG
     #--------------------------------------------------------------
 
-    print("Getting Access Token....")
-    # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
-        ibm_api_key=args.ibmcloud_api_key
-    )
-
-    #--------------------------------------------------------------
-    # List Director Sites
-    #--------------------------------------------------------------
-
-    print("Getting Director Sites....")
-    director_sites = vcfass.list_director_sites(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['director_sites']
-
-    #--------------------------------------------------------------
-    # Extract director site id
-    #--------------------------------------------------------------
-
-    director_site_id = [d for d in director_sites if d.get('name') == args.director_site_name][0]['id']
-
-    #--------------------------------------------------------------
-    # List Virtual Data Centres
-    #--------------------------------------------------------------
-    print("Listing Virtual Data Centers")
-    vdcs = vcfass.list_vcfaas_vdcs(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['vdcs']
-
-    #--------------------------------------------------------------
-    # Get VDC based on vdc_name
-    #--------------------------------------------------------------
-
-    vdc =  [v for v in vdcs if v['director_site']['id'] == director_site_id][0]
-
-    #--------------------------------------------------------------
-    # Extract VMware Director URL and ORG 
-    #--------------------------------------------------------------
-
-    director_url = urlparse(vdc['director_site']['url']).scheme + "://" + urlparse(vdc['director_site']['url']).netloc
-    org_name = vdc['org_name']
+    print("Resolving Director Site and Virtual Data Center....")
+    try:
+        ctx = context.resolve_context(args.ibmcloud_api_key, args.ibmcloud_region,
+                                      args.director_site_name, args.vdc_name)
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
+        exit(1)
 
     #--------------------------------------------------------------
     # Get VMWare Access Token
     #--------------------------------------------------------------
     print("Getting VMware Access Token....")
-    vmware_access_token = vcfass.get_vmware_access_token(
-                                ibm_iam_access_token = ibm_iam_access_token, 
-                                url = director_url,
-                                org = org_name)
+    vmware_access_token = context.get_vmware_session(args.ibmcloud_api_key, ctx).access_token
+    director_url = ctx.director_url
 
     #--------------------------------------------------------------
     # Query Virtual Machines
@@ -96,7 +60,8 @@ def main() -> int:
     filter = f'isVAppTemplate==false'
     query_vms =  cloud_director.query_vm(director_url = director_url, 
                                         vmware_access_token = vmware_access_token, 
-                                        filter = filter)
+                                        filter = filter,
+                                        concurrency = args.concurrency)
 
     print("")
     pretty_vms = json.dumps(query_vms, indent=4)
@@ -6,7 +6,9 @@ import uuid
 
 import lib.iam as iam
 import lib.vcfaas as vcfass
+import lib.context as context
 import lib.cloud_director as cloud_director
+import lib.api_tokens as api_tokens
 
 from urllib.parse import urlparse
 
@@ -33,74 +35,36 @@ def main() -> int:
     args = parse_arg()
 
     #--------------------------------------------------------------
-    # Get Session Token
+    # Resolve Director Site, Virtual Data Center and ORG
     #--------------------------------------------------------------
 
-    print("Getting Access Token....")
-    # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
-        ibm_api_key=args.ibmcloud_api_key
-    )
-
-    #--------------------------------------------------------------
-    # List Director Sites
-    #--------------------------------------------------------------
-
-    print("Getting Director Sites....")
-    director_sites = vcfass.list_director_sites(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['director_sites']
-
-    #--------------------------------------------------------------
-    # Extract director site id
-    #--------------------------------------------------------------
-
-    director_site_id = [d for d in director_sites if d.get('name') == args.director_site_name][0]['id']
-
-    #--------------------------------------------------------------
-    # List Virtual Data Centres
-    #--------------------------------------------------------------
-    print("Listing Virtual Data Centers")
-    vdcs = vcfass.list_vcfaas_vdcs(
-        ibm_iam_access_token=ibm_iam_access_token, 
-        region=args.ibmcloud_region
-    )['vdcs']
-
-    #--------------------------------------------------------------
-    # Get VDC based on vdc_name
-    #--------------------------------------------------------------
-
-    vdc =  [v for v in vdcs if v['director_site']['id'] == director_site_id][0]
-
-    #--------------------------------------------------------------
-    # Extract VMware Director URL and ORG 
-    #--------------------------------------------------------------
-
-    director_url = urlparse(vdc['director_site']['url']).scheme + "://" + urlparse(vdc['director_site']['url']).netloc
-    org_name = vdc['org_name']
+    print("Resolving Director Site and Virtual Data Center....")
+    try:
+        ctx = context.resolve_context(args.ibmcloud_api_key, args.ibmcloud_region,
+                                      args.director_site_name, args.vdc_name)
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
+        exit(1)
 
     #--------------------------------------------------------------
     # Get VMWare Access Token
     #--------------------------------------------------------------
     print("Getting VMware Access Token....")
-    vmware_access_token = vcfass.get_vmware_access_token(
-                                ibm_iam_access_token = ibm_iam_access_token, 
-                                url = director_url,
-                                org = org_name)
+    vmware_session = context.get_vmware_session(args.ibmcloud_api_key, ctx)
+    vmware_access_token = vmware_session.access_token
+    org_id = vmware_session.org_id
 
-    #--------------------------------------------------------------
-    # Get VMWare Access Token
-    #--------------------------------------------------------------
-    org_id = vcfass.get_org_id(ibm_iam_access_token, director_url, org_name)
+    # read after the session, which resolves a stale cached context again
+    director_url = ctx.director_url
+    org_name = ctx.org_name
 
     #--------------------------------------------------------------
     # Get VMWare Access Token
     #--------------------------------------------------------------
 
-    token_name = f'TOKEN-{uuid.uuid4()}'
     print("Getting VMware API Key....")
-    vmware_api_token = cloud_director.create_apitoken(director_url, vmware_access_token, org_name,  org_id, token_name)
+    vmware_api_token = api_tokens.get_apitoken(director_url, vmware_access_token, org_name, org_id,
+                                              vmware_session.user)
 
 
     print("")
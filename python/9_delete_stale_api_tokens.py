@@ -0,0 +1,70 @@
+import argparse
+import os
+
+import lib.context as context
+import lib.api_tokens as api_tokens
+
+
+def parse_arg() -> argparse.Namespace:
+    """Parse input arguments.
+
+    Returns:
+        argparse object with parsed arguments.
+    """
+
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__))
+    parser.add_argument("-k", dest="ibmcloud_api_key", help="IBM Cloud API Key", required=True)
+    parser.add_argument("-r", dest="ibmcloud_region", help="IBM Cloud Region", required=True)
+    parser.add_argument("-s", dest="director_site_name", help="Cloud Director Site Name", required=True)
+    parser.add_argument("-v", dest="vdc_name", help="Virtual Data Center Name", required=True)
+    parser.add_argument("--dry-run", action="store_true", help="List the stale API Tokens without revoking them")
+
+    return parser.parse_args()
+
+def main() -> int:
+
+    # parse input arguments
+    print("Processing args...")
+    args = parse_arg()
+
+    #--------------------------------------------------------------
+    # Resolve Director Site, Virtual Data Center and ORG
+    #--------------------------------------------------------------
+
+    print("Resolving Director Site and Virtual Data Center....")
+    try:
+        ctx = context.resolve_context(args.ibmcloud_api_key, args.ibmcloud_region,
+                                      args.director_site_name, args.vdc_name)
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
+        exit(1)
+
+    #--------------------------------------------------------------
+    # Get VMWare Access Token
+    #--------------------------------------------------------------
+    print("Getting VMware Access Token....")
+    vmware_session = context.get_vmware_session(args.ibmcloud_api_key, ctx)
+    vmware_access_token = vmware_session.access_token
+    org_id = vmware_session.org_id
+
+    # read after the session, which resolves a stale cached context again
+    director_url = ctx.director_url
+    org_name = ctx.org_name
+
+    #--------------------------------------------------------------
+    # Revoke stale API Tokens
+    #--------------------------------------------------------------
+
+    # only the tokens the local token store issued and replaced since, never
+    # the tokens of other machines or of existing Schematics workspaces
+    print("Revoking stale VMware API Keys....")
+    revoked = api_tokens.collect_stale_apitokens(director_url, vmware_access_token, org_name,
+                                                vmware_session.user, args.dry_run)
+
+    print("")
+    print(f'{"Would revoke" if args.dry_run else "Revoked"} {len(revoked)} API Tokens')
+    for name in revoked:
+        print(f'    - {name}')
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,259 @@
+"""End-to-end benchmark of the petclinic.py and catalog.py flows.
+
+Every run starts a fresh lib.fake_cloud server, runs the flow unmodified in
+a subprocess pointed at it and records:
+
+    - wall clock time of the run and of each phase (discovery, catalog,
+      schematics, fip), split on the section headers the flows print; the
+      phases of petclinic.py overlap, its own step times are in its output
+    - HTTP requests per endpoint and bytes in/out, as seen by the server
+    - peak RSS of the flow process
+
+Results are written as JSON so runs of two commits can be compared:
+
+    python benchmark.py -n 5 -o before.json
+    git checkout my-branch
+    python benchmark.py -n 5 -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+from lib.fake_cloud import FakeCloud, FakeCloudServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# phase name, line starting the phase; the first phase starts with the process
+FLOWS = {
+    "petclinic": ("petclinic.py", [("discovery", None),
+                                   ("catalog", "Manage Catalog"),
+                                   ("schematics", "Manage Schematics"),
+                                   ("fip", "Manage Public IP")]),
+    "catalog": ("catalog.py", [("discovery", None),
+                               ("catalog", "Manage Catalog")]),
+}
+
+
+def parse_arg() -> argparse.Namespace:
+    """Parse input arguments.
+
+    Returns:
+        argparse object with parsed arguments.
+    """
+
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__))
+
+    parser.add_argument("-f", dest="flows", default="petclinic,catalog",
+                        help=f"Comma separated flows to run, from {', '.join(FLOWS)}")
+    parser.add_argument("-n", dest="runs", type=int, default=3, help="Runs per flow")
+    parser.add_argument("-o", dest="output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of a baseline to compare with")
+    parser.add_argument("--orgs", type=int, default=1, help="Number of fake orgs")
+    parser.add_argument("--vms", type=int, default=100, help="Number of fake VMs per org")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Fake server latency jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 5xx responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--task-duration", type=float, default=0.5, help="Seconds a fake task runs")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the fake server")
+    parser.add_argument("--warm", action="store_true",
+                        help="Keep the token caches of the first run for the next ones")
+    parser.add_argument("-v", dest="verbose", action="store_true", help="Print the output of the flows")
+
+    return parser.parse_args()
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_flow(flow: str, cloud: FakeCloud, state_dir: str, verbose: bool = False) -> dict[str, Any]:
+    """Run one flow against a fake cloud and measure it.
+
+    Args:
+        flow: Name of the flow, a key of FLOWS.
+        cloud: Backend of the run, its stats are reset first.
+        state_dir: VMWARE_L4_STATE_DIR of the flow process.
+        verbose: Echo the output of the flow.
+
+    Returns:
+        Measurements of the run.
+    """
+    script, phases = FLOWS[flow]
+    org = cloud.orgs[0]
+    region = org.region
+
+    env = {**os.environ, **cloud.environ(), "VMWARE_L4_STATE_DIR": state_dir, "PYTHONUNBUFFERED": "1"}
+    command = [sys.executable, os.path.join(HERE, script),
+               "-k", "benchmark-api-key", "-r", region,
+               "-s", cloud.sites[region]["name"], "-v", org.vdc_name]
+
+    cloud.reset_stats()
+    started = time.perf_counter()
+    p = subprocess.Popen(command, cwd=HERE, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    marks = [(phases[0][0], started)]
+    starts = {line: name for name, line in phases[1:]}
+    output = []
+    for line in p.stdout:
+        if verbose:
+            print(f"    {flow}| {line}", end="")
+        output.append(line)
+        name = starts.pop(line.strip(), None)
+        if name is not None:
+            marks.append((name, time.perf_counter()))
+
+    # wait4 gives the rusage of this child alone
+    _, status, rusage = os.wait4(p.pid, 0)
+    finished = time.perf_counter()
+    p.returncode = os.waitstatus_to_exitcode(status)
+    p.stdout.close()
+
+    marks.append((None, finished))
+    stats = cloud.stats()
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak_rss_kib = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+
+    result = {
+        "flow": flow,
+        "returncode": p.returncode,
+        "wall": finished - started,
+        "phases": {name: end - start for (name, start), (_, end) in zip(marks, marks[1:])},
+        "requests": stats["requests"],
+        "total_requests": stats["total_requests"],
+        "bytes_in": stats["bytes_in"],
+        "bytes_out": stats["bytes_out"],
+        "peak_rss_kib": peak_rss_kib,
+    }
+    if p.returncode != 0:
+        result["output"] = "".join(output[-20:])
+
+    return result
+
+
+def summarize(runs: list[dict[str, Any]]) -> dict[str, Any]:
+    """Median of each measurement over the runs of one flow."""
+    phases = dict.fromkeys(name for r in runs for name in r["phases"])
+    endpoints = {name for r in runs for name in r["requests"]}
+
+    return {
+        "runs": len(runs),
+        "failed": sum(1 for r in runs if r["returncode"] != 0),
+        "wall": statistics.median(r["wall"] for r in runs),
+        "phases": {p: statistics.median(r["phases"].get(p, 0.0) for r in runs) for p in phases},
+        "requests": {e: statistics.median(r["requests"].get(e, 0) for r in runs) for e in sorted(endpoints)},
+        "total_requests": statistics.median(r["total_requests"] for r in runs),
+        "bytes_in": statistics.median(r["bytes_in"] for r in runs),
+        "bytes_out": statistics.median(r["bytes_out"] for r in runs),
+        "peak_rss_kib": statistics.median(r["peak_rss_kib"] for r in runs),
+    }
+
+
+def _rows(summary: dict[str, Any]) -> dict[str, float]:
+    rows = {"wall (s)": summary["wall"]}
+    rows.update({f"  {p} (s)": v for p, v in summary["phases"].items()})
+    rows["requests"] = summary["total_requests"]
+    rows.update({f"  {e}": v for e, v in summary["requests"].items()})
+    rows["bytes in"] = summary["bytes_in"]
+    rows["bytes out"] = summary["bytes_out"]
+    rows["peak RSS (KiB)"] = summary["peak_rss_kib"]
+    return rows
+
+
+def report(results: dict[str, Any], baseline: Optional[dict[str, Any]] = None) -> None:
+    """Print the summary of each flow, next to the baseline when given."""
+    for flow, summary in results["summary"].items():
+        print("")
+        print(f'{flow} ({summary["runs"]} runs, {summary["failed"]} failed, commit {results["commit"]})')
+        print("-" * 96)
+
+        rows = _rows(summary)
+        base = _rows(baseline["summary"][flow]) if baseline and flow in baseline["summary"] else None
+
+        if base is None:
+            for name, value in rows.items():
+                print(f"{name:<64} {value:>12.3f}")
+            continue
+
+        print(f'{"":<48} {baseline["commit"] or "baseline":>14} {results["commit"] or "current":>14} {"change":>14}')
+        for name in list(base) + [n for n in rows if n not in base]:
+            old, new = base.get(name, 0), rows.get(name, 0)
+            change = f"{(new - old) / old:+.1%}" if old else ""
+            print(f"{name:<48} {old:>14.3f} {new:>14.3f} {change:>14}")
+
+
+def main() -> int:
+
+    # parse input arguments
+    args = parse_arg()
+
+    flows = args.flows.split(",")
+    for flow in flows:
+        if flow not in FLOWS:
+            print(f"Error: unknown flow {flow}")
+            return 1
+
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "verbose")},
+        "runs": [],
+        "summary": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="vmware-l4-bench-") as tmp:
+        for flow in flows:
+            print(f"Running {flow} {args.runs} times")
+            # warm runs keep the URLs cached by the first run valid
+            port = 0
+            for i in range(args.runs):
+                cloud = FakeCloud(orgs=args.orgs, vms=args.vms, seed=args.seed, latency=args.latency,
+                                  jitter=args.jitter, error_rate=args.error_rate,
+                                  throttle_rate=args.throttle_rate, task_duration=args.task_duration)
+                state_dir = os.path.join(tmp, flow if args.warm else f"{flow}-{i}")
+
+                with FakeCloudServer(cloud, port=port) as server:
+                    if args.warm:
+                        port = urlparse(server.url).port
+                    result = run_flow(flow, cloud, state_dir, args.verbose)
+
+                print(f'    run {i + 1}: {result["wall"]:.3f}s, {result["total_requests"]} requests, '
+                      f'exit code {result["returncode"]}')
+                if result["returncode"] != 0:
+                    print(result["output"])
+                results["runs"].append(result)
+
+            results["summary"][flow] = summarize([r for r in results["runs"] if r["flow"] == flow])
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("")
+        print(f"Results written to {args.output}")
+
+    return 1 if any(r["returncode"] != 0 for r in results["runs"]) else 0
+
+
+if __name__ == "__main__":
+    exit(main())
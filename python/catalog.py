@@ -8,6 +8,8 @@ import lib.iam as iam
 import lib.vcfaas as vcfass
 import lib.cloud_director as cloud_director
 import lib.schematics as schematics
+import lib.context as context
+import lib.ovf_upload as ovf_upload
 
 from urllib.parse import urlparse
 from types import SimpleNamespace
@@ -39,6 +41,8 @@ def parse_arg() -> argparse.Namespace:
     parser.add_argument("-r", dest="ibmcloud_region", help="IBM Cloud Region", required=True)
     parser.add_argument("-s", dest="director_site_name", help="VCFaaS Site Name", required=True)
     parser.add_argument("-v", dest="vdc_name", help="Virtual Data Center Name", required=True)
+    parser.add_argument("-l", dest="local_dir",
+                        help="Directory of local <item>.ova or <item>.ovf packages to push instead of the public OVFs")
 
 
     return parser.parse_args()
@@ -54,37 +58,31 @@ def main() -> int:
 
     print("Processing args...")
     # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
+    ibm_iam_access_token = iam.get_ibm_iam_access_token(
         ibm_api_key=args.ibmcloud_api_key
     )
 
-    # Get director site
+    # Resolve the director site, VDC and org, from the context cache when warm
     print(f'Retrieving Director Site - {args.director_site_name} in region {args.ibmcloud_region}')
-    director_sites = vcfass.list_director_sites(
-        ibm_iam_access_token=ibm_iam_access_token, region=args.ibmcloud_region
-    )['director_sites']
-
-    site_names = [d["name"] for d in director_sites]
-    if args.director_site_name not in site_names:
-        print(f'Error: Site not found : {args.director_site_name}')
+    print(f'Retrieving VDC- {args.vdc_name}')
+    try:
+        ctx = context.resolve_context(args.ibmcloud_api_key, args.ibmcloud_region,
+                                      args.director_site_name, args.vdc_name)
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
         exit(1)
 
-    director_site = [d for d in director_sites if d.get('name') == args.director_site_name][0]
-
-    # Get Director URL for the Site
-    # Note: We assume we have at least 1 VDC which is always the case for multi-tenant sites
+    # Get VMware session, one POST gives both the access token and the Org Id.
+    # A stale cached context is resolved again, read it afterwards.
+    vmware_session = context.get_vmware_session(args.ibmcloud_api_key, ctx)
+    org_id = vmware_session.org_id
 
-    print(f'Retrieving VDC- {args.vdc_name}')
-    vdcs = vcfass.list_vcfaas_vdcs(region = args.ibmcloud_region,ibm_iam_access_token=ibm_iam_access_token)['vdcs']
-    vdc =  [v for v in vdcs if v['director_site']['id'] == director_site["id"] and v['name'] == args.vdc_name][0]
-    director_url = urlparse(vdc['director_site']['url']).scheme + "://" + urlparse(vdc['director_site']['url']).netloc
-    org = vdc['org_name']
+    vdc = ctx.vdc
+    director_url = ctx.director_url
+    org = ctx.org_name
     print(f'ORG = {org}')
     print(f'Director_URL = {director_url}')
 
-    # Get Org Id
-    org_id = vcfass.get_org_id(ibm_iam_access_token, director_url, org)
-
     # Get Resource Group ID
     
 
@@ -103,9 +101,9 @@ def main() -> int:
     env.director_vdc = vdc["name"]
     env.director_org_name = vdc["org_name"]
     env.org_id = org_id
-    env.director_site_id = vdc["director_site"]["id"]
+    env.director_site_id = ctx.site_id
     env.ibmcloud_api_key = args.ibmcloud_api_key
-    env.resource_group_id = vdc['resource_group']['id']
+    env.resource_group_id = ctx.resource_group_id
 
     print('-----------------------------------------------')
     print(f'ibmcloud_region: {env.ibmcloud_region}')
@@ -122,10 +120,7 @@ def main() -> int:
     
     # Get VMWare Access Token
     print(f'Retrieving VMware Access Token')
-    vmware_access_token = vcfass.get_vmware_access_token(
-                                ibm_iam_access_token = ibm_iam_access_token, 
-                                url = env.director_url,
-                                org = env.director_org_name)
+    vmware_access_token = vmware_session.access_token
 
     # Check Catalog
     print('')
@@ -170,7 +165,6 @@ def main() -> int:
 
     if action_create_catalog:
 
-        tasks = []
         print(f'Creating Catalog: {lab_catalog}')
         try:
             catalog = cloud_director.create_catalog(director_url = env.director_url,
@@ -178,33 +172,65 @@ def main() -> int:
                                                     org_id = org_id,
                                                     catalog_name = lab_catalog)
 
-            tasks.append(catalog['tasks']['task'][0]["href"])
-
         except Exception as e:
             print((f'Failed to create Catalog: {lab_catalog}'))
             print(e)
+            exit(1)
 
         print('Waiting for tasks.....')
         cloud_director.wait_for_tasks(
                 vmware_access_token=vmware_access_token,
-                tasks=tasks)
-        
-    if len(missing_catalog_items) > 0:
+                tasks=[catalog['tasks']['task'][0]["href"]])
         
-        print(f'Uploading {len(missing_catalog_items)} Catalog Items')
+    if len(missing_catalog_items) > 0 and args.local_dir:
+
+        print(f'Pushing {len(missing_catalog_items)} Catalog Items from {args.local_dir}')
         for catalog_item in missing_catalog_items:
-                
-            try:
-                print(f'    Uploading {catalog_item}: {lab_catalog_items[catalog_item]}')
-                catalog_item = cloud_director.upload_ovf(director_url = env.director_url,
-                                                        vmware_access_token = vmware_access_token,
-                                                        catalog_id = catalog['id'].split(':')[-1],
-                                                        ovf_url = lab_catalog_items[catalog_item],
-                                                        item_name = catalog_item)
+            paths = [os.path.join(args.local_dir, f'{catalog_item}{ext}') for ext in ('.ova', '.ovf')]
+            path = next((p for p in paths if os.path.exists(p)), None)
+            if path is None:
+                print(f'Error: no {catalog_item}.ova or {catalog_item}.ovf in {args.local_dir}')
+                exit(1)
 
+            print(f'    Pushing {catalog_item}: {path}')
+            try:
+                upload = ovf_upload.push_ovf(vmware_access_token = vmware_access_token,
+                                             catalog_href = catalog['href'],
+                                             path = path,
+                                             item_name = catalog_item)
             except Exception as e:
-                print((f'Failed to Upload Catalog Item: {catalog_item}'))
+                print((f'Failed to Push Catalog Item: {catalog_item}, run again to resume'))
                 print(e)
+                exit(1)
+
+            print(f'    {catalog_item}: {upload["bytes"] / 2**20:.1f} MiB in {upload["seconds"]:.1f}s, '
+                  f'{upload["throughput"] / 2**20:.1f} MiB/s, imported in {upload["import_seconds"]:.1f}s')
+
+    elif len(missing_catalog_items) > 0:
+        
+        print(f'Uploading {len(missing_catalog_items)} Catalog Items')
+        for catalog_item in missing_catalog_items:
+            print(f'    Uploading {catalog_item}: {lab_catalog_items[catalog_item]}')
+
+        print('Waiting for imports.....')
+
+        # all items are uploaded at once, the catalog is ready when the slowest import is
+        try:
+            imports = cloud_director.import_catalog_items(director_url = env.director_url,
+                                                          vmware_access_token = vmware_access_token,
+                                                          catalog_id = catalog['id'].split(':')[-1],
+                                                          items = {i: lab_catalog_items[i] for i in missing_catalog_items})
+        except cloud_director.CatalogImportError as e:
+            imports = e.results
+
+        for catalog_item, result in imports.items():
+            print(f'    {catalog_item}: {result["status"]} in {result["duration"]:.1f}s')
+            if result["error"]:
+                print(f'        {result["error"]}')
+
+        if any(result["status"] != "success" for result in imports.values()):
+            print((f'Failed to Upload Catalog Items'))
+            exit(1)
 
     else:
             print('Catalog Items up to date, nothing to do!!!')
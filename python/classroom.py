@@ -0,0 +1,358 @@
+"""Provision the PetClinic lab of every student of a class.
+
+The roster is a CSV file with a header line, or a JSON list of objects,
+with one lab per row:
+
+    name,ibmcloud_api_key,ibmcloud_region,director_site_name,vdc_name
+    alice,<api key>,eu-de,my-site-eu-de,vdc-alice
+
+name is optional and labels the lab in the report, it defaults to the
+VDC name. The labs are provisioned concurrently in this process, so the
+IAM tokens, the director site and VDC lists, the VMware sessions and the
+HTTP connections are shared by the labs of the same account, region and
+director instead of being fetched once per lab. Students of one org keep
+their own VMware session and API token, and fill the org catalog once.
+
+At most -n labs run at once, at most --per-director on the same director
+and at most --per-account with the same API key, so a cohort does not
+overload one director or hit the rate limits of one account. The
+director of each lab is resolved first, so sites of different accounts
+that share a name are capped apart. A lab is only handed to a worker
+once its slots are free, labs of other accounts and directors further in
+the roster run meanwhile. The labs of an API key and region share the
+name of their Schematics workspace, keep --per-account at 1 when the
+roster has such labs.
+
+The output of each lab is written to <logs>/<name>.log, with the
+characters of the name unsafe in a file name replaced, and the report
+gives the result and latency of each lab and of the class:
+
+    python classroom.py roster.csv -n 16 --logs logs -o report.json
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import statistics
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional
+
+import lib.context as context
+import lib.dag as dag
+import petclinic
+
+ROSTER_FIELDS = ("ibmcloud_api_key", "ibmcloud_region", "director_site_name", "vdc_name")
+
+
+def positive_int(value: str) -> int:
+    """argparse type of the number of labs at once, at least 1."""
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f"{value} is less than 1")
+    return n
+
+
+def parse_arg() -> argparse.Namespace:
+    """Parse input arguments.
+
+    Returns:
+        argparse object with parsed arguments.
+    """
+
+    parser = argparse.ArgumentParser(prog=os.path.basename(__file__))
+
+    parser.add_argument("roster", help="CSV or JSON roster of the labs")
+    parser.add_argument("-n", dest="max_labs", type=positive_int, default=16, help="Labs provisioned at once")
+    parser.add_argument("--per-director", type=positive_int, default=8, help="Labs provisioned at once on a director")
+    parser.add_argument("--per-account", type=positive_int, default=1, help="Labs provisioned at once with an API key")
+    parser.add_argument("--logs", help="Directory to write the output of each lab to")
+    parser.add_argument("-o", dest="output", help="Write the report as JSON to this file")
+
+    return parser.parse_args()
+
+
+def load_roster(path: str) -> list[dict[str, str]]:
+    """Read the labs of a roster file.
+
+    Args:
+        path: CSV file with a header line, or JSON file with a list of objects.
+
+    Returns:
+        The labs, each with a name, the name of its log file and the ROSTER_FIELDS.
+
+    Raises:
+        ValueError: a lab misses a field or two labs have the same name.
+    """
+    with open(path, newline="") as f:
+        if path.endswith(".json"):
+            rows = json.load(f)
+        else:
+            rows = list(csv.DictReader(f))
+
+    labs = []
+    names = set()
+    for i, row in enumerate(rows, 1):
+        missing = [field for field in ROSTER_FIELDS if not row.get(field)]
+        if missing:
+            raise ValueError(f"Lab {i} of {path} misses {', '.join(missing)}")
+
+        lab = {field: row[field].strip() for field in ROSTER_FIELDS}
+        lab["name"] = (row.get("name") or lab["vdc_name"]).strip()
+        # names are free text, e.g. "Jane Doe/Group 1", and never leave the log directory
+        lab["log"] = re.sub(r"[^\w.-]+", "_", lab["name"]).lstrip(".") or f"lab-{i}"
+        if lab["log"] in names:
+            raise ValueError(f"Lab {i} of {path}: the name {lab['name']} is taken")
+        names.add(lab["log"])
+        labs.append(lab)
+
+    return labs
+
+
+class Limits:
+    """Counts of the labs running on a director and with an API key, against their caps.
+
+    Only used by the dispatching thread, see run_labs().
+
+    Args:
+        per_director: Labs at once on a director.
+        per_account: Labs at once with an API key.
+
+    Raises:
+        ValueError: a cap is less than 1, no lab could ever start.
+    """
+
+    def __init__(self, per_director: int, per_account: int) -> None:
+        if per_director < 1 or per_account < 1:
+            raise ValueError(f"Caps must be at least 1, not {per_director} per director and {per_account} per account")
+        self.per_director = per_director
+        self.per_account = per_account
+        self._running: dict[tuple[str, str], int] = {}
+
+    @staticmethod
+    def _keys(lab: dict[str, str]) -> list[tuple[str, str]]:
+        # the director resolved for the lab, not the site name its account gave it
+        return [("account", lab["ibmcloud_api_key"]), ("director", lab["director_url"])]
+
+    def free(self, lab: dict[str, str]) -> bool:
+        """Whether the lab can start without exceeding a cap."""
+        caps = (self.per_account, self.per_director)
+        return all(self._running.get(key, 0) < cap for key, cap in zip(self._keys(lab), caps))
+
+    def take(self, lab: dict[str, str]) -> None:
+        for key in self._keys(lab):
+            self._running[key] = self._running.get(key, 0) + 1
+
+    def release(self, lab: dict[str, str]) -> None:
+        for key in self._keys(lab):
+            self._running[key] -= 1
+
+
+def _result(lab: dict[str, str], queued: float) -> dict[str, Any]:
+    return {"name": lab["name"], "region": lab["ibmcloud_region"], "site": lab["director_site_name"],
+            "vdc": lab["vdc_name"], "status": "ok", "error": None, "queued": queued, "time": 0.0}
+
+
+def _write_log(lab: dict[str, str], logs: Optional[str], output: str) -> None:
+    if logs:
+        with open(os.path.join(logs, f'{lab["log"]}.log'), "w") as f:
+            f.write(output)
+
+
+def resolve(lab: dict[str, str]) -> str:
+    """Resolve the director of a lab, the lists fetched are shared with its provisioning.
+
+    Raises:
+        lib.context.ContextNotFound: no site or VDC of that name in the region.
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+    ctx = context.resolve_context(lab["ibmcloud_api_key"], lab["ibmcloud_region"],
+                                  lab["director_site_name"], lab["vdc_name"])
+    return ctx.director_url
+
+
+def provision(lab: dict[str, str], queued: float, logs: Optional[str] = None) -> dict[str, Any]:
+    """Provision one lab.
+
+    Args:
+        lab: Lab of the roster.
+        queued: Seconds the lab waited for its slots.
+        logs: Directory to write the output of the lab to.
+
+    Returns:
+        Result of the lab, with its status, error, seconds queued and
+        seconds provisioning.
+    """
+    started = time.perf_counter()
+    output = io.StringIO()
+    result = _result(lab, queued)
+    try:
+        with dag.capture_output(output):
+            steps = petclinic.provision_lab(lab["ibmcloud_api_key"], lab["ibmcloud_region"],
+                                            lab["director_site_name"], lab["vdc_name"])
+        result["steps"] = {s.name: s.duration for s in steps.steps.values()}
+    except dag.DagError as e:
+        result.update(status="failed", error=str(e))
+        output.write(f"Error: {e}\n{e.dag.summary()}\n")
+    except Exception as e:
+        # one broken lab does not stop the class
+        result.update(status="failed", error=str(e) or repr(e))
+        output.write(f"Error: {e!r}\n")
+    result["time"] = time.perf_counter() - started
+
+    _write_log(lab, logs, output.getvalue())
+    return result
+
+
+def run_labs(labs: list[dict[str, str]], limits: Limits, max_labs: int, logs: Optional[str] = None,
+             on_result: Optional[Callable[[dict[str, Any]], None]] = None) -> list[dict[str, Any]]:
+    """Resolve the director of every lab, then provision the labs within the limits.
+
+    The labs wait for their slots here, not in the workers: each time a lab
+    finishes, the first labs of the roster whose account and director have
+    a free slot are handed to the pool, so a roster sorted by account does
+    not leave the workers idle behind the labs of one account.
+
+    Args:
+        labs: Labs of the roster.
+        limits: Caps per director and per API key.
+        max_labs: Labs provisioned at once.
+        logs: Directory to write the output of each lab to.
+        on_result: Called with the result of each lab as it finishes.
+
+    Returns:
+        Result of each lab, in roster order.
+
+    Raises:
+        ValueError: max_labs is less than 1.
+    """
+    if max_labs < 1:
+        raise ValueError(f"max_labs must be at least 1, not {max_labs}")
+
+    results: dict[int, dict[str, Any]] = {}
+
+    def finish(i: int, result: dict[str, Any]) -> None:
+        results[i] = result
+        if on_result is not None:
+            on_result(result)
+
+    def fail(i: int, error: str, queued: float = 0.0) -> None:
+        result = _result(labs[i], queued)
+        result.update(status="failed", error=error)
+        _write_log(labs[i], logs, f"Error: {error}\n")
+        finish(i, result)
+
+    started = time.perf_counter()
+    waiting = []
+    with ThreadPoolExecutor(max_workers=max_labs) as executor:
+        # resolving is cheap, the site and VDC lists are fetched once per account and region
+        resolving = {executor.submit(resolve, lab): i for i, lab in enumerate(labs)}
+        for future, i in resolving.items():
+            try:
+                labs[i]["director_url"] = future.result()
+                waiting.append(i)
+            except Exception as e:
+                fail(i, str(e) or repr(e))
+
+        running: dict[Future, int] = {}
+        while waiting or running:
+            for i in list(waiting):
+                if len(running) < max_labs and limits.free(labs[i]):
+                    limits.take(labs[i])
+                    waiting.remove(i)
+                    running[executor.submit(provision, labs[i], time.perf_counter() - started, logs)] = i
+
+            if not running:
+                # no lab finishes to free a slot, the waiting ones would never start
+                for i in waiting:
+                    fail(i, "No slot within the limits", time.perf_counter() - started)
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                limits.release(labs[i])
+                finish(i, future.result())
+
+    return [results[i] for i in range(len(labs))]
+
+
+def summarize(results: list[dict[str, Any]], wall: float) -> dict[str, Any]:
+    """Aggregate success and latency of the labs."""
+    times = sorted(r["time"] for r in results)
+    ok = sum(1 for r in results if r["status"] == "ok")
+
+    return {
+        "labs": len(results),
+        "ok": ok,
+        "failed": len(results) - ok,
+        "wall": wall,
+        "labs_per_minute": len(results) / wall * 60 if wall else 0.0,
+        "time_p50": statistics.median(times) if times else 0.0,
+        "time_p90": times[int(0.9 * (len(times) - 1))] if times else 0.0,
+        "time_max": times[-1] if times else 0.0,
+        "queued_max": max((r["queued"] for r in results), default=0.0),
+    }
+
+
+def report(results: list[dict[str, Any]], summary: dict[str, Any]) -> None:
+    """Print the result of each lab and the class summary."""
+    print("")
+    print(f'{"lab":<24} {"region":<10} {"site":<24} {"status":<7} {"queued (s)":>10} {"time (s)":>9}')
+    print("-" * 96)
+    for r in results:
+        print(f'{r["name"]:<24} {r["region"]:<10} {r["site"]:<24} {r["status"]:<7} {r["queued"]:>10.3f} {r["time"]:>9.3f}')
+        if r["error"]:
+            print(f'    Error: {r["error"]}')
+
+    print("-" * 96)
+    print(f'{summary["ok"]} of {summary["labs"]} labs provisioned, {summary["failed"]} failed, '
+          f'in {summary["wall"]:.1f}s ({summary["labs_per_minute"]:.1f} labs/min)')
+    print(f'lab time p50 {summary["time_p50"]:.1f}s, p90 {summary["time_p90"]:.1f}s, '
+          f'max {summary["time_max"]:.1f}s, longest queued {summary["queued_max"]:.1f}s')
+
+
+def main() -> int:
+
+    # parse input arguments
+    args = parse_arg()
+
+    try:
+        labs = load_roster(args.roster)
+    except (OSError, ValueError) as e:
+        print(f'Error: {e}')
+        exit(1)
+
+    if args.logs:
+        os.makedirs(args.logs, exist_ok=True)
+
+    print(f'Provisioning {len(labs)} labs, {args.max_labs} at once, {args.per_director} per director, '
+          f'{args.per_account} per API key')
+    limits = Limits(args.per_director, args.per_account)
+
+    finished = []
+
+    def progress(result: dict[str, Any]) -> None:
+        finished.append(result)
+        print(f'[{len(finished)}/{len(labs)}] {result["name"]}: {result["status"]} in {result["time"]:.1f}s')
+
+    started = time.perf_counter()
+    results = run_labs(labs, limits, args.max_labs, args.logs, progress)
+
+    summary = summarize(results, time.perf_counter() - started)
+    report(results, summary)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "labs": results}, f, indent=2)
+
+    if summary["failed"]:
+        exit(1)
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,11 @@
+"""asyncio variants of the lib API.
+
+The modules mirror lib.iam, lib.vcfaas, lib.cloud_director and
+lib.schematics function for function, e.g.,
+
+    from lib.aio import cloud_director
+    vms = await cloud_director.query_vm(director_url, token, filter)
+
+All calls share one aiohttp connection pool per event loop, see lib.aio.client.
+The package needs aiohttp (pip install aiohttp), the synchronous lib does not.
+"""
@@ -0,0 +1,236 @@
+"""Shared asyncio HTTP transport for the lib.aio modules.
+
+Every coroutine in lib.aio goes through request(), which runs on a single
+aiohttp ClientSession per event loop. The session owns one connection pool
+(keep-alive, bounded per host), so thousands of concurrent director calls
+share a handful of TCP/TLS connections instead of an OS thread each.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import weakref
+from typing import Any, Mapping
+from urllib.parse import urlparse
+
+import aiohttp
+from multidict import CIMultiDict
+
+from lib import circuit, coalesce, http_cache, metrics, retry
+from lib.throttle import ThrottleTimeout, throttle
+
+log = logging.getLogger(__name__)
+
+# Connection pool defaults, overridable with configure_pool() or the environment.
+DEFAULT_LIMIT = int(os.environ.get("VMWARE_L4_AIO_LIMIT", 256))
+DEFAULT_LIMIT_PER_HOST = int(os.environ.get("VMWARE_L4_AIO_LIMIT_PER_HOST", 64))
+DEFAULT_TIMEOUT = 180
+
+_pool_config = {"limit": DEFAULT_LIMIT, "limit_per_host": DEFAULT_LIMIT_PER_HOST}
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = \
+    weakref.WeakKeyDictionary()
+
+
+class CircuitOpenError(circuit.CircuitOpenError, aiohttp.ClientConnectionError):
+    """The circuit breaker of the target host and API family is open."""
+
+
+class ThrottleTimeoutError(ThrottleTimeout, aiohttp.ClientConnectionError):
+    """No request slot to the target host freed up before the deadline, nothing was sent."""
+
+
+class Response:
+    """A fully read HTTP response.
+
+    The body is read before the connection is handed back to the pool,
+    so callers never have to manage aiohttp response context managers.
+    """
+
+    def __init__(self, status: int, headers: Mapping[str, str], body: bytes, url: str) -> None:
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.url = url
+        self._json: Any = None
+
+    def json(self) -> Any:
+        if self._json is None:
+            self._json = json.loads(self.body)
+        return self._json
+
+
+def configure_pool(limit: int | None = None, limit_per_host: int | None = None) -> None:
+    """Configure the connection pool of sessions created from now on.
+
+    Args:
+        limit: Maximum number of open connections.
+        limit_per_host: Maximum number of open connections to a single host.
+    """
+    if limit is not None:
+        _pool_config["limit"] = limit
+    if limit_per_host is not None:
+        _pool_config["limit_per_host"] = limit_per_host
+
+
+def aio_session() -> aiohttp.ClientSession:
+    """The shared ClientSession of the running event loop.
+
+    Returns:
+        aiohttp ClientSession object.
+    """
+    loop = asyncio.get_running_loop()
+    s = _sessions.get(loop)
+
+    if s is None or s.closed:
+        connector = aiohttp.TCPConnector(limit=_pool_config["limit"],
+                                         limit_per_host=_pool_config["limit_per_host"])
+        s = aiohttp.ClientSession(connector=connector,
+                                  timeout=aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT),
+                                  cookie_jar=aiohttp.DummyCookieJar())
+        _sessions[loop] = s
+
+    return s
+
+
+async def close_session() -> None:
+    """Close the shared ClientSession of the running event loop."""
+    s = _sessions.pop(asyncio.get_running_loop(), None)
+    if s is not None:
+        await s.close()
+
+
+async def request(method: str, url: str, **kwargs: Any) -> Response:
+    """Send a request on the shared session and raise on HTTP errors.
+
+    Failed attempts are retried following the lib.retry policy of the
+    calling context, every attempt waits for the limits of lib.throttle.
+    While the lib.circuit breaker of the target is open, CircuitOpenError
+    is raised without sending anything. Identical concurrent GETs share
+    one request, see lib.coalesce, and GETs of cache_responses functions
+    are revalidated, see lib.http_cache.
+
+    Args:
+        method: HTTP method.
+        url: Endpoint URL.
+        kwargs: Passed to aiohttp.ClientSession.request, e.g., headers, params,
+            data or json.
+
+    Returns:
+        The read Response.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+    key = None
+    if "data" not in kwargs and "json" not in kwargs:
+        key = coalesce.request_key(method, url, kwargs.get("headers"), kwargs.get("params"))
+    if key is None:
+        return await _cached_request(method, url, **kwargs)
+
+    response, shared = await coalesce.async_single_flight().do(key, lambda: _cached_request(method, url, **kwargs))
+    if shared:
+        # each caller gets its own parsed JSON
+        response = Response(response.status, response.headers, response.body, response.url)
+    return response
+
+
+async def _cached_request(method: str, url: str, **kwargs: Any) -> Response:
+    key = http_cache.cache_key(method, url, kwargs.get("headers"), kwargs.get("params"))
+    if key is None:
+        return await _request(method, url, **kwargs)
+
+    cache = http_cache.response_cache()
+    entry = cache.get(key)
+    if entry is not None:
+        kwargs = {**kwargs, "headers": {**kwargs.get("headers", {}), **entry.validators}}
+    response = await _request(method, url, **kwargs)
+
+    cache.record(entry is not None and response.status == 304)
+    if entry is not None and response.status == 304:
+        entry.refresh(response.headers)
+        return Response(entry.status, CIMultiDict(entry.headers), entry.body, entry.url)
+
+    if http_cache.cacheable(response.status, response.headers):
+        cache.put(key, http_cache.CachedResponse(response.status, response.headers, response.body, response.url))
+    elif entry is not None:
+        cache.discard(key)
+    return response
+
+
+async def _request(method: str, url: str, **kwargs: Any) -> Response:
+    s = aio_session()
+
+    operation = metrics.current_operation() or f"{method} {urlparse(url).netloc}"
+    registry = metrics.registry()
+
+    # Same retry behaviour as lib.requests_session.TimeoutHTTPAdapter
+    policy = retry.current_policy()
+    budget = retry.budget()
+    deadline = time.monotonic() + policy.deadline
+    delay = policy.base
+    budget.record_request()
+    host_throttle = throttle(urlparse(url).netloc)
+    host_breaker = circuit.breaker(url)
+
+    attempt = 0
+    status: int | str = "error"
+    size = None
+    registry.start(operation)
+    start = time.perf_counter()
+    try:
+        while True:
+            if "timeout" not in kwargs:
+                connect, read = policy.timeout(deadline - time.monotonic())
+                attempt_kwargs = {**kwargs, "timeout": aiohttp.ClientTimeout(total=deadline - time.monotonic(),
+                                                                             connect=connect, sock_read=read)}
+            else:
+                attempt_kwargs = kwargs
+
+            if not host_breaker.allow():
+                raise CircuitOpenError(f"Circuit breaker {host_breaker.name} is open")
+
+            error = wait = None
+            try:
+                success = None
+                async with host_throttle.async_slot(deadline - time.monotonic()) as slot:
+                    success = False
+                    async with s.request(method, url, **attempt_kwargs) as r:
+                        body = await r.read()
+                    slot.status = r.status
+                    success = not circuit.is_failure(r.status)
+                response = Response(r.status, r.headers, body, str(r.url))
+                wait = retry.retry_after(r.headers)
+                if (not policy.retry_status(method, r.status, r.headers)
+                        or (wait is not None and wait > policy.max_retry_after)):
+                    status, size = r.status, len(body)
+                    r.raise_for_status()
+                    return response
+            except ThrottleTimeout as e:
+                # never sent, retried like a connect timeout of the sync transport
+                error = ThrottleTimeoutError(str(e))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if not policy.retry_error(method, not isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                error = e
+            finally:
+                host_breaker.record(success)
+
+            delay = policy.backoff(delay)
+            if wait is not None:
+                delay = max(delay, wait)
+
+            if attempt >= policy.total or time.monotonic() + delay >= deadline or not budget.try_retry():
+                if error is not None:
+                    raise error
+                status, size = response.status, len(response.body)
+                r.raise_for_status()
+                return response
+
+            attempt = attempt + 1
+            log.debug(f"Retrying {method} {url} in {delay:.2f}s (attempt {attempt}, {error or response.status})")
+            await asyncio.sleep(delay)
+    finally:
+        registry.finish(operation, method, status, time.perf_counter() - start, size, attempt)
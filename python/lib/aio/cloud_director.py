@@ -0,0 +1,548 @@
+"""asyncio variant of lib.cloud_director.
+
+Task waiting runs as one coroutine polling the query service for all the
+tasks at once, see lib.aio.tasks, so a single loop can follow thousands of
+tasks with a few requests per round.
+"""
+
+import logging
+from typing import Any, Callable, Optional
+
+from lib.aio.client import request
+from lib.aio.pagination import paginate
+from lib.aio.tasks import AsyncTaskTracker
+from lib.cloud_director import _catalog_body, _catalog_item_body, _upload_ovf_body, pageSize
+from lib.http_cache import cache_responses
+from lib.metrics import operation
+from lib.pagination import CLOUDAPI, LEGACY_QUERY, PageFormat
+from lib.tasks import TaskError
+
+log = logging.getLogger(__name__)
+
+
+@operation
+async def wait_for_task(vmware_access_token: str, task: str, timeout: Optional[float] = None) -> bool:
+    """Wait for a single task to complete
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        task: a task href
+        timeout: Seconds the task must complete in, None waits forever.
+
+    Returns:
+        True when the task has a status of success
+
+    Raises:
+        TaskError: the task finished with error, was aborted or timed out.
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    return await wait_for_tasks(vmware_access_token, [task], timeout)
+
+
+@operation
+async def wait_for_tasks(vmware_access_token: str, tasks: list, timeout: Optional[float] = None,
+                         on_progress: Optional[Callable[[str, str, dict[str, Any]], None]] = None) -> bool:
+    """Wait for a list of tasks
+
+    The tasks are polled together through the query service with adaptive
+    backoff, see lib.aio.tasks.AsyncTaskTracker.
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        tasks: a list of task href
+        timeout: Seconds each task must complete in, None waits forever.
+        on_progress: Called as on_progress(href, status, record) when a task changes status.
+
+    Returns:
+        True when all tasks have a status of success
+
+    Raises:
+        TaskError: a task finished with error, was aborted or timed out.
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    tracker = AsyncTaskTracker(vmware_access_token, on_progress=on_progress)
+    for task in tasks:
+        tracker.add(task, timeout)
+
+    await tracker.wait()
+
+    return True
+
+
+async def _query(endpoint_url: str, headers: dict[str, str], params: dict[str, int | str],
+                 page_format: PageFormat, concurrency: int = 1) -> list[dict[str, Any]]:
+    """Collect every record of a paginated VCD query."""
+
+    return [record async for record in paginate(endpoint_url, headers, params, page_format, pageSize, concurrency)]
+
+
+@operation
+async def query_vm(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> list[dict[str, Any]]:
+    """List all VM filtered by the a filter
+
+    Args:
+        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        filter: A VCD Query filter, for example, name==virtual_machine_1
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
+
+    Returns:
+       A list of Virtual Machine records
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "api", "query"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.1"
+    }
+
+    params: dict[str, int | str] = {
+        "filter": filter,
+        "type": "vm",
+        "format": "records"
+    }
+
+    log.debug(f'Query Virtual Machines with filter: {filter}')
+
+    return await _query(endpoint_url, headers, params, LEGACY_QUERY, concurrency)
+
+
+@operation
+async def query_catalogs(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> list[dict[str, Any]]:
+    """List all catalogs filtered by the a filter
+
+    Args:
+        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        filter: A VCD Query filter, for example, name==PetClinic
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
+
+    Returns:
+       A list of Catalog records
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "api", "catalogs", "query"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.1"
+    }
+
+    params: dict[str, int | str] = {
+        "filter": filter,
+        "type": "catalogs",
+        "format": "records"
+    }
+
+    log.debug(f'Query Catalogs with filter: {filter}')
+
+    return await _query(endpoint_url, headers, params, LEGACY_QUERY, concurrency)
+
+
+@operation
+@cache_responses
+async def get_resource(vmware_access_token: str, href: str) -> dict[str, Any]:
+    """Get the JSON Record of a resource by HREF
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        href: The href of the resource, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api/vApp/vm-0a782687-a2c2-44df-86f0-fce60e075d7c
+
+    Returns:
+        A JSON record of the resource
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.1"
+    }
+
+    log.debug(f"Retrieving Resource {href}")
+    r = await request("GET", href, headers=headers)
+
+    return r.json()
+
+
+@operation
+@cache_responses
+async def get_vm_metadata(vmware_access_token: str, href: str) -> dict[str, Any]:
+    """Get the metadata of a VM or VAPP referenced by the provided href
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        href: The href of the resource, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api/vApp/vm-0a782687-a2c2-44df-86f0-fce60e075d7c
+
+    Returns:
+        A metadata record
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([href, "metadata"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.1"
+    }
+
+    log.debug(f'Retrieving metadata for {href}')
+    r = await request("GET", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+async def powerOff(href: str, vmware_access_token: str) -> dict[str, Any]:
+    """Perform an Power Off operation on a VM or VAPP
+
+    Args:
+        href: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api/vApp/vm-0a782687-a2c2-44df-86f0-fce60e075d7c
+        vmware_access_token: A VMWare VCD Session token.
+
+    Returns:
+        A task object
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([href, "power", "action", "powerOff"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.0",
+    }
+
+    log.debug(f'Power Off: {href}')
+    r = await request("POST", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+async def powerOn(href: str, vmware_access_token: str) -> dict[str, Any]:
+    """Perform an Power On operation on a VM or VAPP
+
+    Args:
+        href: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api/vApp/vm-0a782687-a2c2-44df-86f0-fce60e075d7c
+        vmware_access_token: A VMWare VCD Session token.
+
+    Returns:
+        A task object
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([href, "power", "action", "powerOn"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.0",
+    }
+
+    log.debug(f'Power On: {href}')
+    r = await request("POST", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+async def create_catalog_item(catalog_href: str, vmware_access_token: str, item_name: str) -> dict[str, Any]:
+    """Add an item to a Catalog
+
+    Args:
+        catalog_href: HREF to a catalog eg. https://dirw002.eu-de.vmware.cloud.ibm.com/api/catalog/35a720ad-2b98-4706-b9a2-739b65af7965
+        vmware_access_token: A VMWare VCD Session token.
+        item_name: Name of the item to upload
+
+    Returns:
+        A Catalog Item object
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([catalog_href, "action", "upload"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.0",
+        "Content-Type": "application/vnd.vmware.vcloud.uploadVAppTemplateParams+xml"
+    }
+
+    log.debug(f"Composing VAPPTemplate: {item_name}")
+    r = await request("POST", endpoint_url, headers=headers, data=_catalog_item_body(item_name))
+
+    return r.json()
+
+
+@operation
+async def create_catalog(director_url: str, vmware_access_token: str, org_id: str, catalog_name: str) -> dict[str, Any]:
+    """Create a Catalog on an org
+
+    Args:
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com/
+        vmware_access_token: A VMWare VCD Session token.
+        org_id: The id of an organization
+        catalog_name: The name of the new catalog
+
+    Returns:
+        A task object
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "api", "admin", "org", org_id, "catalogs"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.0",
+        "Content-Type": "application/vnd.vmware.admin.catalog+xml",
+    }
+
+    log.debug(f"Creating  catalog: {catalog_name}")
+    r = await request("POST", endpoint_url, headers=headers, data=_catalog_body(catalog_name))
+
+    return r.json()
+
+
+@operation
+async def create_apitoken(director_url: str, vmware_access_token: str, org: str, org_id: str, token_name: str) -> str:
+    """Generate a API Token name, return the token value as a string.
+
+    Args:
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com/
+        vmware_access_token: A VMWare VCD Session token.
+        org: The name of an organization
+        org_id: the ID of an ORG
+        token_name: The name of the API Token
+
+    Returns:
+        A VMWare VCD Refresh Token
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "oauth", "tenant", org, "register"])
+
+    log.debug(f"Registering a new token: {token_name}")
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=38.1",
+        "Content-Type": "application/json",
+        "X-VMWARE-VCLOUD-AUTH-CONTEXT": org,
+        "X-VMWARE-VCLOUD-TENANT-CONTEXT": org_id,
+    }
+
+    r = await request("POST", endpoint_url, headers=headers, json={"client_name": token_name})
+    client = r.json()
+
+    endpoint_url = "/".join([director_url, "oauth", "tenant", org, "token"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=38.1",
+        "Content-Type": "application/x-www-form-urlencoded",
+        "X-VMWARE-VCLOUD-AUTH-CONTEXT": org,
+        "X-VMWARE-VCLOUD-TENANT-CONTEXT": org_id,
+    }
+
+    body = {"grant_type": client['grant_types'][0],
+            "client_id": client['client_id'],
+            "assertion": vmware_access_token}
+
+    r = await request("POST", endpoint_url, headers=headers, data=body)
+
+    return r.json()["refresh_token"]
+
+
+@operation
+async def upload_ovf(director_url: str, vmware_access_token: str, catalog_id: str, ovf_url: str, item_name: str) -> dict[str, Any]:
+    """Create a catalog item
+
+    Args:
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com/
+        vmware_access_token: A VMWare VCD Session token.
+        catalog_id: The id of the catalog to create the item in
+        ovf_url: The URl of the catalog item, eg,
+                  https://s3.us-east.cloud-object-storage.appdomain.cloud/vcfaas-lab-images/ibm-vcfaas-lab-apache2.ovf
+        item_name: The name of the new catalog item
+
+    Returns:
+        A CatalogItem object
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "api", "catalog", catalog_id, "action", "upload"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.0",
+        "Content-Type": "application/vnd.vmware.vcloud.uploadVAppTemplateParams+xml",
+    }
+
+    log.debug(f"Uploading OVF to catalog: {ovf_url}")
+    r = await request("POST", endpoint_url, headers=headers, data=_upload_ovf_body(item_name, ovf_url))
+
+    return r.json()
+
+
+@operation
+async def get_ipspaces(director_url: str, vmware_access_token: str) -> list[dict[str, Any]]:
+    """Get a list of all IP Spaces
+
+    Args:
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+
+    Returns:
+        A list of IP Space summaries
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "ipSpaces", "summaries"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=40.0.0-alpha",
+        "Content-Type": "application/json"
+    }
+
+    log.debug(f'Getting IP Spaces')
+
+    return await _query(endpoint_url, headers, {}, CLOUDAPI)
+
+
+@operation
+@cache_responses
+async def get_ipspace(director_url: str, vmware_access_token: str, ipspace_id: str) -> dict[str, Any]:
+    """Get an ip space
+
+    Args:
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        ipspace_id: The id of an ip space
+
+    Returns:
+        An ip space object
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "ipSpaces", ipspace_id])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=40.0.0-alpha",
+        "Content-Type": "application/json"
+    }
+
+    log.debug(f'Getting IP Space')
+    r = await request("GET", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+async def ipspace_allocations(director_url: str, vmware_access_token: str, ipspace_id: str) -> list[dict[str, Any]]:
+    """Get a list of IP Allocations for a specific IP Space
+
+    Args:
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        ipspace_id: The ID of an IP Space, eg, urn:vcloud:ipSpace:f51bbb6f-22d0-409f-98db-b4cdead44c58
+
+    Returns:
+        A list of floating IP allocations
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "ipSpaces", ipspace_id, "allocations"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=40.0.0-alpha",
+        "Content-Type": "application/json"
+    }
+
+    params: dict[str, int | str] = {
+        "filter": "type==FLOATING_IP"
+    }
+
+    log.debug(f'Getting IP Space Allocations')
+
+    return await _query(endpoint_url, headers, params, CLOUDAPI)
+
+
+@operation
+async def ipspaces_allocate_ip(director_url: str, vmware_access_token: str, ipspace_id: str) -> str:
+    """Allocate a floating IP Address from an IP Space
+
+    Args:
+        director_url:  eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        ipspace_id: The ID of the IP Space
+
+    Returns:
+        The href of the allocation task
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "ipSpaces", ipspace_id, "allocate"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=40.0.0-alpha",
+        "Content-Type": "application/json",
+    }
+
+    body = '{"type":"FLOATING_IP","quantity":1}'
+
+    log.debug(f'Allocating IP Address to IP Space')
+    r = await request("POST", endpoint_url, headers=headers, data=body)
+
+    return r.headers['location']
@@ -0,0 +1,74 @@
+"""asyncio variant of lib.iam.
+
+https://cloud.ibm.com/apidocs/iam-identity-token-api
+"""
+
+import logging
+from typing import Any
+
+from lib.aio.client import request
+from lib.endpoints import iam_url
+from lib.metrics import operation
+from lib.retry import retry_policy
+
+log = logging.getLogger(__name__)
+
+
+@operation
+@retry_policy(idempotent=True, read_timeout=30)
+async def request_ibm_iam_access_token(ibm_api_key: str) -> str:
+    """The API call to get an IBM Cloud IAM access token.
+
+    Args:
+        ibm_api_key: IBM IAM API key.
+
+    Returns:
+        IBM IAM access token.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([iam_url(), "identity", "token"])
+
+    payload = {
+        "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
+        "apikey": ibm_api_key,
+    }
+
+    log.debug("Request IBM Cloud IAM access token.")
+    r = await request("POST", endpoint_url, data=payload)
+    log.debug(f'Got IBM Cloud IAM access token: {r.json()["access_token"][:7]}(...)')
+
+    return r.json()["access_token"]
+
+
+@operation
+async def ibm_iam_apikey_details(ibm_api_key: str, ibm_iam_access_token: str) -> dict[str, Any]:
+    """The API call to get the details of an API Key
+
+        https://cloud.ibm.com/apidocs/iam-identity-token-api#get-api-keys-details
+
+    Args:
+        ibm_api_key: IBM IAM API key.
+        ibm_iam_access_token: IBM IAM access token.
+
+    Returns:
+        Dictionary with the API key details.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([iam_url(), "v1", "apikeys", "details"])
+
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}",
+               "IAM-Apikey": ibm_api_key,
+               "Content-Type": "application/json"}
+
+    log.debug("Request Details for an API Key.")
+    r = await request("GET", endpoint_url, headers=headers)
+
+    return r.json()
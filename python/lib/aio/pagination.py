@@ -0,0 +1,60 @@
+"""asyncio variant of lib.pagination."""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator
+
+from lib.aio.client import request
+from lib.pagination import CLOUDAPI, LEGACY_QUERY, PageFormat
+
+log = logging.getLogger(__name__)
+
+
+async def _get_page(endpoint_url: str, headers: dict[str, str], params: dict[str, Any],
+                    page_number: int) -> dict[str, Any]:
+    log.debug(f"Getting page {page_number}")
+    r = await request("GET", endpoint_url, headers=headers, params={**params, "page": page_number})
+
+    return r.json()
+
+
+async def paginate(endpoint_url: str, headers: dict[str, str], params: dict[str, Any],
+                   page_format: PageFormat = LEGACY_QUERY, page_size: int = 128,
+                   concurrency: int = 1) -> AsyncIterator[dict[str, Any]]:
+    """Yield every record of a paginated collection.
+
+    See lib.pagination.paginate for the arguments.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    params = {**params, "pageSize": page_size}
+
+    page = await _get_page(endpoint_url, headers, params, 1)
+    page_count = -(-page[page_format.total_key] // page_size)
+    for record in page[page_format.records_key]:
+        yield record
+
+    # Keep a sliding window of in-flight pages and yield them in order.
+    in_flight: deque[asyncio.Task] = deque()
+    pages = iter(range(2, page_count + 1))
+
+    try:
+        for page_number in pages:
+            in_flight.append(asyncio.ensure_future(_get_page(endpoint_url, headers, params, page_number)))
+            if len(in_flight) >= concurrency:
+                break
+
+        while in_flight:
+            page = await in_flight.popleft()
+            for page_number in pages:
+                in_flight.append(asyncio.ensure_future(_get_page(endpoint_url, headers, params, page_number)))
+                break
+            for record in page[page_format.records_key]:
+                yield record
+    finally:
+        for task in in_flight:
+            task.cancel()
@@ -0,0 +1,119 @@
+"""asyncio variant of lib.schematics.
+
+https://cloud.ibm.com/apidocs/schematics/schematics#authentication
+"""
+
+import logging
+from typing import Any
+
+from lib.aio.client import request
+from lib.endpoints import schematics_url
+from lib.metrics import operation
+
+log = logging.getLogger(__name__)
+
+
+@operation
+async def ibm_schematics_list_workspaces(ibm_iam_access_token: str, resource_group: str) -> dict[str, Any]:
+    """The API call to list schematics workspaces
+
+       https://cloud.ibm.com/apidocs/schematics/schematics#list-workspaces
+
+    Args:
+        ibm_iam_access_token: IBM IAM access token.
+        resource_group: Resource group name, empty for all.
+
+    Returns:
+        A list of schematics workspaces.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([schematics_url(), "v1", "workspaces"])
+
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
+
+    if len(resource_group) > 0:
+        headers["resource_group"] = resource_group
+
+    log.debug(f'Request schematics workspaces with Resource Group: {resource_group}')
+    r = await request("GET", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+async def ibm_schematics_create_workspace(ibm_iam_access_token: str, resource_group: str, workspace_name: str, description: str,
+                                          template_repo: str, folder: str, type: str, variablestore: dict[str, Any]) -> dict[str, Any]:
+    """The API call to Create a schematics workspaces
+        https://cloud.ibm.com/apidocs/schematics/schematics#create-workspace
+
+    See lib.schematics.ibm_schematics_create_workspace for the arguments.
+
+    Returns:
+        The created workspace record.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([schematics_url(), "v1", "workspaces"])
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
+
+    payload = {
+        "name": workspace_name,
+        "type": [
+            type
+        ],
+        "location": "us-south",
+        "description": description,
+        "resource_group": resource_group,
+        "tags": [],
+        "template_repo": {
+            "url": template_repo
+        },
+        "template_data": [
+            {
+                "folder": folder,
+                "type": type,
+                "compact": True,
+                "variablestore": variablestore
+            }
+        ]
+    }
+
+    log.debug(f'Creating Schematics Workspace - {workspace_name}')
+    r = await request("POST", endpoint_url, headers=headers, json=payload)
+
+    return r.json()
+
+
+@operation
+async def ibm_schematics_update_workspace_variables(ibm_iam_access_token: str, workspace_id: str, template_id: str, variablestore: dict[str, Any]) -> dict[str, Any]:
+    """The API call to Update an existing workspace variablestore
+        https://cloud.ibm.com/apidocs/schematics/schematics#replace-workspace
+
+    See lib.schematics.ibm_schematics_update_workspace_variables for the arguments.
+
+    Returns:
+        A Schematics STATUS record
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    base_url = "/".join([schematics_url(), "v1", "workspaces"])
+
+    endpoint_url = "/".join([base_url, workspace_id, "template_data", template_id, "values"])
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
+
+    payload = {"variablestore": variablestore}
+
+    log.debug(f'Updating Workspace - {workspace_id}')
+    r = await request("PUT", endpoint_url, headers=headers, json=payload)
+
+    return r.json()
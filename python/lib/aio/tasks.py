@@ -0,0 +1,72 @@
+"""asyncio variant of lib.tasks.
+
+AsyncTaskTracker polls the query service for many tasks at once, with the
+backoff and per task deadlines of lib.tasks.TaskTracker, from a single
+coroutine instead of one poller per task.
+"""
+
+import asyncio
+import logging
+from typing import Any
+
+from lib.aio.client import request
+from lib.aio.pagination import paginate
+from lib.pagination import LEGACY_QUERY
+from lib.tasks import TaskTracker, _Task
+
+log = logging.getLogger(__name__)
+
+
+class AsyncTaskTracker(TaskTracker):
+    """TaskTracker for coroutines, see lib.tasks.TaskTracker for the arguments."""
+
+    async def _query(self, director_url: str, tasks: list[_Task]) -> dict[str, dict[str, Any]]:
+        """Task records of a batch of tasks on one director keyed by href."""
+        endpoint_url = "/".join([director_url, "api", "query"])
+        params = self._query_params(tasks)
+
+        return {r["href"]: r async for r in paginate(endpoint_url, self._headers(), params, LEGACY_QUERY)}
+
+    async def _get(self, task: _Task) -> dict[str, Any]:
+        r = await request("GET", task.href, headers=self._headers())
+
+        return r.json()
+
+    async def _poll(self, pending: list[_Task]) -> bool:
+        """Refresh the status of pending tasks, returns True when any changed."""
+        changed = False
+        for director_url, batch in self._batches(pending):
+            log.debug(f"Querying {len(batch)} tasks on {director_url}")
+            records = await self._query(director_url, batch)
+
+            for task in batch:
+                # tasks the query service does not list yet are read directly
+                changed = self._update(task, records.get(task.href) or await self._get(task)) or changed
+
+        return changed
+
+    async def wait(self) -> dict[str, str]:
+        """Wait until every tracked task completed.
+
+        Returns:
+            The final status of each task keyed by task href.
+
+        Raises:
+            TaskTimeoutError: a task did not complete before its deadline,
+                it reports the tasks that failed meanwhile as well.
+            TaskError: a task finished with error or was aborted.
+            aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+                e.g., connection or authorization errors.
+        """
+        self._interval = self.poll_interval
+        timed_out: dict[str, str] = {}
+
+        while True:
+            pending, sleep = self._pending(timed_out)
+            if not pending:
+                break
+
+            await asyncio.sleep(sleep)
+            self._backoff(await self._poll(pending))
+
+        return self._result(timed_out)
@@ -0,0 +1,277 @@
+"""asyncio variant of lib.vcfaas.
+
+https://cloud.ibm.com/apidocs/vmware-service#list-director-sites
+"""
+
+import logging
+import time
+from typing import Any
+
+from lib.aio.client import request
+from lib.endpoints import vcfaas_url
+from lib.http_cache import cache_responses
+from lib.metrics import operation
+from lib.retry import retry_policy
+from lib.vcfaas import VmwareSession
+
+log = logging.getLogger(__name__)
+
+
+@operation
+async def list_director_sites(ibm_iam_access_token: str, region: str) -> dict[str, Any]:
+    """List Cloud Director site instances.
+
+    Args:
+        ibm_iam_access_token: IBM IAM access token.
+        region: VCF as a Service Director region, e.g., "eu-fr2".
+
+    Returns:
+        Dictionary with VMware Cloud Director site instances.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    base_url = vcfaas_url(region)
+
+    endpoint_url = "/".join([base_url, "v1", "director_sites"])
+
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
+
+    log.debug("Request VCFaaS Director sites.")
+    r = await request("GET", endpoint_url, headers=headers)
+    log.debug(f'Got {len(r.json()["director_sites"])} VCFaaS Director sites.')
+
+    return r.json()
+
+
+@operation
+@cache_responses
+async def get_director_site(ibm_iam_access_token: str, region: str, site_id: str) -> dict[str, Any]:
+    """Get a director site based on its ID
+
+    Args:
+        ibm_iam_access_token: IBM IAM access token.
+        region: VCF as a Service Director region, e.g., "eu-fr2".
+        site_id: The site id for example 40e701cd-ef86-4d5e-a847-e7c336f11f27
+
+    Returns:
+        Dictionary with the VMware Cloud Director site instance.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    base_url = vcfaas_url(region)
+
+    endpoint_url = "/".join([base_url, "v1", "director_sites", site_id])
+
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
+
+    log.debug("Get a VCFaaS site")
+    r = await request("GET", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+@retry_policy(idempotent=True, read_timeout=60)
+async def get_vmware_access_token(ibm_iam_access_token: str, url: str, org: str) -> str:
+    """Retrieve a VMware Cloud Director session token from the X-VMWARE-VCLOUD-ACCESS-TOKEN header.
+
+    Args:
+        ibm_iam_access_token : An IBM IAM Session key
+        url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        org: The organization the Director Site is a member of
+
+    Returns:
+        A VMware VCD Access Token to be used in future API calls to VCD
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([url, "cloudapi", "1.0.0", "sessions"])
+
+    headers = {"Authorization": f"Bearer {ibm_iam_access_token}; org={org}",
+               "Accept": "application/*;version=39.0"}
+
+    log.debug("Requesting VMWare Access Token")
+    r = await request("POST", endpoint_url, headers=headers)
+
+    return r.headers["X-VMWARE-VCLOUD-ACCESS-TOKEN"]
+
+
+@operation
+async def list_vcfaas_vdcs(ibm_iam_access_token: str, region: str) -> dict[str, Any]:
+    """Retrieve all VDC's for a specific region
+
+    Args:
+        ibm_iam_access_token: IBM IAM access token.
+        region: VCF as a Service Director region, e.g., "eu-fr2".
+
+    Returns:
+        A json list of Virtual Data Centers
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    base_url = vcfaas_url(region)
+
+    endpoint_url = "/".join([base_url, "v1", "vdcs"])
+
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}",
+               "Content-Type": "application/json"}
+
+    log.debug("Retrieving list of VDC")
+    r = await request("GET", endpoint_url, headers=headers)
+
+    return r.json()
+
+
+@operation
+async def create_vdc(ibm_iam_access_token: str, region: str, director_site_id: str,
+                     pvdc_id: str, vdc_name: str, resource_group_id: str, cpu: int = 1, ram: int = 1,
+                     edge: bool = False) -> dict[str, Any]:
+    """Create a Virtual Data Center as a reserved type.
+
+    See lib.vcfaas.create_vdc for the arguments.
+
+    Returns:
+        Dictionary with VDC metadata after creation request.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    base_url = vcfaas_url(region)
+    endpoint_url = "/".join([base_url, "v1", "vdcs"])
+
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}",
+               "Content-Type": "application/json"}
+
+    payload = {
+        "name": vdc_name,
+        "cpu": cpu,
+        "ram": ram,
+        "resource_group": {"id": resource_group_id},
+        "director_site": {
+            "id": director_site_id,
+            "pvdc": {
+                "id": pvdc_id,
+                "provider_type": {
+                    "name": "on_demand"
+                }
+            }
+        }
+    }
+
+    if edge:
+        payload["edge"] = {"type": "efficiency"}
+
+    log.debug(f"Request create VDC {vdc_name}")
+    r = await request("POST", endpoint_url, headers=headers, json=payload)
+    log.debug(f"VDC {vdc_name} create requested.")
+
+    return r.json()
+
+
+@operation
+async def delete_vdc(ibm_iam_access_token: str, region: str, vdc_id: str) -> dict[str, Any]:
+    """Delete a Virtual Data Center
+
+    Args:
+        ibm_iam_access_token: IBM IAM access token.
+        region: VCF as a Service Director region, e.g., "eu-fr2".
+        vdc_id: ID of the VDC to delete
+
+    Returns:
+        Dictionary with VDC metadata after deletion request.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    base_url = vcfaas_url(region)
+    endpoint_url = "/".join([base_url, "v1", "vdcs", vdc_id])
+    headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
+
+    log.debug(f"Request delete VDC {vdc_id}")
+    r = await request("DELETE", endpoint_url, headers=headers)
+    log.debug(f"VDC {vdc_id} delete requested.")
+
+    return r.json()
+
+
+@operation
+@retry_policy(idempotent=True, read_timeout=60)
+async def get_org_id(ibm_iam_access_token: str, director_url: str, org: str) -> str:
+    """Get the ORG ID
+
+    Args:
+        ibm_iam_access_token : An IBM IAM Session key
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        org: The organization the Director Site is a member of
+
+    Returns:
+        the org id
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "sessions"])
+
+    headers = {"Authorization": f"Bearer {ibm_iam_access_token}; org={org}",
+               "Accept": "application/json;version=40.0.0-alpha"}
+
+    log.debug(f"Getting ORG ID for {org}")
+    r = await request("POST", endpoint_url, headers=headers)
+
+    return r.json()['org']['id'].split(':')[-1]
+
+
+@operation
+@retry_policy(idempotent=True, read_timeout=60)
+async def create_vmware_session(ibm_iam_access_token: str, director_url: str, org: str) -> VmwareSession:
+    """Create a VMware Cloud Director session with a single POST to /cloudapi/1.0.0/sessions.
+
+    Args:
+        ibm_iam_access_token : An IBM IAM Session key
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        org: The organization the Director Site is a member of
+
+    Returns:
+        The new session with its access token, org and user.
+
+    Raises:
+        aiohttp.ClientError: all aiohttp exceptions can be raised due to,
+            e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "sessions"])
+
+    headers = {"Authorization": f"Bearer {ibm_iam_access_token}; org={org}",
+               "Accept": "application/json;version=39.0"}
+
+    log.debug(f"Creating VMware session for {org}")
+    r = await request("POST", endpoint_url, headers=headers)
+    body = r.json()
+
+    idle_timeout = body.get("sessionIdleTimeoutMinutes") or 30
+
+    return VmwareSession(director_url = director_url,
+                         access_token = r.headers["X-VMWARE-VCLOUD-ACCESS-TOKEN"],
+                         org_id = body["org"]["id"].split(":")[-1],
+                         org_name = body["org"]["name"],
+                         user = body["user"]["name"],
+                         expires_at = time.time() + idle_timeout*60,
+                         idle_timeout = idle_timeout*60)
@@ -0,0 +1,183 @@
+"""Reuse of VMware Cloud Director API tokens between runs.
+
+An API token is an OAuth refresh token of a client registered with
+cloud_director.create_apitoken. Registering a client on every run costs two
+round-trips and leaves an orphan client behind, so issued tokens are kept
+per (director_url, org, user) and only replaced once the director no longer
+lists them. Each VCD user gets its own token, e.g. the students of a
+classroom run sharing an org.
+
+The check and the registration of a new token run under the store lock,
+so concurrent runs of the same user share one token. The store remembers
+the names of the tokens it replaced and collect_stale() revokes those the
+director still lists, and only those. Tokens the store never issued, e.g.
+stored on another machine or used by a Schematics workspace, are left
+alone.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import lib.cloud_director as cloud_director
+from lib.local_store import JsonFileStore, state_path
+
+log = logging.getLogger(__name__)
+
+TOKEN_PREFIX = "TOKEN-"
+
+
+class ApiTokenStore:
+    """API tokens issued per (director_url, org, user).
+
+    Args:
+        path: JSON file the tokens are kept in, None keeps them in memory
+            for the life of the process only.
+    """
+
+    def __init__(self, path: Optional[str]) -> None:
+        self._store = JsonFileStore(path) if path else None
+        self._tokens: dict[str, dict[str, Any]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @staticmethod
+    def _key(director_url: str, org: str, user: str) -> str:
+        return f"{director_url.rstrip('/')}|{org}|{user}"
+
+    def _lock(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _update(self) -> Iterator[dict[str, Any]]:
+        """The tokens of every key, written back when the block exits without error."""
+        if self._store is None:
+            yield self._tokens
+            return
+
+        with self._store.update() as tokens:
+            yield tokens
+
+    def _load(self, key: str) -> Optional[dict[str, Any]]:
+        if self._store is not None:
+            return self._store.load().get(key)
+        return self._tokens.get(key)
+
+    @staticmethod
+    def _set(tokens: dict[str, Any], key: str, entry: dict[str, Any]) -> None:
+        # only called once the director no longer lists the old token, its
+        # name is kept in case the listing lagged behind and it comes back
+        old = tokens.get(key)
+        superseded = old.get("superseded", []) if old is not None else []
+        if old is not None and old["name"] != entry["name"]:
+            superseded = superseded + [old["name"]]
+        tokens[key] = {**entry, "superseded": superseded}
+
+    def get_apitoken(self, director_url: str, vmware_access_token: str, org: str, org_id: str, user: str,
+                     prefix: str = TOKEN_PREFIX) -> str:
+        """Get a valid API token of a user, registering a new client only when needed.
+
+        A stored token is checked with one GET of the user's tokens filtered
+        by its client name, it is still valid when the director lists it.
+        The check and the registration run under the store lock, so
+        concurrent callers of the same user get the same token.
+
+        Args:
+            director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com
+            vmware_access_token: A VMWare VCD Session token.
+            org: The name of an organization
+            org_id: the ID of an ORG
+            user: The VCD user of the session, see VmwareSession.user.
+            prefix: Client name prefix of new tokens.
+
+        Returns:
+            A VMWare VCD Refresh Token
+
+        Raises:
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        key = self._key(director_url, org, user)
+
+        with self._lock(key), self._update() as tokens:
+            entry = tokens.get(key)
+            if entry is not None:
+                if any(cloud_director.iter_apitokens(director_url, vmware_access_token, name=entry["name"])):
+                    log.debug(f"Reusing API token {entry['name']}")
+                    return entry["refresh_token"]
+                log.debug(f"API token {entry['name']} was revoked")
+
+            token_name = f"{prefix}{uuid.uuid4()}"
+            refresh_token = cloud_director.create_apitoken(director_url, vmware_access_token, org, org_id, token_name)
+            self._set(tokens, key, {"name": token_name, "refresh_token": refresh_token, "created": time.time()})
+
+        return refresh_token
+
+    def collect_stale(self, director_url: str, vmware_access_token: str, org: str, user: str,
+                      dry_run: bool = False) -> list[str]:
+        """Revoke the tokens this store issued for a user and later replaced.
+
+        Args:
+            director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com
+            vmware_access_token: A VMWare VCD Session token.
+            org: The name of an organization
+            user: The VCD user of the session, see VmwareSession.user.
+            dry_run: Only list the tokens, do not revoke them.
+
+        Returns:
+            The names of the revoked tokens, or of the tokens to revoke on a dry run.
+
+        Raises:
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        key = self._key(director_url, org, user)
+        entry = self._load(key)
+        superseded = entry.get("superseded", []) if entry is not None else []
+
+        stale = [t for name in superseded
+                 for t in cloud_director.iter_apitokens(director_url, vmware_access_token, name=name)]
+        if dry_run:
+            return [t["name"] for t in stale]
+
+        for token in stale:
+            log.debug(f"Revoking stale API token {token['name']}")
+            cloud_director.delete_apitoken(director_url, vmware_access_token, token["id"])
+
+        # the names the director no longer lists were revoked already
+        with self._lock(key), self._update() as tokens:
+            if key in tokens:
+                tokens[key]["superseded"] = [n for n in tokens[key].get("superseded", []) if n not in superseded]
+
+        return [t["name"] for t in stale]
+
+
+_apitoken_store = ApiTokenStore(os.environ.get("VMWARE_L4_API_TOKEN_STORE", state_path("api_tokens.json")))
+
+
+def get_apitoken(director_url: str, vmware_access_token: str, org: str, org_id: str, user: str) -> str:
+    """Get a valid API token of a user from the token store.
+
+    Tokens are kept in ~/.vmware-l4-automation/api_tokens.json, set
+    VMWARE_L4_API_TOKEN_STORE to another path, or to an empty string to not
+    keep them between runs.
+
+    See ApiTokenStore.get_apitoken.
+    """
+
+    return _apitoken_store.get_apitoken(director_url, vmware_access_token, org, org_id, user)
+
+
+def collect_stale_apitokens(director_url: str, vmware_access_token: str, org: str, user: str,
+                            dry_run: bool = False) -> list[str]:
+    """Revoke the tokens of a user the token store issued and later replaced.
+
+    See ApiTokenStore.collect_stale.
+    """
+
+    return _apitoken_store.collect_stale(director_url, vmware_access_token, org, user, dry_run)
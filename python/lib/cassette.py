@@ -0,0 +1,251 @@
+"""Record HTTP traffic to JSONL files and replay it without a network.
+
+A cassette is a JSON lines file with one interaction per line:
+
+    {"method": "GET", "url": "https://.../api/query?page=2&...",
+     "request_headers": {...}, "request_body": null,
+     "status": 200, "reason": "OK", "response_headers": {...},
+     "response_body": "{...}", "elapsed": 0.183, "time": 1718000000.0}
+
+Secrets are redacted before anything is written: credential headers, and
+token, key and password fields of JSON and form bodies, including the
+secure values of a Schematics variablestore. Each secret is replaced by
+a placeholder derived from its hash, so a token issued in one response
+and sent in later requests still reads as the same value in the trace.
+
+ReplayAdapter serves a cassette back. Interactions are matched on method
+and URL and served in recorded order, so repeated polls of a task see
+the same status transitions as the recorded run. Once the recordings of
+a URL are used up, the last one is served again. Recorded pages are
+matched by their page query parameter.
+
+See lib.requests_session.configure_cassette().
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+log = logging.getLogger(__name__)
+
+# Request bodies larger than this, e.g., uploaded files, are not recorded.
+MAX_BODY = 1024 * 1024
+
+SECRET_HEADERS = {"authorization", "iam-apikey", "x-vmware-vcloud-access-token", "cookie", "set-cookie",
+                  "proxy-authorization"}
+SECRET_FIELDS = {"access_token", "refresh_token", "id_token", "delegated_refresh_token", "apikey",
+                 "api_key", "ibmcloud_api_key", "password", "client_secret", "token", "vmware_api_token",
+                 "assertion"}
+
+
+def _placeholder(value: str) -> str:
+    return "redacted-" + hashlib.sha256(value.encode()).hexdigest()[:16]
+
+
+def _redact_header(name: str, value: str) -> str:
+    if name.lower() not in SECRET_HEADERS:
+        return value
+
+    # keep the scheme and the org of "Bearer <token>; org=<org>"
+    scheme, sep, rest = value.partition(" ")
+    if sep and scheme.lower() in ("bearer", "basic"):
+        token, sep, extra = rest.partition(";")
+        return f"{scheme} {_placeholder(token)}{sep}{extra}"
+    return _placeholder(value)
+
+
+def _redact_json(data: Any) -> Any:
+    if isinstance(data, dict):
+        secure = data.get("secure") is True
+        return {k: _placeholder(str(v)) if v and (k.lower() in SECRET_FIELDS or (secure and k == "value"))
+                else _redact_json(v)
+                for k, v in data.items()}
+    if isinstance(data, list):
+        return [_redact_json(v) for v in data]
+    return data
+
+
+def _redact_form(text: str) -> str:
+    pairs = parse_qsl(text, keep_blank_values=True)
+    return urlencode([(k, _placeholder(v) if v and k.lower() in SECRET_FIELDS else v) for k, v in pairs])
+
+
+def _redact_body(body: Optional[str], content_type: str) -> Optional[str]:
+    if not body:
+        return body
+    if "json" in content_type:
+        try:
+            return json.dumps(_redact_json(json.loads(body)))
+        except ValueError:
+            pass
+    if "x-www-form-urlencoded" in content_type:
+        return _redact_form(body)
+    return body
+
+
+def redact_url(url: str) -> str:
+    """URL with the values of secret query parameters replaced."""
+    u = urlsplit(url)
+    if not u.query:
+        return url
+    return urlunsplit(u._replace(query=_redact_form(u.query)))
+
+
+def redact_headers(headers: dict[str, str]) -> dict[str, str]:
+    """Headers with credentials replaced by hash placeholders."""
+    return {k: _redact_header(k, v) for k, v in headers.items()}
+
+
+def _encode(body: Any) -> tuple[Optional[str], Optional[str]]:
+    """Text of a body and its encoding in the cassette."""
+    if body is None:
+        return None, None
+    if isinstance(body, str):
+        body = body.encode()
+    if not isinstance(body, (bytes, bytearray)):
+        return None, "stream"
+    if len(body) > MAX_BODY:
+        return None, f"omitted {len(body)} bytes"
+    try:
+        return bytes(body).decode(), None
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode(), "base64"
+
+
+def _decode(text: Optional[str], encoding: Optional[str]) -> bytes:
+    if text is None:
+        return b""
+    if encoding == "base64":
+        return base64.b64decode(text)
+    return text.encode()
+
+
+class CassetteWriter:
+    """Append redacted interactions to a JSONL file.
+
+    Lines are flushed one by one, so the trace of a run that crashes is
+    kept up to the failing request.
+
+    Args:
+        path: Cassette file, appended to when it exists.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def record(self, request: requests.PreparedRequest, response: requests.Response) -> None:
+        """Write one request and its response."""
+        request_body, request_encoding = _encode(request.body)
+        response_body, response_encoding = _encode(response.content)
+
+        if request_encoding is None:
+            request_body = _redact_body(request_body, request.headers.get("Content-Type", ""))
+        if response_encoding is None:
+            response_body = _redact_body(response_body, response.headers.get("Content-Type", ""))
+
+        interaction = {
+            "time": time.time(),
+            "elapsed": response.elapsed.total_seconds(),
+            "method": request.method,
+            "url": redact_url(request.url),
+            "request_headers": redact_headers(dict(request.headers)),
+            "request_body": request_body,
+            "request_body_encoding": request_encoding,
+            "status": response.status_code,
+            "reason": response.reason,
+            "response_headers": redact_headers(dict(response.headers)),
+            "response_body": response_body,
+            "response_body_encoding": response_encoding,
+        }
+
+        line = json.dumps(interaction)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def _match_key(method: str, url: str) -> tuple[str, str]:
+    u = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(u.query, keep_blank_values=True)))
+    return method.upper(), urlunsplit((u.scheme, u.netloc, u.path.rstrip("/"), query, ""))
+
+
+class ReplayAdapter(requests.adapters.BaseAdapter):
+    """Transport adapter answering requests from a cassette.
+
+    Args:
+        path: Cassette file written by CassetteWriter.
+        speed: 0 answers at once, 1 waits the recorded response time,
+            2 half of it, and so on.
+    """
+
+    def __init__(self, path: str, speed: float = 0.0) -> None:
+        super().__init__()
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._interactions: dict[tuple[str, str], list[dict[str, Any]]] = defaultdict(list)
+        self._served: dict[tuple[str, str], int] = defaultdict(int)
+
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    interaction = json.loads(line)
+                    key = _match_key(interaction["method"], interaction["url"])
+                    self._interactions[key].append(interaction)
+
+        log.debug(f"Loaded {sum(len(v) for v in self._interactions.values())} interactions from {path}")
+
+    def _next(self, request: requests.PreparedRequest) -> dict[str, Any]:
+        key = _match_key(request.method, redact_url(request.url))
+        with self._lock:
+            recorded = self._interactions.get(key)
+            if not recorded:
+                raise requests.ConnectionError(f"No recorded response for {request.method} {request.url}",
+                                               request=request)
+            i = min(self._served[key], len(recorded) - 1)
+            self._served[key] += 1
+            return recorded[i]
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        """Answers a PreparedRequest with its recorded Response."""
+        interaction = self._next(request)
+        if self.speed > 0:
+            time.sleep(interaction["elapsed"] / self.speed)
+
+        r = requests.Response()
+        r.status_code = interaction["status"]
+        r.reason = interaction.get("reason")
+        r.headers = CaseInsensitiveDict(interaction["response_headers"])
+        r._content = _decode(interaction["response_body"], interaction.get("response_body_encoding"))
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r.elapsed = timedelta(seconds=interaction["elapsed"])
+
+        return r
+
+    def unused(self) -> list[tuple[str, str]]:
+        """Method and URL of recorded interactions never served."""
+        with self._lock:
+            return [key for key, recorded in self._interactions.items() if self._served[key] < len(recorded)]
+
+    def close(self) -> None:
+        pass
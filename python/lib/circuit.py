@@ -0,0 +1,191 @@
+"""Circuit breakers per host and API family.
+
+A degraded director should not hold up a batch that also talks to healthy
+ones. Requests are grouped by host and API family:
+
+    iam         IBM Cloud IAM, /identity, /v1/apikeys
+    vcfaas      VCF as a Service, /v1/director_sites, /v1/vdcs
+    schematics  IBM Cloud Schematics, /v1/workspaces
+    cloudapi    VCD /cloudapi and /oauth
+    vcd         VCD legacy /api
+
+Each group has a CircuitBreaker. After too many connection errors,
+timeouts or 5xx answers among its recent requests the breaker opens and
+requests to the group fail at once with CircuitOpenError. Once
+open_seconds passed, a single probe request is let through (half open):
+its success closes the breaker, its failure opens it again for twice as
+long, up to max_open_seconds.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+import requests
+
+log = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+FAILURE_STATUSES = frozenset({500, 502, 503, 504})
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The circuit breaker of the target host and API family is open."""
+
+
+def api_family(url: str) -> str:
+    """API family of a URL, e.g. "vcd" for https://dirw002.eu-de.vmware.cloud.ibm.com/api/query."""
+    u = urlparse(url)
+    path = u.path
+    if u.netloc.startswith("iam.") or path.startswith(("/identity/", "/v1/apikeys")):
+        return "iam"
+    if "/cloudapi/" in path or "/oauth/" in path:
+        return "cloudapi"
+    if "/api/" in path:
+        return "vcd"
+    if "/v1/workspaces" in path or u.netloc.startswith("schematics."):
+        return "schematics"
+    if "/v1/director_sites" in path or "/v1/vdcs" in path:
+        return "vcfaas"
+    return "other"
+
+
+class CircuitBreaker:
+    """Failure rate circuit breaker.
+
+    Args:
+        name: Name used in errors and logs.
+        window: Number of recent outcomes the failure rate is computed on.
+        min_calls: Outcomes needed before the failure rate can trip the breaker.
+        failure_rate: Fraction of failures among the window that opens the breaker.
+        consecutive_failures: Failures in a row that open the breaker regardless.
+        open_seconds: First time the breaker stays open.
+        max_open_seconds: Longest time the breaker stays open.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 10, failure_rate: float = 0.5,
+                 consecutive_failures: int = 5, open_seconds: float = 10.0,
+                 max_open_seconds: float = 300.0) -> None:
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.consecutive_failures = consecutive_failures
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+
+        self.state = CLOSED
+        self.opened = 0
+        self.rejected = 0
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._consecutive = 0
+        self._open_for = open_seconds
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; a True in half open state is the probe."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self._open_until:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a request may be sent now."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker {self.name} is open")
+
+    def record(self, success: Optional[bool]) -> None:
+        """Record the outcome of an allowed request, None when it was never sent."""
+        with self._lock:
+            if success is None:
+                if self.state == HALF_OPEN:
+                    self._probing = False
+                return
+
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if success:
+                    log.info(f"Circuit breaker {self.name} closed")
+                    self.state = CLOSED
+                    self._open_for = self.open_seconds
+                    self._outcomes.clear()
+                    self._consecutive = 0
+                else:
+                    self._open_for = min(self._open_for * 2, self.max_open_seconds)
+                    self._trip()
+                return
+
+            if self.state == OPEN:
+                # a request sent before the breaker opened
+                return
+
+            self._outcomes.append(success)
+            self._consecutive = 0 if success else self._consecutive + 1
+
+            failures = self._outcomes.count(False)
+            if (self._consecutive >= self.consecutive_failures
+                    or (len(self._outcomes) >= self.min_calls
+                        and failures >= self.failure_rate * len(self._outcomes))):
+                self._trip()
+
+    def _trip(self) -> None:
+        log.warning(f"Circuit breaker {self.name} opened for {self._open_for:g}s")
+        self.state = OPEN
+        self.opened += 1
+        self._open_until = time.monotonic() + self._open_for
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected,
+                    "failures": self._outcomes.count(False), "calls": len(self._outcomes)}
+
+
+_lock = threading.Lock()
+_breakers: dict[tuple[str, str], CircuitBreaker] = {}
+_config: dict[str, Any] = {}
+
+
+def breaker(url: str) -> CircuitBreaker:
+    """The shared CircuitBreaker of the host and API family of a URL."""
+    key = (urlparse(url).netloc, api_family(url))
+    b = _breakers.get(key)
+    if b is None:
+        with _lock:
+            b = _breakers.get(key)
+            if b is None:
+                b = _breakers[key] = CircuitBreaker(f"{key[0]}/{key[1]}", **_config)
+    return b
+
+
+def is_failure(status: Optional[int]) -> bool:
+    """Whether an answer status, None for no answer, counts against a breaker."""
+    return status is None or status in FAILURE_STATUSES
+
+
+def configure_breakers(**settings: Any) -> None:
+    """Change the CircuitBreaker settings, e.g. open_seconds=30, and reset all breakers."""
+    with _lock:
+        _config.update(settings)
+        _breakers.clear()
+
+
+def breaker_stats() -> dict[str, dict[str, Any]]:
+    """State and counters keyed by "host/family"."""
+    with _lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.stats() for b in breakers}
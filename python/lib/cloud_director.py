@@ -1,9 +1,14 @@
+import contextvars
 import logging
 import time
 
-from typing import Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, Optional
+from lib.metrics import operation
+from lib.http_cache import cache_responses
 from lib.requests_session import requests_session
-from multiprocessing.pool import ThreadPool
+from lib.pagination import CLOUDAPI, LEGACY_QUERY, paginate
+from lib.tasks import COMPLETED_STATUS, TaskError, TaskTracker
 
 from lxml import objectify
 from lxml import etree
@@ -11,86 +16,89 @@ from lxml import etree
 log = logging.getLogger(__name__)
 pageSize = 128
 
-def wait_for_task(vmware_access_token: str, task: str) -> bool:
+
+class CatalogImportError(TaskError):
+    """Catalog items failed to upload or import.
+
+    Attributes:
+        failed: Status of each failed item keyed by item name.
+        results: Result of every item, see import_catalog_items().
+    """
+
+    def __init__(self, failed: dict[str, str], results: dict[str, dict[str, Any]]) -> None:
+        super().__init__(failed)
+        self.results = results
+
+@operation
+def wait_for_task(vmware_access_token: str, task: str, timeout: Optional[float] = None) -> bool:
     """Wait for a single task to complete
 
     Args:
-        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
         vmware_access_token: A VMWare VCD Session token.
-        tasks: a list of task href
+        task: a task href
+        timeout: Seconds the task must complete in, None waits forever.
 
     Returns:
-        Boolean when all tasks have a status of success
+        True when the task has a status of success
     
     Raises:
+        TaskError: the task finished with error, was aborted or timed out.
         requests.RequestException: all Requests package exceptions
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    running_status = ['queued', 'preRunning', 'running' ]
-    completed_status = ['success', 'error', 'aborted']
-
-    #Poll each task until status = success
-
-    s = requests_session()
-    while(True):
-
-        time.sleep(1)
-        headers = {
-            "Authorization": f"Bearer {vmware_access_token}",
-            "Accept": "application/*+json;version=38.0"
-        }
-
-        log.debug(f"Getting task: {task}")
+    return wait_for_tasks(vmware_access_token, [task], timeout)
 
-        r = s.get(url=task, headers=headers)
-        r.raise_for_status()
+@operation
+def wait_for_tasks(vmware_access_token: str, tasks: list, timeout: Optional[float] = None,
+                   on_progress: Optional[Callable[[str, str, dict[str, Any]], None]] = None) -> bool:
+    """Wait for a list of tasks
 
-        if r.json()["status"] in completed_status:
-            break
+    The tasks are polled together through the query service with adaptive
+    backoff, see lib.tasks.TaskTracker.
 
-    return True
-
-def wait_for_tasks(vmware_access_token: str, tasks: list) -> bool:
-    """Wait for a list of tasks
     Args:
-        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
         vmware_access_token: A VMWare VCD Session token.
         tasks: a list of task href
+        timeout: Seconds each task must complete in, None waits forever.
+        on_progress: Called as on_progress(href, status, record) when a task changes status.
+
     Returns:
-        Boolean when all tasks have a status of success
+        True when all tasks have a status of success
     
     Raises:
+        TaskError: a task finished with error, was aborted or timed out.
         requests.RequestException: all Requests package exceptions
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    #Create Thread Pool
+    tracker = TaskTracker(vmware_access_token, on_progress=on_progress)
+    for task in tasks:
+        tracker.add(task, timeout)
 
-    if len(tasks) > 0:
-        with ThreadPool(len(tasks)) as pool:
-            args = [(vmware_access_token, task) for task in tasks]
-            results = pool.starmap(wait_for_task, args)
+    tracker.wait()
 
-def query_vm(director_url: str, vmware_access_token: str, filter: str) -> dict[str, Any]:
-    """List all VM filtered by the a filter
+    return True
+
+@operation
+def iter_query_vm(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> Iterator[dict[str, Any]]:
+    """Stream all VM records filtered by a filter, page by page
 
     Args:
         director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
         vmware_access_token: A VMWare VCD Session token.
         filter: A VCD Query filter, for example, name==virtual_machine_1
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
 
-    Returns:
-       A list of Virtual Machine records
+    Yields:
+       Virtual Machine records
     
     Raises:
         requests.RequestException: all Requests package exceptions
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # request retry mechanism
-    s = requests_session()
-
     endpoint_url = "/".join([director_url, "api", "query"])
 
     headers = {
@@ -101,37 +109,22 @@ def query_vm(director_url: str, vmware_access_token: str, filter: str) -> dict[s
     params: dict[str, int | str] = {
         "filter": filter,
         "type": "vm",
-        "format": "records",
-        "pageSize": pageSize
+        "format": "records"
     }
     
     log.debug(f'Query Virtual Machines with filter: {filter}')
 
-    page_number = 0
-    record = []
-    more_pages = True
-
-    while(more_pages):
-        page_number = page_number + 1
-        log.debug(f"Getting page {page_number}")
-        params["page"] = page_number
+    return paginate(endpoint_url, headers, params, LEGACY_QUERY, pageSize, concurrency)
 
-        r = s.get(url=endpoint_url, headers=headers, params=params)
-        r.raise_for_status()
-
-        total = r.json()["total"]            
-        record = record + r.json()["record"]
-        more_pages = page_number*pageSize < total
-
-    return record
-
-def query_catalogs(director_url: str, vmware_access_token: str, filter: str) -> dict[str, Any]:
+def query_vm(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> list[dict[str, Any]]:
     """List all VM filtered by the a filter
 
     Args:
         director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
         vmware_access_token: A VMWare VCD Session token.
         filter: A VCD Query filter, for example, name==virtual_machine_1
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
 
     Returns:
        A list of Virtual Machine records
@@ -141,8 +134,26 @@ def query_catalogs(director_url: str, vmware_access_token: str, filter: str) ->
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # request retry mechanism
-    s = requests_session()
+    return list(iter_query_vm(director_url, vmware_access_token, filter, concurrency))
+
+@operation
+def iter_query_catalogs(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> Iterator[dict[str, Any]]:
+    """Stream all Catalog records filtered by a filter, page by page
+
+    Args:
+        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        filter: A VCD Query filter, for example, name==PetClinic
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
+
+    Yields:
+       Catalog records
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
 
     endpoint_url = "/".join([director_url, "api", "catalogs", "query"])
 
@@ -154,30 +165,80 @@ def query_catalogs(director_url: str, vmware_access_token: str, filter: str) ->
     params: dict[str, int | str] = {
         "filter": filter,
         "type": "catalogs",
-        "format": "records",
-        "pageSize": pageSize
+        "format": "records"
     }
     
     log.debug(f'Query Catalogs with filter: {filter}')
 
-    page_number = 0
-    record = []
-    more_pages = True
+    return paginate(endpoint_url, headers, params, LEGACY_QUERY, pageSize, concurrency)
+
+def query_catalogs(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> list[dict[str, Any]]:
+    """List all Catalogs filtered by the a filter
+
+    Args:
+        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        filter: A VCD Query filter, for example, name==PetClinic
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
+
+    Returns:
+       A list of Catalog records
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    return list(iter_query_catalogs(director_url, vmware_access_token, filter, concurrency))
 
-    while(more_pages):
-        page_number = page_number + 1
-        log.debug(f"Getting page {page_number}")
-        params["page"] = page_number
+@operation
+def iter_query_catalog_items(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> Iterator[dict[str, Any]]:
+    """Stream all Catalog Item records filtered by a filter, page by page
 
-        r = s.get(url=endpoint_url, headers=headers, params=params)
-        r.raise_for_status()
+    Args:
+        director_url: base director url, eg.: https://fradir01.vmware-solutions.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        filter: A VCD Query filter, for example, catalog==<catalog href>
+        concurrency: Number of pages fetched in parallel once the first page
+            returned the total, 1 fetches the pages one after another.
+
+    Yields:
+       Catalog Item records, with the href of their vApp template as entity
+       and a status of RESOLVED once the template is imported
+
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
 
-        total = r.json()["total"]            
-        record = record + r.json()["record"]
-        more_pages = page_number*pageSize < total
+    endpoint_url = "/".join([director_url, "api", "query"])
 
-    return record
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.1"
+    }
 
+    params: dict[str, int | str] = {
+        "filter": filter,
+        "type": "catalogItem",
+        "format": "records"
+    }
+
+    log.debug(f'Query Catalog Items with filter: {filter}')
+
+    return paginate(endpoint_url, headers, params, LEGACY_QUERY, pageSize, concurrency)
+
+def query_catalog_items(director_url: str, vmware_access_token: str, filter: str, concurrency: int = 1) -> list[dict[str, Any]]:
+    """List all Catalog Items filtered by the a filter
+
+    See iter_query_catalog_items.
+    """
+
+    return list(iter_query_catalog_items(director_url, vmware_access_token, filter, concurrency))
+
+@operation
+@cache_responses
 def get_resource(vmware_access_token: str, href: str) -> dict[str, Any]:
     """Get the JSON Record of a resource by HREF
 
@@ -210,6 +271,8 @@ def get_resource(vmware_access_token: str, href: str) -> dict[str, Any]:
     return r.json()
 
 
+@operation
+@cache_responses
 def get_vm_metadata(vmware_access_token: str, href: str) -> dict[str, Any]:
     """Get the JSON Record of a VM or VAPP referenced by the provided href/metadata
 
@@ -243,6 +306,7 @@ def get_vm_metadata(vmware_access_token: str, href: str) -> dict[str, Any]:
 
     return r.json()
 
+@operation
 def powerOff(href: str, vmware_access_token: str) -> dict[str, Any]:
     """Perform an Power Off operation on a VM or VAPP
 
@@ -274,6 +338,7 @@ def powerOff(href: str, vmware_access_token: str) -> dict[str, Any]:
 
     return r.json()
 
+@operation
 def powerOn(href: str, vmware_access_token: str) -> dict[str, Any]:
     """Perform an Power On operation on a VM or VAPP
 
@@ -305,6 +370,56 @@ def powerOn(href: str, vmware_access_token: str) -> dict[str, Any]:
 
     return r.json()
 
+def _catalog_item_body(item_name: str) -> bytes:
+    """UploadVAppTemplateParams payload for an empty catalog item."""
+
+    E = objectify.ElementMaker(
+            annotate=False,
+            namespace = 'http://www.vmware.com/vcloud/v1.5',
+            nsmap = {
+                None: 'http://www.vmware.com/vcloud/v1.5',
+                'ovf': 'http://schemas.dmtf.org/ovf/envelope/1'
+            }
+        )
+
+    body = E.UploadVAppTemplateParams(name=item_name)
+    body.append(E.Description('Created by automation'))
+
+    return etree.tostring(body, xml_declaration=True)
+
+def _catalog_body(catalog_name: str) -> bytes:
+    """AdminCatalog payload for a new catalog."""
+
+    E = objectify.ElementMaker(
+            annotate=False,
+            namespace = 'http://www.vmware.com/vcloud/v1.5',
+            nsmap = {
+                None: 'http://www.vmware.com/vcloud/v1.5'
+            }
+        )
+
+    body = E.AdminCatalog(name=catalog_name)
+    body.append(E.Description('Created via Automation'))
+
+    return etree.tostring(body, xml_declaration=True)
+
+def _upload_ovf_body(item_name: str, ovf_url: str) -> bytes:
+    """UploadVAppTemplateParams payload for an item pulled from ovf_url."""
+
+    E = objectify.ElementMaker(
+            annotate=False,
+            namespace = 'http://www.vmware.com/vcloud/v1.5',
+            nsmap = {
+                'root': 'http://www.vmware.com/vcloud/v1.5'
+            }
+    )
+
+    body = E.UploadVAppTemplateParams(name=item_name, sourceHref=ovf_url)
+    body.append(E.Description('Created via Automation'))
+
+    return etree.tostring(body, xml_declaration=True)
+
+@operation
 def create_catalog_item(catalog_href: str, vmware_access_token: str, item_name: str) -> dict[str, Any]:
     """Add an item to a Catalog
     Args:
@@ -320,22 +435,8 @@ def create_catalog_item(catalog_href: str, vmware_access_token: str, item_name:
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # Generate Payload
-
-    E = objectify.ElementMaker(
-            annotate=False,
-            namespace = 'http://www.vmware.com/vcloud/v1.5',
-            nsmap = {
-                None: 'http://www.vmware.com/vcloud/v1.5',
-                'ovf': 'http://schemas.dmtf.org/ovf/envelope/1'
-            }
-        )
-
     endpoint_url = "/".join([catalog_href, "action", "upload"])
 
-    body = E.UploadVAppTemplateParams(name=item_name)
-    body.append(E.Description('Created by automation'))
-
     log.debug(f"Composing VAPPTemplate: {item_name}")
 
     s = requests_session()
@@ -346,12 +447,13 @@ def create_catalog_item(catalog_href: str, vmware_access_token: str, item_name:
         "Content-Type": "application/vnd.vmware.vcloud.uploadVAppTemplateParams+xml"
     }
 
-    r = s.post(url=endpoint_url, headers=headers, data=etree.tostring(body, xml_declaration=True) )
+    r = s.post(url=endpoint_url, headers=headers, data=_catalog_item_body(item_name))
     r.raise_for_status()
 
     return r.json()
 
 
+@operation
 def create_catalog(director_url: str, vmware_access_token: str, org_id: str, catalog_name: str) -> dict[str, Any]:
     """Create a Catalog on an org
     Args:
@@ -368,21 +470,8 @@ def create_catalog(director_url: str, vmware_access_token: str, org_id: str, cat
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # Generate Payload
-
-    E = objectify.ElementMaker(
-            annotate=False,
-            namespace = 'http://www.vmware.com/vcloud/v1.5',
-            nsmap = {
-                None: 'http://www.vmware.com/vcloud/v1.5'
-            }
-        )
-
     endpoint_url = "/".join([director_url, "api", "admin", "org", org_id, "catalogs"])
 
-    body = E.AdminCatalog(name=catalog_name)
-    body.append(E.Description('Created via Automation'))
-
     log.debug(f"Creating  catalog: {catalog_name}")
     s = requests_session()
 
@@ -392,12 +481,13 @@ def create_catalog(director_url: str, vmware_access_token: str, org_id: str, cat
         "Content-Type": "application/vnd.vmware.admin.catalog+xml",
     }
 
-    r = s.post(url=endpoint_url, headers=headers, data=etree.tostring(body, xml_declaration=True) )
+    r = s.post(url=endpoint_url, headers=headers, data=_catalog_body(catalog_name))
     r.raise_for_status()
 
     return r.json()
 
 
+@operation
 def create_apitoken(director_url: str, vmware_access_token: str, org: str, org_id: str, token_name: str) -> str:
     """Generate a API Token name, return the token value as a string, zero length string means
        failure.
@@ -465,6 +555,116 @@ def create_apitoken(director_url: str, vmware_access_token: str, org: str, org_i
     return r.json()["refresh_token"]
     
 
+@operation
+def iter_apitokens(director_url: str, vmware_access_token: str,
+                   name: Optional[str] = None) -> Iterator[dict[str, Any]]:
+    """Stream the API Tokens (refresh tokens) of the session user, page by page
+
+    Args:
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        name: Only the token with this client name.
+
+    Yields:
+        Token records with name, id, type, owner and org, never the token value
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "tokens"])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=38.1"
+    }
+
+    params: dict[str, int | str] = {
+        "filter": "type==REFRESH" if name is None else f"type==REFRESH;name=={name}"
+    }
+
+    log.debug(f'Getting API Tokens')
+
+    return paginate(endpoint_url, headers, params, CLOUDAPI, pageSize)
+
+def list_apitokens(director_url: str, vmware_access_token: str) -> list[dict[str, Any]]:
+    """List the API Tokens (refresh tokens) of the session user
+
+    Args:
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+
+    Returns:
+        A list of token records
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    return list(iter_apitokens(director_url, vmware_access_token))
+
+@operation
+def delete_apitoken(director_url: str, vmware_access_token: str, token_id: str) -> None:
+    """Revoke an API Token and remove its OAuth client
+
+    Args:
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        token_id: The token id, eg, urn:vcloud:token:0b2a7c1e-03a4-4c2b-9e36-5a0a6ea0ff22
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    # request retry mechanism
+    s = requests_session()
+
+    endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "tokens", token_id])
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/json;version=38.1"
+    }
+
+    log.debug(f'Deleting API Token {token_id}')
+    r = s.delete(url=endpoint_url, headers=headers)
+    r.raise_for_status()
+
+@operation
+def delete_catalog_item(vmware_access_token: str, href: str) -> dict[str, Any]:
+    """Delete a catalog item and its vApp template
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        href: The href of the catalog item
+
+    Returns:
+        The delete Task
+
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    # request retry mechanism
+    s = requests_session()
+
+    headers = {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.1"
+    }
+
+    log.debug(f'Deleting Catalog Item {href}')
+    r = s.delete(url=href, headers=headers)
+    r.raise_for_status()
+
+    return r.json()
+
+
+@operation
 def upload_ovf(director_url: str, vmware_access_token: str, catalog_id: str, ovf_url: str, item_name: str) -> dict[str, Any]:
     """Create a catalog item
     Args:
@@ -483,20 +683,6 @@ def upload_ovf(director_url: str, vmware_access_token: str, catalog_id: str, ovf
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # Generate Payload
-
-    E = objectify.ElementMaker(
-            annotate=False,
-            namespace = 'http://www.vmware.com/vcloud/v1.5',
-            nsmap = {
-                'root': 'http://www.vmware.com/vcloud/v1.5'
-            }
-    )
-
-    body = E.UploadVAppTemplateParams(name=item_name, sourceHref=ovf_url)
-    body.append(E.Description('Created via Automation'))
-
-
     endpoint_url = "/".join([director_url, "api", "catalog", catalog_id, "action", "upload"])
 
     headers = {
@@ -508,30 +694,127 @@ def upload_ovf(director_url: str, vmware_access_token: str, catalog_id: str, ovf
     log.debug(f"Uploading OVF to catalog: {ovf_url}")
     s = requests_session()
 
-    r = s.post(url=endpoint_url, headers=headers, data=etree.tostring(body, xml_declaration=True) )
+    r = s.post(url=endpoint_url, headers=headers, data=_upload_ovf_body(item_name, ovf_url))
     r.raise_for_status()
 
     return r.json()
 
 
-def get_ipspaces(director_url: str, vmware_access_token: str) -> dict[str, Any]:
-    """Get a list of all IP Spaces
+def _import_task(vmware_access_token: str, catalog_item: dict[str, Any]) -> Optional[str]:
+    """Href of the import task of an uploaded catalog item, None when it has none left."""
+    tasks = (catalog_item.get("tasks") or {}).get("task")
+    if not tasks:
+        # the import task hangs off the vApp template the item points to
+        template = get_resource(vmware_access_token, catalog_item["entity"]["href"])
+        tasks = (template.get("tasks") or {}).get("task") or []
+
+    return tasks[0]["href"] if tasks else None
+
+
+@operation
+def import_catalog_items(director_url: str, vmware_access_token: str, catalog_id: str, items: dict[str, str],
+                         timeout: Optional[float] = None, concurrency: int = 4,
+                         on_item: Optional[Callable[[str, dict[str, Any]], None]] = None) -> dict[str, dict[str, Any]]:
+    """Upload OVFs to a catalog at once and wait until every import is done
+
+    The uploads are submitted concurrently, then their import tasks are
+    tracked together, see lib.tasks.TaskTracker, so the catalog is ready
+    once its slowest item is.
 
     Args:
-        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api
+        director_url: Main director URL eg. https://dirw002.eu-de.vmware.cloud.ibm.com/
         vmware_access_token: A VMWare VCD Session token.
+        catalog_id: The id of the catalog to create the items in
+        items: OVF URL of each item keyed by item name
+        timeout: Seconds each import must complete in, None waits forever.
+        concurrency: Uploads submitted at once.
+        on_item: Called as on_item(name, result) when an item is ready or failed.
 
     Returns:
-        A task object
+        Result of each item keyed by item name, with its catalog item
+        record, import task href, status ("success" when ready), error
+        and the seconds from its upload to the end of its import.
+
+    Raises:
+        CatalogImportError: items failed to upload, or their import
+            finished with error, was aborted or timed out. The others
+            are still waited for.
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors
+            while tracking the imports.
+    """
+
+    results = {name: {"name": name, "ovf_url": ovf_url, "item": None, "task": None, "status": "queued",
+                      "error": None, "started": None, "duration": None}
+               for name, ovf_url in items.items()}
+
+    def finish(name: str, status: str, error: Optional[str] = None) -> None:
+        result = results[name]
+        result.update(status=status, error=error, duration=time.monotonic() - result["started"])
+        log.debug(f"Catalog item {name} {status} in {result['duration']:.1f}s")
+        if on_item is not None:
+            on_item(name, result)
+
+    def submit(name: str) -> None:
+        result = results[name]
+        result["started"] = time.monotonic()
+        result["item"] = upload_ovf(director_url, vmware_access_token, catalog_id, items[name], name)
+        result["task"] = _import_task(vmware_access_token, result["item"])
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as executor:
+        # the copies carry the metrics operation and retry policy of the caller
+        futures = {name: executor.submit(contextvars.copy_context().run, submit, name) for name in items}
+
+    tasks = {}
+    for name, future in futures.items():
+        try:
+            future.result()
+        except Exception as e:
+            finish(name, "error", str(e))
+            continue
+        if results[name]["task"] is None:
+            finish(name, "success")
+        else:
+            tasks[results[name]["task"]] = name
+
+    def progress(href: str, status: str, record: dict[str, Any]) -> None:
+        if status.lower() in COMPLETED_STATUS:
+            finish(tasks[href], status.lower(), record.get("details") if status.lower() != "success" else None)
+
+    tracker = TaskTracker(vmware_access_token, on_progress=progress)
+    for href in tasks:
+        tracker.add(href, timeout)
+
+    try:
+        tracker.wait()
+    except TaskError as e:
+        for href, status in e.failed.items():
+            if results[tasks[href]]["status"] not in COMPLETED_STATUS:
+                finish(tasks[href], "timeout", f"import still {status} after {timeout}s")
+
+    failed = {name: r["status"] for name, r in results.items() if r["status"] != "success"}
+    if failed:
+        raise CatalogImportError(failed, results)
+
+    return results
+
+
+@operation
+def iter_ipspaces(director_url: str, vmware_access_token: str) -> Iterator[dict[str, Any]]:
+    """Stream all IP Space summaries, page by page
+
+    Args:
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+
+    Yields:
+        IP Space summaries
     
     Raises:
         requests.RequestException: all Requests package exceptions
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # request retry mechanism
-    s = requests_session()
-
     endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "ipSpaces", "summaries"])
 
     headers = {
@@ -542,28 +825,27 @@ def get_ipspaces(director_url: str, vmware_access_token: str) -> dict[str, Any]:
 
     log.debug(f'Getting IP Spaces')
 
-    params: dict[str, int | str] = {
-        "pageSize": pageSize
-    }
+    return paginate(endpoint_url, headers, {}, CLOUDAPI, pageSize)
 
-    page_number = 0
-    values = []
-    more_pages = True
-
-    while(more_pages):
-        page_number = page_number + 1
-        log.debug(f"Getting page {page_number}")
-        params["page"] = page_number
+def get_ipspaces(director_url: str, vmware_access_token: str) -> list[dict[str, Any]]:
+    """Get a list of all IP Spaces
 
-        r = s.get(url=endpoint_url, headers=headers, params=params)
-        r.raise_for_status()
+    Args:
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
 
-        total = r.json()["resultTotal"]            
-        values = values + r.json()["values"]
-        more_pages = page_number*pageSize < total
+    Returns:
+        A list of IP Space summaries
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
 
-    return values
+    return list(iter_ipspaces(director_url, vmware_access_token))
 
+@operation
+@cache_responses
 def get_ipspace(director_url: str, vmware_access_token: str, ipspace_id: str) -> dict[str, Any]:
     """Get an ip space
 
@@ -598,25 +880,23 @@ def get_ipspace(director_url: str, vmware_access_token: str, ipspace_id: str) ->
 
     return r.json()
 
-def ipspace_allocations(director_url: str, vmware_access_token: str, ipspace_id: str)  -> dict[str, Any]:
-    """Get a list of IP Allocations for a specific IP Space
+@operation
+def iter_ipspace_allocations(director_url: str, vmware_access_token: str, ipspace_id: str) -> Iterator[dict[str, Any]]:
+    """Stream the floating IP Allocations of a specific IP Space, page by page
 
     Args:
-        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
         vmware_access_token: A VMWare VCD Session token.
         ipspace_id: The ID of an IP Space, eg, urn:vcloud:ipSpace:f51bbb6f-22d0-409f-98db-b4cdead44c58
 
-    Returns:
-        A json object
+    Yields:
+        IP Space allocations
     
     Raises:
         requests.RequestException: all Requests package exceptions
             can be raised due to, e.g., connection or authorization errors.
     """
 
-    # request retry mechanism
-    s = requests_session()
-
     endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "ipSpaces", ipspace_id, "allocations"])
 
     headers = {
@@ -625,34 +905,34 @@ def ipspace_allocations(director_url: str, vmware_access_token: str, ipspace_id:
         "Content-Type": "application/json"
     }
 
-    log.debug(f'Getting IP Space Allocations')
-
     params: dict[str, int | str] = {
-        "pageSize": pageSize,
         "filter": "type==FLOATING_IP"
     }
     
     log.debug(f'Getting IP Space Allocations')
 
-    page_number = 0
-    values = []
-    more_pages = True
+    return paginate(endpoint_url, headers, params, CLOUDAPI, pageSize)
 
-    while(more_pages):
-        page_number = page_number + 1
-        log.debug(f"Getting page {page_number}")
-        params["page"] = page_number
+def ipspace_allocations(director_url: str, vmware_access_token: str, ipspace_id: str)  -> list[dict[str, Any]]:
+    """Get a list of IP Allocations for a specific IP Space
 
-        r = s.get(url=endpoint_url, headers=headers, params=params)
-        r.raise_for_status()
+    Args:
+        director_url: Resource reference, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        vmware_access_token: A VMWare VCD Session token.
+        ipspace_id: The ID of an IP Space, eg, urn:vcloud:ipSpace:f51bbb6f-22d0-409f-98db-b4cdead44c58
 
-        total = r.json()["resultTotal"]            
-        values = values + r.json()["values"]
-        more_pages = page_number*pageSize < total
+    Returns:
+        A list of IP Space allocations
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
 
-    return values
+    return list(iter_ipspace_allocations(director_url, vmware_access_token, ipspace_id))
 
 
+@operation
 def ipspaces_allocate_ip(director_url: str, vmware_access_token: str, ipspace_id: str) -> dict[str, Any]:
     """Allocate an IP Address to an IP Space
 
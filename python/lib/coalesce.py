@@ -0,0 +1,185 @@
+"""Single flight of identical concurrent GETs.
+
+During fan-outs several workers often ask for the same resource at the
+same moment, e.g. get_resource(href) on a shared VDC or get_ipspace(id).
+A GET arriving while an identical one is in flight does not send a
+request of its own: it waits for the one in flight and shares its
+response.
+
+Requests are identical when their method, URL with query parameters and
+headers, including the Authorization principal, are the same. Only GET
+and HEAD requests without a body are coalesced. A GET joining one in
+flight sees the resource as it was when that request was sent.
+
+Set VMWARE_L4_COALESCE=false, or call configure_coalescing(False), to
+send every request.
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import weakref
+from typing import Any, Awaitable, Callable, Hashable, Mapping, Optional, TypeVar
+
+T = TypeVar("T")
+
+COALESCED_METHODS = frozenset({"GET", "HEAD"})
+
+_enabled = os.environ.get("VMWARE_L4_COALESCE", "true").lower() != "false"
+
+
+def request_key(method: str, url: str, headers: Optional[Mapping[str, str]] = None,
+                params: Any = None) -> Optional[str]:
+    """Key of a request that can share the response of an identical one, None when it cannot.
+
+    Args:
+        method: HTTP method.
+        url: Request URL.
+        headers: Request headers, the Authorization header identifies the principal.
+        params: Query parameters not yet part of the URL.
+
+    Returns:
+        A digest of the request, so tokens are not kept in memory, or None.
+    """
+    if not _enabled or method.upper() not in COALESCED_METHODS:
+        return None
+    return digest(method, url, headers, params)
+
+
+def digest(method: str, url: str, headers: Optional[Mapping[str, str]] = None, params: Any = None) -> str:
+    """SHA-256 hex digest of a request, its method, URL, query parameters and headers."""
+    h = hashlib.sha256(f"{method.upper()} {url}".encode())
+    if params:
+        items = params.items() if isinstance(params, Mapping) else params
+        h.update(repr(sorted((str(k), str(v)) for k, v in items)).encode())
+    for name, value in sorted((k.lower(), v) for k, v in (headers or {}).items()):
+        h.update(f"\n{name}: {value}".encode())
+    return h.hexdigest()
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Run one call per key at a time, sharing its outcome with concurrent callers."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable[[], T]) -> tuple[T, bool]:
+        """Call func, or wait for the call of the same key in flight.
+
+        Args:
+            key: Key of the call, see request_key().
+            func: Callable doing the work.
+
+        Returns:
+            (result, shared), shared is True when the result came from
+            another caller's call.
+
+        Raises:
+            Exception: the exception raised by func, in every caller.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines of one event loop.
+
+    The call runs in a task of its own, a caller being cancelled does not
+    cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _done(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # retrieve the exception, the callers may all be gone
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Await func(), or the call of the same key in flight, see SingleFlight.do()."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+            return await asyncio.shield(task), True
+
+        task = self._calls[key] = asyncio.ensure_future(func())
+        task.add_done_callback(lambda t: self._done(key, t))
+        self.calls += 1
+        return await asyncio.shield(task), False
+
+    def stats(self) -> dict[str, int]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+_flight = SingleFlight()
+_async_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncSingleFlight]" = \
+    weakref.WeakKeyDictionary()
+
+
+def single_flight() -> SingleFlight:
+    """The SingleFlight shared by the threads of the process."""
+    return _flight
+
+
+def async_single_flight() -> AsyncSingleFlight:
+    """The AsyncSingleFlight of the running event loop."""
+    loop = asyncio.get_running_loop()
+    flight = _async_flights.get(loop)
+    if flight is None:
+        flight = _async_flights[loop] = AsyncSingleFlight()
+    return flight
+
+
+def configure_coalescing(enabled: bool) -> None:
+    """Turn the coalescing of identical GETs on or off."""
+    global _enabled
+    _enabled = enabled
+
+
+def coalesce_stats() -> dict[str, int]:
+    """Calls sent and calls served from another one, of threads and event loops together."""
+    flights = [_flight, *list(_async_flights.values())]
+    return {name: sum(f.stats()[name] for f in flights) for name in ("calls", "shared", "in_flight")}
@@ -0,0 +1,558 @@
+"""Resolution of a director site, VDC and org from their names.
+
+Every script starts from a region, a director site name and a VDC name,
+and needs the site id, the director URL, the org and its id. Resolving
+them takes list_director_sites, list_vcfaas_vdcs and a VMware session,
+4 to 5 round-trips before any real work.
+
+The ContextResolver fetches both lists of a region at once, in parallel,
+and indexes them: sites by name and id, VDCs by (site id, name) and org
+ids by (director URL, org). The lists and the org ids are kept in a
+locked JSON file for ttl seconds, so a warm script resolves its context
+without a single request.
+
+discover() does the same for every VCFaaS region concurrently, and
+merges the regions into one Discovery indexed by site and VDC name and
+id, e.g. to find the region of a VDC.
+
+A cached context can go stale, e.g. when a VDC is deleted and created
+again. A name missing from the cached lists fetches them again before
+failing, and vmware_session() fetches them again when the cached
+director answers the session POST with 401 or 404, or its host no longer
+resolves. An open circuit breaker or another network failure is raised
+as is, fetching the lists of the region would not help.
+
+The file is ~/.vmware-l4-automation/contexts.json, set
+VMWARE_L4_CONTEXT_CACHE to change it and VMWARE_L4_CONTEXT_TTL to change
+the ttl in seconds.
+"""
+
+import contextvars
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+import requests
+
+import lib.iam as iam
+import lib.vcfaas as vcfaas
+from lib.endpoints import vcfaas_regions
+from lib.local_store import JsonFileStore, state_path
+from lib.retry import retry_policy
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = float(os.environ.get("VMWARE_L4_CONTEXT_TTL", 6 * 3600))
+
+# answers of a session POST meaning the cached director or org is gone
+_STALE_STATUSES = frozenset({401, 404})
+
+
+class ContextNotFound(LookupError):
+    """No director site or VDC of that name in the region."""
+
+
+def _unresolved(e: BaseException) -> bool:
+    """Whether a connection error was caused by a host name that does not resolve."""
+    seen = set()
+    errors: list[Optional[BaseException]] = [e]
+    while errors:
+        error = errors.pop()
+        if error is None or id(error) in seen:
+            continue
+        seen.add(id(error))
+        if isinstance(error, socket.gaierror):
+            return True
+        # requests wraps the urllib3 MaxRetryError, which has the DNS error as its reason
+        errors += [getattr(error, "reason", None), error.__cause__, error.__context__,
+                   *(a for a in error.args if isinstance(a, BaseException))]
+    return False
+
+
+def director_base_url(url: str) -> str:
+    """scheme://host of a director site URL, e.g. https://dirw002.eu-de.vmware.cloud.ibm.com."""
+    u = urlparse(url)
+    return f"{u.scheme}://{u.netloc}"
+
+
+class Inventory:
+    """Director sites and VDCs of a region, indexed.
+
+    Args:
+        region: VCF as a Service region, e.g. "eu-de".
+        sites: Records of list_director_sites.
+        vdcs: Records of list_vcfaas_vdcs.
+        org_ids: Org ids keyed by "director_url|org".
+        fetched: Epoch seconds the lists were fetched at.
+    """
+
+    def __init__(self, region: str, sites: list[dict[str, Any]], vdcs: list[dict[str, Any]],
+                 org_ids: Optional[dict[str, str]] = None, fetched: Optional[float] = None) -> None:
+        self.region = region
+        self.sites = sites
+        self.vdcs = vdcs
+        self.org_ids = org_ids if org_ids is not None else {}
+        self.fetched = fetched if fetched is not None else time.time()
+
+        self.sites_by_name = {s["name"]: s for s in sites}
+        self.sites_by_id = {s["id"]: s for s in sites}
+        self.vdcs_by_name: dict[tuple[str, str], dict[str, Any]] = {}
+        self.vdcs_by_site: dict[str, list[dict[str, Any]]] = {}
+        for v in vdcs:
+            site_id = v["director_site"]["id"]
+            self.vdcs_by_name[(site_id, v["name"])] = v
+            self.vdcs_by_site.setdefault(site_id, []).append(v)
+
+    @staticmethod
+    def org_key(director_url: str, org: str) -> str:
+        return f"{director_url.rstrip('/')}|{org}"
+
+    def site(self, name: str) -> Optional[dict[str, Any]]:
+        """Site record by name, or by id."""
+        return self.sites_by_name.get(name) or self.sites_by_id.get(name)
+
+    def vdc(self, site_id: str, name: Optional[str] = None) -> Optional[dict[str, Any]]:
+        """VDC record of a site by name, the first VDC of the site without a name."""
+        if name is None:
+            vdcs = self.vdcs_by_site.get(site_id)
+            return vdcs[0] if vdcs else None
+        return self.vdcs_by_name.get((site_id, name))
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"sites": self.sites, "vdcs": self.vdcs, "org_ids": self.org_ids, "fetched": self.fetched}
+
+    @classmethod
+    def from_dict(cls, region: str, data: dict[str, Any]) -> "Inventory":
+        return cls(region, data["sites"], data["vdcs"], data.get("org_ids"), data["fetched"])
+
+
+class Context:
+    """A resolved director site, VDC and org.
+
+    Attributes:
+        region: VCF as a Service region, e.g. "eu-de".
+        site: Director site record.
+        vdc: VDC record.
+        org_id: Org id, None until known.
+        cached: Whether it was resolved from lists fetched by an earlier call.
+    """
+
+    def __init__(self, region: str, site: dict[str, Any], vdc: dict[str, Any], org_id: Optional[str],
+                 cached: bool) -> None:
+        self.region = region
+        self.site = site
+        self.vdc = vdc
+        self.org_id = org_id
+        self.cached = cached
+
+    @property
+    def site_id(self) -> str:
+        return self.site["id"]
+
+    @property
+    def site_name(self) -> str:
+        return self.site["name"]
+
+    @property
+    def vdc_name(self) -> str:
+        return self.vdc["name"]
+
+    @property
+    def director_url(self) -> str:
+        return director_base_url(self.vdc["director_site"]["url"])
+
+    @property
+    def org_name(self) -> str:
+        return self.vdc["org_name"]
+
+    @property
+    def resource_group_id(self) -> str:
+        return self.vdc["resource_group"]["id"]
+
+    @property
+    def public_ip(self) -> str:
+        return self.vdc["edges"][0]["public_ips"][0]
+
+    def __repr__(self) -> str:
+        return f"Context({self.region}, site={self.site_name}, vdc={self.vdc_name}, org={self.org_name})"
+
+
+class Discovery:
+    """Director sites and VDCs of every region, merged and indexed.
+
+    Attributes:
+        inventories: Inventory of each region that answered.
+        errors: Exception of each region that failed.
+        sites_by_id: (region, site record) by site id.
+        sites_by_name: (region, site record) pairs by site name.
+        vdcs_by_id: (region, VDC record) by VDC id.
+        vdcs_by_name: (region, VDC record) pairs by VDC name.
+    """
+
+    def __init__(self, inventories: dict[str, Inventory], errors: dict[str, Exception]) -> None:
+        self.inventories = inventories
+        self.errors = errors
+
+        self.sites_by_id: dict[str, tuple[str, dict[str, Any]]] = {}
+        self.sites_by_name: dict[str, list[tuple[str, dict[str, Any]]]] = {}
+        self.vdcs_by_id: dict[str, tuple[str, dict[str, Any]]] = {}
+        self.vdcs_by_name: dict[str, list[tuple[str, dict[str, Any]]]] = {}
+        for region, inventory in inventories.items():
+            for site in inventory.sites:
+                self.sites_by_id[site["id"]] = (region, site)
+                self.sites_by_name.setdefault(site["name"], []).append((region, site))
+            for vdc in inventory.vdcs:
+                self.vdcs_by_id[vdc["id"]] = (region, vdc)
+                self.vdcs_by_name.setdefault(vdc["name"], []).append((region, vdc))
+
+    @property
+    def sites(self) -> list[tuple[str, dict[str, Any]]]:
+        return [(region, s) for region, inventory in self.inventories.items() for s in inventory.sites]
+
+    @property
+    def vdcs(self) -> list[tuple[str, dict[str, Any]]]:
+        return [(region, v) for region, inventory in self.inventories.items() for v in inventory.vdcs]
+
+    def find_vdc(self, name: str, site_name: Optional[str] = None) -> list[Context]:
+        """Contexts of the VDCs of a name, optionally only those of a site.
+
+        Args:
+            name: VDC name.
+            site_name: Director site name, or id.
+
+        Returns:
+            A Context per matching VDC, in any region.
+        """
+        contexts = []
+        for region, vdc in self.vdcs_by_name.get(name, []):
+            inventory = self.inventories[region]
+            site = inventory.sites_by_id.get(vdc["director_site"]["id"])
+            if site is None or (site_name is not None and site_name not in (site["name"], site["id"])):
+                continue
+            org_id = inventory.org_ids.get(Inventory.org_key(director_base_url(vdc["director_site"]["url"]),
+                                                             vdc["org_name"]))
+            contexts.append(Context(region, site, vdc, org_id, cached=True))
+        return contexts
+
+
+class ContextResolver:
+    """Resolve and cache contexts per API key and region.
+
+    Args:
+        cache_path: JSON file the lists are kept in, None keeps them in
+            memory for the life of the process only.
+        ttl: Seconds the fetched lists are used for.
+    """
+
+    def __init__(self, cache_path: Optional[str], ttl: float = DEFAULT_TTL) -> None:
+        self.ttl = ttl
+        self.fetches = 0
+        self._store = JsonFileStore(cache_path) if cache_path else None
+        self._inventories: dict[str, Inventory] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @staticmethod
+    def _key(ibm_api_key: str, region: str) -> str:
+        # the API key itself is never stored
+        return f"{hashlib.sha256(ibm_api_key.encode()).hexdigest()}|{region}"
+
+    def _lock(self, key: str) -> threading.Lock:
+        # one lock per API key and region, regions are fetched in parallel
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, inventory: Optional[Inventory]) -> bool:
+        return inventory is not None and time.time() < inventory.fetched + self.ttl
+
+    def _fetch(self, ibm_api_key: str, region: str) -> Inventory:
+        ibm_iam_access_token = iam.get_ibm_iam_access_token(ibm_api_key)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # the copies carry the metrics operation and retry policy of the caller
+            sites = executor.submit(contextvars.copy_context().run, vcfaas.list_director_sites,
+                                    ibm_iam_access_token, region)
+            vdcs = executor.submit(contextvars.copy_context().run, vcfaas.list_vcfaas_vdcs,
+                                   ibm_iam_access_token, region)
+            inventory = Inventory(region, sites.result()["director_sites"], vdcs.result()["vdcs"])
+
+        self.fetches += 1
+        log.debug(f"Fetched {len(inventory.sites)} director sites and {len(inventory.vdcs)} VDCs of {region}")
+        return inventory
+
+    def _save(self, key: str, inventory: Inventory) -> None:
+        self._inventories[key] = inventory
+        if self._store is not None:
+            with self._store.update() as inventories:
+                inventories[key] = inventory.as_dict()
+
+    def inventory(self, ibm_api_key: str, region: str, refresh: bool = False) -> Inventory:
+        """The indexed sites and VDCs of a region, fetched when not cached or expired.
+
+        Args:
+            ibm_api_key: IBM IAM API key.
+            region: VCF as a Service region, e.g. "eu-de".
+            refresh: Fetch the lists even when cached ones are fresh.
+
+        Returns:
+            The Inventory of the region.
+
+        Raises:
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        key = self._key(ibm_api_key, region)
+
+        with self._lock(key):
+            inventory = self._inventories.get(key)
+            if not refresh and self._fresh(inventory):
+                return inventory
+
+            if self._store is not None:
+                # another process may have fetched them since
+                data = self._store.load().get(key)
+                if data and (inventory is None or data["fetched"] > inventory.fetched):
+                    inventory = Inventory.from_dict(region, data)
+                if not refresh and self._fresh(inventory):
+                    self._inventories[key] = inventory
+                    return inventory
+
+            previous = inventory
+            inventory = self._fetch(ibm_api_key, region)
+            if previous is not None:
+                # org ids do not change when VDCs come and go
+                inventory.org_ids.update(previous.org_ids)
+            self._save(key, inventory)
+            return inventory
+
+    def site(self, ibm_api_key: str, region: str, site_name: str) -> dict[str, Any]:
+        """Resolve a director site by name.
+
+        Args:
+            ibm_api_key: IBM IAM API key.
+            region: VCF as a Service region, e.g. "eu-de".
+            site_name: Director site name, or id.
+
+        Returns:
+            The director site record.
+
+        Raises:
+            ContextNotFound: no site of that name in the region.
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        fetches = self.fetches
+        site = self.inventory(ibm_api_key, region).site(site_name)
+        if site is None and self.fetches == fetches:
+            site = self.inventory(ibm_api_key, region, refresh=True).site(site_name)
+        if site is None:
+            raise ContextNotFound(f"Site not found : {site_name}")
+        return site
+
+    def resolve(self, ibm_api_key: str, region: str, site_name: str, vdc_name: Optional[str] = None) -> Context:
+        """Resolve a director site and VDC by name.
+
+        Args:
+            ibm_api_key: IBM IAM API key.
+            region: VCF as a Service region, e.g. "eu-de".
+            site_name: Director site name, or id.
+            vdc_name: VDC name, None for the first VDC of the site.
+
+        Returns:
+            The resolved Context.
+
+        Raises:
+            ContextNotFound: no site or VDC of that name in the region.
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        fetches = self.fetches
+        inventory = self.inventory(ibm_api_key, region)
+        cached = self.fetches == fetches
+
+        site = inventory.site(site_name)
+        vdc = inventory.vdc(site["id"], vdc_name) if site is not None else None
+        if vdc is None and cached:
+            log.debug(f"{site_name}/{vdc_name} not in the cached lists of {region}, fetching them again")
+            inventory = self.inventory(ibm_api_key, region, refresh=True)
+            cached = False
+            site = inventory.site(site_name)
+            vdc = inventory.vdc(site["id"], vdc_name) if site is not None else None
+
+        if site is None:
+            raise ContextNotFound(f"Site not found : {site_name}")
+        if vdc is None:
+            raise ContextNotFound(f"VDC not found : {vdc_name} in site {site_name}")
+
+        org_id = inventory.org_ids.get(Inventory.org_key(director_base_url(vdc["director_site"]["url"]),
+                                                         vdc["org_name"]))
+        return Context(region, site, vdc, org_id, cached)
+
+    def _remember_org_id(self, ibm_api_key: str, context: Context) -> None:
+        key = self._key(ibm_api_key, context.region)
+        with self._lock(key):
+            inventory = self._inventories.get(key)
+            if inventory is None:
+                return
+            inventory.org_ids[Inventory.org_key(context.director_url, context.org_name)] = context.org_id
+            self._save(key, inventory)
+
+    @staticmethod
+    def _stale(context: Context, e: requests.RequestException) -> bool:
+        """Whether a failed session POST means the cached director or org is gone."""
+        if isinstance(e, requests.HTTPError):
+            return e.response is not None and e.response.status_code in _STALE_STATUSES
+
+        # an open breaker or a refused connection is an outage, not a stale context
+        host = urlparse(context.director_url).hostname
+        failed = urlparse(e.request.url).hostname if e.request is not None else host
+        return failed == host and _unresolved(e)
+
+    def vmware_session(self, ibm_api_key: str, context: Context) -> vcfaas.VmwareSession:
+        """Get the VMware session of a context, resolving it again when it went stale.
+
+        The context is updated in place when it was resolved again, and its
+        org_id is set from the session.
+
+        Args:
+            ibm_api_key: IBM IAM API key.
+            context: Context returned by resolve().
+
+        Returns:
+            The VmwareSession of the context's director and org.
+
+        Raises:
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        ibm_iam_access_token = iam.get_ibm_iam_access_token(ibm_api_key)
+
+        try:
+            session = vcfaas.get_vmware_session(ibm_iam_access_token, context.director_url, context.org_name)
+        except (requests.HTTPError, requests.ConnectionError) as e:
+            if not context.cached or not self._stale(context, e):
+                raise
+            log.info(f"Cached {context} no longer resolves ({e}), resolving it again")
+            self.inventory(ibm_api_key, context.region, refresh=True)
+            fresh = self.resolve(ibm_api_key, context.region, context.site_name, context.vdc_name)
+            context.__dict__.update(fresh.__dict__)
+            session = vcfaas.get_vmware_session(ibm_iam_access_token, context.director_url, context.org_name)
+
+        if context.org_id != session.org_id:
+            context.org_id = session.org_id
+            self._remember_org_id(ibm_api_key, context)
+
+        return session
+
+    def discover(self, ibm_api_key: str, regions: Optional[list[str]] = None, refresh: bool = False,
+                 timeout: float = 30.0) -> Discovery:
+        """Fetch the director sites and VDCs of every region at once.
+
+        All regions are queried concurrently, so the discovery takes about
+        as long as the slowest region. A region that fails, or does not
+        answer within timeout seconds, is reported in Discovery.errors
+        instead of failing the discovery.
+
+        Args:
+            ibm_api_key: IBM IAM API key.
+            regions: VCF as a Service regions, all known regions by default,
+                see lib.endpoints.vcfaas_regions().
+            refresh: Fetch the lists even when cached ones are fresh.
+            timeout: Seconds after which no new attempt starts for a region.
+
+        Returns:
+            The merged Discovery of the regions.
+
+        Raises:
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors
+                of IBM Cloud IAM.
+        """
+        regions = regions or vcfaas_regions()
+
+        # one IAM token for all regions, fetched before the fan-out
+        iam.get_ibm_iam_access_token(ibm_api_key)
+
+        inventories: dict[str, Inventory] = {}
+        errors: dict[str, Exception] = {}
+        with retry_policy(deadline=timeout), ThreadPoolExecutor(max_workers=len(regions)) as executor:
+            futures = {region: executor.submit(contextvars.copy_context().run, self.inventory, ibm_api_key,
+                                               region, refresh)
+                       for region in regions}
+            for region, future in futures.items():
+                try:
+                    inventories[region] = future.result()
+                except Exception as e:
+                    log.warning(f"Discovery of VCFaaS region {region} failed: {e}")
+                    errors[region] = e
+
+        return Discovery(inventories, errors)
+
+    def invalidate(self, ibm_api_key: str, region: str) -> None:
+        """Drop the cached lists of a region."""
+        key = self._key(ibm_api_key, region)
+
+        with self._lock(key):
+            self._inventories.pop(key, None)
+            if self._store is not None:
+                with self._store.update() as inventories:
+                    inventories.pop(key, None)
+
+
+_resolver = ContextResolver(os.environ.get("VMWARE_L4_CONTEXT_CACHE", state_path("contexts.json")))
+
+
+def resolve_context(ibm_api_key: str, region: str, site_name: str, vdc_name: Optional[str] = None) -> Context:
+    """Resolve a director site and VDC by name with the process wide resolver.
+
+    Args:
+        ibm_api_key: IBM IAM API key.
+        region: VCF as a Service region, e.g. "eu-de".
+        site_name: Director site name, or id.
+        vdc_name: VDC name, None for the first VDC of the site.
+
+    Returns:
+        The resolved Context.
+
+    Raises:
+        ContextNotFound: no site or VDC of that name in the region.
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    return _resolver.resolve(ibm_api_key, region, site_name, vdc_name)
+
+
+def resolve_site(ibm_api_key: str, region: str, site_name: str) -> dict[str, Any]:
+    """Resolve a director site by name with the process wide resolver, see ContextResolver.site()."""
+
+    return _resolver.site(ibm_api_key, region, site_name)
+
+
+def discover(ibm_api_key: str, regions: Optional[list[str]] = None, refresh: bool = False) -> Discovery:
+    """Fetch the director sites and VDCs of every region with the process wide resolver.
+
+    See ContextResolver.discover().
+
+    Args:
+        ibm_api_key: IBM IAM API key.
+        regions: VCF as a Service regions, all known regions by default.
+        refresh: Fetch the lists even when cached ones are fresh.
+
+    Returns:
+        The merged Discovery of the regions.
+    """
+
+    return _resolver.discover(ibm_api_key, regions, refresh)
+
+
+def get_vmware_session(ibm_api_key: str, context: Context) -> vcfaas.VmwareSession:
+    """Get the VMware session of a context, see ContextResolver.vmware_session()."""
+
+    return _resolver.vmware_session(ibm_api_key, context)
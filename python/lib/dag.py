@@ -0,0 +1,221 @@
+"""Dependency graph executor of script steps.
+
+Scripts describe their work as steps: a name, a callable and the names
+of the steps it needs. Dag.run() starts each step as soon as the steps
+it needs are done, on a thread pool, so independent checks and actions
+overlap and a script takes the time of its critical path instead of the
+sum of its steps. A step is called with the results of the steps it
+needs as keyword arguments.
+
+When a step fails, the steps needing it are skipped, the others still
+run, and run() raises DagError once all of them finished.
+
+Steps print with echo(), whole blocks at once. capture_output() sends
+the echo() output of a context, and of the steps it runs, to a stream
+instead of stdout, e.g. to keep the logs of concurrent runs apart.
+
+Example:
+    dag = Dag()
+    dag.add("catalog", lambda: query_catalog())
+    dag.add("workspace", lambda: find_workspace())
+    dag.add("upload", lambda catalog: upload(catalog), after=["catalog"])
+    results = dag.run()
+    print(dag.summary())
+"""
+
+import contextvars
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+_echo_lock = threading.Lock()
+_output: contextvars.ContextVar[Optional[TextIO]] = contextvars.ContextVar("dag_output", default=None)
+
+
+def echo(*lines: str) -> None:
+    """Print lines in one write, so the output of concurrent steps does not interleave."""
+    stream = _output.get() or sys.stdout
+    with _echo_lock:
+        stream.write("".join(f"{line}\n" for line in lines))
+        stream.flush()
+
+
+@contextmanager
+def capture_output(stream: TextIO) -> Iterator[TextIO]:
+    """Send the echo() output of the current context, and of the steps it runs, to stream.
+
+    Args:
+        stream: Text stream, e.g. an io.StringIO or an open log file.
+
+    Yields:
+        The stream.
+    """
+    token = _output.set(stream)
+    try:
+        yield stream
+    finally:
+        _output.reset(token)
+
+
+class DagError(Exception):
+    """Steps of a Dag failed.
+
+    Attributes:
+        dag: The Dag, e.g. for its summary().
+        failures: Exception of each failed step.
+        skipped: Names of the steps skipped because a step they need failed.
+    """
+
+    def __init__(self, dag: "Dag") -> None:
+        self.dag = dag
+        self.failures = {s.name: s.error for s in dag.steps.values() if s.status == FAILED}
+        self.skipped = [s.name for s in dag.steps.values() if s.status == SKIPPED]
+        super().__init__("; ".join(f"{name}: {e}" for name, e in self.failures.items()))
+
+
+class Step:
+    """A named callable and the steps it needs."""
+
+    def __init__(self, name: str, func: Callable[..., Any], after: tuple[str, ...]) -> None:
+        self.name = name
+        self.func = func
+        self.after = after
+        self.status = PENDING
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Dag:
+    """Steps run concurrently in dependency order.
+
+    Args:
+        max_workers: Most steps running at once.
+    """
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self.max_workers = max_workers
+        self.steps: dict[str, Step] = {}
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def add(self, name: str, func: Callable[..., Any], after: Iterable[str] = ()) -> None:
+        """Add a step.
+
+        Steps can only need steps added before them, so the graph has no
+        cycle.
+
+        Args:
+            name: Step name, also the keyword its result is passed as.
+            func: Callable taking the results of the steps it needs.
+            after: Names of the steps it needs.
+
+        Raises:
+            ValueError: the name is taken or a needed step is unknown.
+        """
+        after = tuple(after)
+        if name in self.steps:
+            raise ValueError(f"Step {name} already exists")
+        unknown = [a for a in after if a not in self.steps]
+        if unknown:
+            raise ValueError(f"Step {name} needs unknown steps {unknown}")
+        self.steps[name] = Step(name, func, after)
+
+    def _call(self, step: Step) -> Any:
+        step.started = time.perf_counter()
+        try:
+            return step.func(**{a: self.steps[a].result for a in step.after})
+        finally:
+            step.finished = time.perf_counter()
+
+    def run(self) -> dict[str, Any]:
+        """Run every step, each once the steps it needs are done.
+
+        Returns:
+            Result of each step by name.
+
+        Raises:
+            DagError: steps failed, raised after the others finished.
+        """
+        self.started = time.perf_counter()
+        pending = dict(self.steps)
+        running: dict[Future, Step] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for step in list(pending.values()):
+                    statuses = [self.steps[a].status for a in step.after]
+                    if any(s in (FAILED, SKIPPED) for s in statuses):
+                        step.status = SKIPPED
+                    elif all(s == DONE for s in statuses):
+                        step.status = RUNNING
+                        # each step runs in a copy of the caller's context, e.g. its metrics operation
+                        running[executor.submit(contextvars.copy_context().run, self._call, step)] = step
+                    else:
+                        continue
+                    del pending[step.name]
+
+                if not running:
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    step = running.pop(future)
+                    try:
+                        step.result = future.result()
+                        step.status = DONE
+                    except Exception as e:
+                        step.error = e
+                        step.status = FAILED
+
+        self.finished = time.perf_counter()
+
+        if any(s.status == FAILED for s in self.steps.values()):
+            raise DagError(self)
+
+        return {name: step.result for name, step in self.steps.items()}
+
+    def critical_path(self) -> list[str]:
+        """Names of the chain of steps that set the total duration, first to last."""
+        ran = [s for s in self.steps.values() if s.finished is not None]
+        if not ran:
+            return []
+
+        path = []
+        step: Optional[Step] = max(ran, key=lambda s: s.finished)
+        while step is not None:
+            path.append(step.name)
+            needed = [self.steps[a] for a in step.after if self.steps[a].finished is not None]
+            step = max(needed, key=lambda s: s.finished) if needed else None
+        return path[::-1]
+
+    def summary(self) -> str:
+        """Table of the start, duration and status of each step, with the critical path."""
+        origin = self.started or 0.0
+        lines = [f"{'step':<24} {'status':<8} {'start (s)':>9} {'time (s)':>9}"]
+        for step in self.steps.values():
+            start = f"{step.started - origin:9.3f}" if step.started is not None else f"{'-':>9}"
+            duration = f"{step.duration:9.3f}" if step.duration is not None else f"{'-':>9}"
+            lines.append(f"{step.name:<24} {step.status:<8} {start} {duration}")
+
+        if self.started is not None and self.finished is not None:
+            total = sum(s.duration or 0.0 for s in self.steps.values())
+            lines.append(f"wall {self.finished - self.started:.3f}s, steps {total:.3f}s, "
+                         f"critical path {' > '.join(self.critical_path())}")
+        return "\n".join(lines)
@@ -0,0 +1,48 @@
+"""Base URLs of the IBM Cloud APIs the lib calls.
+
+The defaults are the public IBM Cloud endpoints. They can be pointed at
+another deployment, e.g., the local stand-in of lib.fake_cloud, with:
+
+    IBMCLOUD_IAM_URL       https://iam.cloud.ibm.com
+    VCFAAS_API_URL         https://api.{region}.vmware.cloud.ibm.com
+    VCFAAS_REGIONS         us-south,us-east,ca-tor,br-sao,eu-de,eu-fr2,eu-gb,eu-es,jp-tok,jp-osa,au-syd
+    SCHEMATICS_API_URL     https://schematics.cloud.ibm.com
+
+The environment is read on every call, so it can be changed at runtime.
+
+VCF as a Service has no API listing its regions, so discovery queries the
+VCFAAS_REGIONS list. A region missing from it is never discovered, set
+VCFAAS_REGIONS when a new region opens before the default list has it.
+"""
+
+import os
+
+# at least every region the lib and its scripts use, e.g. eu-fr2
+VCFAAS_REGIONS = ("us-south", "us-east", "ca-tor", "br-sao", "eu-de", "eu-fr2", "eu-gb", "eu-es", "jp-tok", "jp-osa",
+                  "au-syd")
+
+
+def iam_url() -> str:
+    """IBM Cloud IAM base URL."""
+    return os.environ.get("IBMCLOUD_IAM_URL", "https://iam.cloud.ibm.com").rstrip("/")
+
+
+def vcfaas_url(region: str) -> str:
+    """VCF as a Service API base URL of a region, e.g., "eu-fr2"."""
+    template = os.environ.get("VCFAAS_API_URL", "https://api.{region}.vmware.cloud.ibm.com")
+    return template.format(region=region).rstrip("/")
+
+
+def vcfaas_regions() -> list[str]:
+    """VCF as a Service regions queried by account wide discovery.
+
+    VCFAAS_REGIONS, a comma separated list, overrides the default
+    VCFAAS_REGIONS of this module, e.g. to add a region it misses.
+    """
+    regions = os.environ.get("VCFAAS_REGIONS")
+    return [r.strip() for r in regions.split(",") if r.strip()] if regions else list(VCFAAS_REGIONS)
+
+
+def schematics_url() -> str:
+    """IBM Cloud Schematics base URL."""
+    return os.environ.get("SCHEMATICS_API_URL", "https://schematics.cloud.ibm.com").rstrip("/")
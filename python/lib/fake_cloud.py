@@ -0,0 +1,938 @@
+"""Local stand-in for the IBM Cloud, VCFaaS, Cloud Director and Schematics APIs.
+
+FakeCloud serves the endpoints this project calls from one local HTTP
+server, so the lib and the scripts can be regression tested and
+benchmarked without touching production:
+
+    IAM         /identity/token, /v1/apikeys/details
+    VCFaaS      /{region}/v1/director_sites, /{region}/v1/vdcs
+    VCD         /api/query, /api/catalogs/query, /cloudapi/1.0.0/sessions,
+                /cloudapi/1.0.0/ipSpaces, /cloudapi/1.0.0/tokens, /api/task,
+                catalog create and upload, /transfer/{template}/{file},
+                /oauth/tenant/{org}/register|token
+    Schematics  /v1/workspaces
+
+Inventories are synthetic and generated on demand from a seed, so an org
+with 100k VMs costs no memory until a page of it is requested. Pagination,
+task lifecycles, latency and injected 5xx/429 errors behave like the real
+services. GET /_fake/stats returns the request count per route and the
+bytes transferred, GET /_fake/reset clears them. Point the lib at the
+server with the variables of FakeCloud.environ(), see lib.endpoints.
+
+Run it standalone with:
+
+    python -m lib.fake_cloud --port 8080 --orgs 10 --vms 100000
+"""
+
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qsl, urlparse
+
+log = logging.getLogger(__name__)
+
+_NAMESPACE = uuid.UUID("5e7b8d8e-52b0-4a35-9f8b-3c1f27d0a1c4")
+
+ERROR_STATUSES = [500, 502, 503, 504]
+
+
+class FakeCloudError(Exception):
+    """An HTTP error answer of a FakeCloud route."""
+
+    def __init__(self, status: int, message: str = "") -> None:
+        self.status = status
+        super().__init__(message or f"HTTP {status}")
+
+
+class _Org:
+    def __init__(self, cloud: "FakeCloud", index: int) -> None:
+        self.index = index
+        self.name = f"org-{index:04d}"
+        self.id = cloud._uuid("org", index)
+        self.region = cloud.regions[index % len(cloud.regions)]
+        self.vdc_id = cloud._uuid("vdc", index)
+        self.vdc_name = f"vdc-{index:04d}"
+        self.public_ip = f"150.240.{index // 250}.{index % 250 + 1}"
+        self.resource_group_id = hashlib.md5(f"rg-{cloud.seed}-{index}".encode()).hexdigest()
+        self.catalogs: dict[str, dict[str, Any]] = {}
+        self.allocations: list[dict[str, Any]] = []
+
+
+class _Task:
+    def __init__(self, id: str, href: str, operation: str, org: _Org, fail: bool,
+                 duration: float, on_success: Optional[Callable[[], None]]) -> None:
+        self.id = id
+        self.href = href
+        self.operation = operation
+        self.org = org
+        self.fail = fail
+        self.started = time.monotonic()
+        self.duration = duration
+        self.on_success = on_success
+
+    def status(self) -> str:
+        elapsed = time.monotonic() - self.started
+        if elapsed < self.duration / 4:
+            return "queued"
+        if elapsed < self.duration:
+            return "running"
+        if self.on_success is not None and not self.fail:
+            self.on_success()
+            self.on_success = None
+        return "error" if self.fail else "success"
+
+
+class FakeCloud:
+    """Synthetic IBM Cloud backend state and request router.
+
+    Args:
+        orgs: Number of tenant orgs, each with one VDC.
+        vms: Number of VMs per org.
+        regions: VCFaaS regions the orgs are spread over.
+        seed: Seed of the generated ids and of the injected errors.
+        latency: Seconds added to every response.
+        jitter: Random seconds up to which are added to the latency.
+        error_rate: Fraction of requests answered with a 5xx error.
+        throttle_rate: Fraction of requests answered with 429 and Retry-After.
+        task_duration: Seconds a task takes to complete.
+        task_error_rate: Fraction of tasks that finish with error.
+        session_ttl: Seconds before a VCD session expires and returns 401.
+    """
+
+    def __init__(self, orgs: int = 1, vms: int = 10, regions: Optional[list[str]] = None,
+                 seed: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 task_duration: float = 2.0, task_error_rate: float = 0.0,
+                 session_ttl: float = 1800) -> None:
+        self.seed = seed
+        self.vms = vms
+        self.regions = regions or ["us-south"]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.task_duration = task_duration
+        self.task_error_rate = task_error_rate
+        self.session_ttl = session_ttl
+        self.base_url = ""
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counter = itertools.count(1)
+
+        self.orgs = [_Org(self, i) for i in range(orgs)]
+        self._orgs_by_name = {o.name: o for o in self.orgs}
+        self._orgs_by_id = {o.id: o for o in self.orgs}
+        self.sites = {region: {"id": self._uuid("site", region), "name": f"fake-site-{region}"}
+                      for region in self.regions}
+
+        # IAM id of each IAM token, the VCD user of its sessions
+        self._iam_tokens: dict[str, str] = {}
+        self._sessions: dict[str, tuple[_Org, float, str]] = {}
+        self._tasks: dict[str, _Task] = {}
+        self._oauth_clients: dict[str, dict[str, Any]] = {}
+        self._api_tokens: dict[str, dict[str, Any]] = {}
+        self._workspaces: dict[str, dict[str, Any]] = {}
+        self._vapp_templates: dict[str, dict[str, Any]] = {}
+
+        self._stats_lock = threading.Lock()
+        self.requests: dict[str, int] = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        self._routes: list[tuple[str, re.Pattern, str, Callable]] = []
+        self._add_routes()
+
+    # ---------------------------------------------------------------
+    # helpers
+    # ---------------------------------------------------------------
+
+    def _uuid(self, *parts: Any) -> str:
+        return str(uuid.uuid5(_NAMESPACE, "-".join(str(p) for p in (self.seed, *parts))))
+
+    def _next_id(self) -> str:
+        with self._lock:
+            return self._uuid("n", next(self._counter))
+
+    def _chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def _session(self, headers: dict[str, str]) -> tuple[_Org, float, str]:
+        auth = headers.get("authorization", "")
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else ""
+        with self._lock:
+            session = self._sessions.get(token)
+        if session is None or time.monotonic() > session[1]:
+            raise FakeCloudError(401, "session expired or unknown")
+        return session
+
+    def _session_org(self, headers: dict[str, str]) -> _Org:
+        return self._session(headers)[0]
+
+    def _require_iam(self, headers: dict[str, str]) -> None:
+        auth = headers.get("authorization", "")
+        if not auth.lower().startswith("bearer ") or auth[7:].split(";")[0] not in self._iam_tokens:
+            raise FakeCloudError(401, "invalid IAM token")
+
+    def _new_task(self, operation: str, org: _Org, on_success: Optional[Callable[[], None]] = None) -> dict[str, Any]:
+        id = self._next_id()
+        href = f"{self.base_url}/api/task/{id}"
+        task = _Task(id, href, operation, org, self._chance(self.task_error_rate),
+                     self.task_duration, on_success)
+        with self._lock:
+            self._tasks[id] = task
+        return self._task_record(task)
+
+    def _task_record(self, task: _Task) -> dict[str, Any]:
+        return {"href": task.href, "id": f"urn:vcloud:task:{task.id}", "name": "task",
+                "operationName": task.operation, "status": task.status(), "org": task.org.name}
+
+    def _vm_record(self, org: _Org, i: int) -> dict[str, Any]:
+        id = f"{self._uuid('vm', org.index)[:24]}{i:012x}"
+        return {"name": f"vm-{org.index:04d}-{i:06d}", "href": f"{self.base_url}/api/vApp/vm-{id}",
+                "status": "POWERED_ON" if i % 3 else "POWERED_OFF", "isVAppTemplate": False,
+                "containerName": f"vapp-{i // 4:06d}", "vdc": f"{self.base_url}/api/vdc/{org.vdc_id}",
+                "guestOs": "Ubuntu Linux (64-bit)", "numberOfCpus": 1 + i % 4, "memoryMB": 1024 * (1 + i % 8)}
+
+    def _vdc_record(self, org: _Org) -> dict[str, Any]:
+        site = self.sites[org.region]
+        return {"id": org.vdc_id, "name": org.vdc_name, "org_name": org.name, "crn": f"crn:fake:{org.vdc_id}",
+                "status": "ready_to_use",
+                "director_site": {"id": site["id"], "url": f"{self.base_url}/tenant/{org.name}"},
+                "edges": [{"id": self._uuid("edge", org.index), "public_ips": [org.public_ip], "type": "efficiency"}],
+                "resource_group": {"id": org.resource_group_id}}
+
+    @staticmethod
+    def _page(records: list[Any], params: dict[str, str]) -> tuple[list[Any], int, int]:
+        page = int(params.get("page", 1))
+        page_size = int(params.get("pageSize", 25))
+        return records[(page - 1) * page_size:page * page_size], page, page_size
+
+    @staticmethod
+    def _filters(params: dict[str, str]) -> list[tuple[str, str]]:
+        terms = params.get("filter", "").strip("()")
+        return [tuple(t.split("==", 1)) for t in re.split("[,;]", terms) if "==" in t]
+
+    @staticmethod
+    def _xml_name(body: bytes) -> str:
+        m = re.search(rb'\sname="([^"]*)"', body)
+        return m.group(1).decode() if m else ""
+
+    # ---------------------------------------------------------------
+    # routing
+    # ---------------------------------------------------------------
+
+    def _add_routes(self) -> None:
+        region = r"(?:/(?P<region>[a-z]+-[a-z0-9]+))?"
+        routes = [
+            ("POST", r"/identity/token", self.iam_token),
+            ("GET", r"/v1/apikeys/details", self.iam_apikey_details),
+            ("GET", region + r"/v1/director_sites", self.list_director_sites),
+            ("GET", region + r"/v1/director_sites/(?P<id>[^/]+)", self.get_director_site),
+            ("GET", region + r"/v1/vdcs", self.list_vdcs),
+            ("POST", region + r"/v1/vdcs", self.create_vdc),
+            ("DELETE", region + r"/v1/vdcs/(?P<id>[^/]+)", self.delete_vdc),
+            ("POST", r"/cloudapi/1.0.0/sessions", self.create_session),
+            ("DELETE", r"/cloudapi/1.0.0/sessions/current", self.delete_session),
+            ("GET", r"/api/query", self.query),
+            ("GET", r"/api/catalogs/query", self.query_catalogs),
+            ("GET", r"/api/catalog/(?P<id>[^/]+)", self.get_catalog),
+            ("POST", r"/api/catalog/(?P<id>[^/]+)/action/upload", self.upload),
+            ("GET", r"/api/vAppTemplate/(?P<id>[^/]+)", self.get_vapp_template),
+            ("DELETE", r"/api/catalogItem/(?P<id>[^/]+)", self.delete_catalog_item),
+            ("PUT", r"/transfer/(?P<id>[^/]+)/(?P<file>[^/]+)", self.transfer),
+            ("POST", r"/api/admin/org/(?P<id>[^/]+)/catalogs", self.create_catalog),
+            ("GET", r"/api/task/(?P<id>[^/]+)", self.get_task),
+            ("GET", r"/api/vApp/vm-(?P<id>[^/]+)", self.get_vm),
+            ("GET", r"/api/vApp/vm-(?P<id>[^/]+)/metadata", self.get_vm_metadata),
+            ("POST", r"/api/vApp/vm-(?P<id>[^/]+)/power/action/(?P<action>powerOn|powerOff)", self.power),
+            ("GET", r"/cloudapi/1.0.0/ipSpaces/summaries", self.ipspace_summaries),
+            ("GET", r"/cloudapi/1.0.0/ipSpaces/(?P<id>[^/]+)", self.get_ipspace),
+            ("GET", r"/cloudapi/1.0.0/ipSpaces/(?P<id>[^/]+)/allocations", self.ipspace_allocations),
+            ("POST", r"/cloudapi/1.0.0/ipSpaces/(?P<id>[^/]+)/allocate", self.ipspace_allocate),
+            ("GET", r"/cloudapi/1.0.0/tokens", self.list_api_tokens),
+            ("DELETE", r"/cloudapi/1.0.0/tokens/(?P<id>[^/]+)", self.delete_api_token),
+            ("POST", r"/oauth/tenant/(?P<org>[^/]+)/register", self.oauth_register),
+            ("POST", r"/oauth/tenant/(?P<org>[^/]+)/token", self.oauth_token),
+            ("GET", r"/v1/workspaces", self.list_workspaces),
+            ("POST", r"/v1/workspaces", self.create_workspace),
+            ("PUT", r"/v1/workspaces/(?P<id>[^/]+)/template_data/(?P<template>[^/]+)/values",
+             self.update_workspace_variables),
+        ]
+        for method, pattern, handler in routes:
+            template = re.sub(r"\(\?P<(\w+)>[^)]*\)", r"{\1}", pattern).replace("(?:/{region})?", "[/{region}]")
+            self._routes.append((method, re.compile(pattern + "$"), f"{method} {template}", handler))
+
+    def handle(self, method: str, path: str, headers: dict[str, str],
+               body: bytes) -> tuple[int, dict[str, str], Any]:
+        """Route a request.
+
+        Args:
+            method: HTTP method.
+            path: Request path with query string.
+            headers: Request headers with lower case names.
+            body: Request body.
+
+        Returns:
+            Status, response headers and a JSON serializable body.
+        """
+        url = urlparse(path)
+        params = dict(parse_qsl(url.query))
+
+        for route_method, pattern, name, handler in self._routes:
+            m = pattern.match(url.path)
+            if m is None or route_method != method:
+                continue
+
+            self._count(name, len(body))
+
+            if self.latency or self.jitter:
+                with self._lock:
+                    jitter = self._random.uniform(0, self.jitter)
+                time.sleep(self.latency + jitter)
+
+            if self._chance(self.throttle_rate):
+                return 429, {"Retry-After": "1"}, {"message": "Too many requests"}
+            if self._chance(self.error_rate):
+                with self._lock:
+                    status = self._random.choice(ERROR_STATUSES)
+                return status, {}, {"message": "Injected error"}
+
+            try:
+                return handler(params=params, headers=headers, body=body,
+                               **{k: v for k, v in m.groupdict().items() if v is not None})
+            except FakeCloudError as e:
+                return e.status, {}, {"message": str(e)}
+
+        self._count(f"{method} (unrouted)", len(body))
+        return 404, {}, {"message": f"No route for {method} {url.path}"}
+
+    def _count(self, route: str, bytes_in: int) -> None:
+        with self._stats_lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.bytes_in += bytes_in
+
+    def count_bytes_out(self, n: int) -> None:
+        with self._stats_lock:
+            self.bytes_out += n
+
+    def stats(self) -> dict[str, Any]:
+        """Request counts per route and bytes transferred since the last reset."""
+        with self._stats_lock:
+            return {"requests": dict(self.requests), "total_requests": sum(self.requests.values()),
+                    "bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
+    def reset_stats(self) -> None:
+        with self._stats_lock:
+            self.requests.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    def environ(self) -> dict[str, str]:
+        """Environment variables pointing lib.endpoints at this server."""
+        return {"IBMCLOUD_IAM_URL": self.base_url,
+                "VCFAAS_API_URL": self.base_url + "/{region}",
+                "VCFAAS_REGIONS": ",".join(self.regions),
+                "SCHEMATICS_API_URL": self.base_url}
+
+    # ---------------------------------------------------------------
+    # IAM
+    # ---------------------------------------------------------------
+
+    @staticmethod
+    def _iam_id(apikey: str) -> str:
+        return f"IBMid-{hashlib.md5(apikey.encode()).hexdigest()[:10]}"
+
+    def iam_token(self, params, headers, body):
+        form = dict(parse_qsl(body.decode()))
+        if not form.get("apikey"):
+            raise FakeCloudError(400, "apikey missing")
+
+        # shaped like the JWTs of IAM, callers read the iam_id claim
+        iam_id = self._iam_id(form["apikey"])
+        claims = {"iam_id": iam_id, "sub": iam_id, "jti": self._next_id(), "exp": int(time.time()) + 3600}
+        token = ".".join(base64.urlsafe_b64encode(json.dumps(part).encode()).decode().rstrip("=")
+                         for part in ({"alg": "none", "typ": "JWT"}, claims)) + ".fake"
+        with self._lock:
+            self._iam_tokens[token] = iam_id
+
+        return 200, {}, {"access_token": token, "refresh_token": "not_supported", "token_type": "Bearer",
+                         "expires_in": 3600, "expiration": int(time.time()) + 3600}
+
+    def iam_apikey_details(self, params, headers, body):
+        self._require_iam(headers)
+        apikey = headers.get("iam-apikey", "")
+        account = hashlib.md5(apikey.encode()).hexdigest()
+
+        return 200, {}, {"id": f"ApiKey-{self._uuid('apikey', apikey)}", "iam_id": self._iam_id(apikey),
+                         "account_id": account, "name": "fake-key"}
+
+    # ---------------------------------------------------------------
+    # VCFaaS
+    # ---------------------------------------------------------------
+
+    def _region(self, region: Optional[str]) -> str:
+        region = region or self.regions[0]
+        if region not in self.sites:
+            raise FakeCloudError(404, f"unknown region {region}")
+        return region
+
+    def _site_record(self, region: str) -> dict[str, Any]:
+        site = self.sites[region]
+        return {"id": site["id"], "name": site["name"], "crn": f"crn:fake:{site['id']}",
+                "status": "ready_to_use", "type": "multitenant", "region": region,
+                "pvdcs": [{"id": self._uuid("pvdc", region), "name": f"fake-pvdc-{region}",
+                           "data_center_name": f"{region}-1", "status": "ready_to_use"}]}
+
+    def list_director_sites(self, params, headers, body, region=None):
+        self._require_iam(headers)
+        region = self._region(region)
+        return 200, {}, {"director_sites": [self._site_record(region)]}
+
+    def get_director_site(self, params, headers, body, id, region=None):
+        self._require_iam(headers)
+        region = self._region(region)
+        if self.sites[region]["id"] != id:
+            raise FakeCloudError(404, f"unknown director site {id}")
+        return 200, {}, self._site_record(region)
+
+    def list_vdcs(self, params, headers, body, region=None):
+        self._require_iam(headers)
+        region = self._region(region)
+        return 200, {}, {"vdcs": [self._vdc_record(o) for o in self.orgs if o.region == region]}
+
+    def create_vdc(self, params, headers, body, region=None):
+        self._require_iam(headers)
+        payload = json.loads(body)
+        return 202, {}, {"id": self._next_id(), "name": payload["name"], "status": "creating"}
+
+    def delete_vdc(self, params, headers, body, id, region=None):
+        self._require_iam(headers)
+        return 202, {}, {"id": id, "status": "deleting"}
+
+    # ---------------------------------------------------------------
+    # VCD sessions, OAuth clients and API tokens
+    # ---------------------------------------------------------------
+
+    def create_session(self, params, headers, body):
+        auth = headers.get("authorization", "")
+        m = re.match(r"Bearer ([^;]+); org=(.+)", auth)
+        if m is None or m.group(1) not in self._iam_tokens:
+            raise FakeCloudError(401, "invalid IAM token")
+        org = self._orgs_by_name.get(m.group(2))
+        if org is None:
+            # like VCD, an org the user has no access to is bad credentials
+            raise FakeCloudError(401, f"no access to org {m.group(2)}")
+
+        token = f"vcd-{self._next_id()}"
+        with self._lock:
+            # each IAM user signs in as its own VCD user of the org
+            user = self._iam_tokens[m.group(1)]
+            self._sessions[token] = (org, time.monotonic() + self.session_ttl, user)
+
+        return 200, {"X-VMWARE-VCLOUD-ACCESS-TOKEN": token, "X-VMWARE-VCLOUD-TOKEN-TYPE": "Bearer"}, {
+            "id": self._next_id(), "site": {"name": "fake"},
+            "user": {"name": user, "id": f"urn:vcloud:user:{self._uuid('user', org.index, user)}"},
+            "org": {"name": org.name, "id": f"urn:vcloud:org:{org.id}"},
+            "sessionIdleTimeoutMinutes": int(self.session_ttl // 60)}
+
+    def delete_session(self, params, headers, body):
+        self._session_org(headers)
+        with self._lock:
+            self._sessions.pop(headers["authorization"][len("Bearer "):], None)
+        return 204, {}, None
+
+    def oauth_register(self, params, headers, body, org):
+        session_org, _, user = self._session(headers)
+        client = {"client_id": self._next_id(), "client_name": json.loads(body)["client_name"],
+                  "grant_types": ["urn:ietf:params:oauth:grant-type:jwt-bearer"], "org": session_org, "user": user}
+        with self._lock:
+            self._oauth_clients[client["client_id"]] = client
+        return 200, {}, {k: v for k, v in client.items() if k not in ("org", "user")}
+
+    def oauth_token(self, params, headers, body, org):
+        self._session_org(headers)
+        form = dict(parse_qsl(body.decode()))
+        with self._lock:
+            client = self._oauth_clients.get(form.get("client_id", ""))
+        if client is None:
+            raise FakeCloudError(400, "unknown client")
+
+        id = self._next_id()
+        with self._lock:
+            self._api_tokens[id] = {"name": client["client_name"], "id": f"urn:vcloud:token:{id}",
+                                    "type": "REFRESH", "org": client["org"], "user": client["user"]}
+        return 200, {}, {"refresh_token": f"refresh-{id}", "token_type": "API Token"}
+
+    def list_api_tokens(self, params, headers, body):
+        # like VCD, only the tokens of the session user
+        org, _, user = self._session(headers)
+        name = dict(self._filters(params)).get("name")
+        with self._lock:
+            tokens = [{"name": t["name"], "id": t["id"], "type": t["type"], "token": None,
+                       "org": {"name": org.name, "id": f"urn:vcloud:org:{org.id}"},
+                       "owner": {"name": t["user"]}}
+                      for t in self._api_tokens.values()
+                      if t["org"] is org and t["user"] == user and name in (None, t["name"])]
+        values, page, page_size = self._page(tokens, params)
+        return 200, {}, {"resultTotal": len(tokens), "pageCount": -(-len(tokens) // page_size),
+                         "page": page, "pageSize": page_size, "values": values}
+
+    def delete_api_token(self, params, headers, body, id):
+        self._session_org(headers)
+        with self._lock:
+            if self._api_tokens.pop(id.split(":")[-1], None) is None:
+                raise FakeCloudError(404, f"unknown token {id}")
+        return 204, {}, None
+
+    # ---------------------------------------------------------------
+    # VCD query service, catalogs and tasks
+    # ---------------------------------------------------------------
+
+    def query(self, params, headers, body):
+        org = self._session_org(headers)
+        kind = params.get("type")
+
+        if kind == "vm":
+            return self._query_vms(org, params)
+        if kind == "task":
+            hrefs = {v for k, v in self._filters(params) if k == "href"}
+            ids = {h.rsplit("/", 1)[-1] for h in hrefs}
+            with self._lock:
+                tasks = [t for t in self._tasks.values() if t.org is org and (not ids or t.id in ids)]
+            records = [self._task_record(t) for t in tasks]
+            return self._records_page(records, params)
+        if kind in ("catalog", "catalogs"):
+            return self.query_catalogs(params, headers, body)
+        if kind == "catalogItem":
+            return self._query_catalog_items(org, params)
+
+        raise FakeCloudError(400, f"unsupported query type {kind}")
+
+    def _query_vms(self, org: _Org, params: dict[str, str]):
+        filters = dict(self._filters(params))
+        page = int(params.get("page", 1))
+        page_size = int(params.get("pageSize", 25))
+
+        name = filters.get("name")
+        if name is not None:
+            m = re.fullmatch(rf"vm-{org.index:04d}-(\d+)", name)
+            indexes = [int(m.group(1))] if m and int(m.group(1)) < self.vms else []
+            total = len(indexes)
+            indexes = indexes[(page - 1) * page_size:page * page_size]
+        elif filters.get("isVAppTemplate") == "true":
+            total = 0
+            indexes = []
+        else:
+            total = self.vms
+            indexes = range((page - 1) * page_size, min(page * page_size, total))
+
+        return 200, {}, {"total": total, "page": page, "pageSize": page_size,
+                         "record": [self._vm_record(org, i) for i in indexes]}
+
+    def _query_catalog_items(self, org: _Org, params: dict[str, str]):
+        catalog_href = dict(self._filters(params)).get("catalog")
+        with self._lock:
+            items = [(c, i, self._vapp_templates.get(i["template"])) for c in org.catalogs.values()
+                     if catalog_href in (None, c["href"]) for i in c["items"]]
+        statuses = {8: "RESOLVED", 0: "UNRESOLVED", -1: "FAILED_CREATION"}
+        records = [{"name": i["name"], "href": i["href"], "catalog": c["href"], "catalogName": c["name"],
+                    "entity": t["href"], "entityType": "vapptemplate",
+                    "status": statuses[self._template_status(t)] if t else "FAILED_CREATION"}
+                   for c, i, t in items]
+        return self._records_page(records, params)
+
+    def _records_page(self, records: list[dict[str, Any]], params: dict[str, str]):
+        values, page, page_size = self._page(records, params)
+        return 200, {}, {"total": len(records), "page": page, "pageSize": page_size, "record": values}
+
+    def query_catalogs(self, params, headers, body):
+        org = self._session_org(headers)
+        name = dict(self._filters(params)).get("name")
+        with self._lock:
+            catalogs = [c for c in org.catalogs.values() if name is None or c["name"] == name]
+        records = [{"name": c["name"], "href": c["href"], "numberOfVAppTemplates": len(c["items"])}
+                   for c in catalogs]
+        return self._records_page(records, params)
+
+    def _catalog(self, org: _Org, id: str) -> dict[str, Any]:
+        with self._lock:
+            catalog = org.catalogs.get(id)
+        if catalog is None:
+            raise FakeCloudError(404, f"unknown catalog {id}")
+        return catalog
+
+    def get_catalog(self, params, headers, body, id):
+        catalog = self._catalog(self._session_org(headers), id)
+        with self._lock:
+            items = [{"name": i["name"], "href": i["href"]} for i in catalog["items"]]
+        return 200, {}, {"name": catalog["name"], "id": catalog["id"], "href": catalog["href"],
+                         "catalogItems": {"catalogItem": items}}
+
+    def create_catalog(self, params, headers, body, id):
+        org = self._session_org(headers)
+        if id != org.id:
+            raise FakeCloudError(403, f"no access to org {id}")
+
+        name = self._xml_name(body)
+        with self._lock:
+            if any(c["name"] == name for c in org.catalogs.values()):
+                raise FakeCloudError(400, f"catalog {name} already exists")
+
+        catalog_id = self._next_id()
+        task = self._new_task("catalogCreateCatalog", org)
+        catalog = {"name": name, "id": f"urn:vcloud:catalog:{catalog_id}",
+                   "href": f"{self.base_url}/api/catalog/{catalog_id}", "items": []}
+        with self._lock:
+            org.catalogs[catalog_id] = catalog
+
+        return 201, {}, {"name": name, "id": catalog["id"], "href": catalog["href"],
+                         "tasks": {"task": [task]}}
+
+    def upload(self, params, headers, body, id):
+        org = self._session_org(headers)
+        catalog = self._catalog(org, id)
+
+        name = self._xml_name(body)
+        template_id = self._next_id()
+        template_href = f"{self.base_url}/api/vAppTemplate/vappTemplate-{template_id}"
+        item_id = self._next_id()
+        item = {"name": name, "id": f"urn:vcloud:catalogitem:{item_id}",
+                "href": f"{self.base_url}/api/catalogItem/{item_id}"}
+
+        template = {"name": name, "id": f"urn:vcloud:vapptemplate:{template_id}", "href": template_href,
+                    "task_id": None, "org": org}
+        if b"sourceHref" in body:
+            task = self._new_task("vdcUploadOvfContents", org)
+            template["task_id"] = task["id"].split(":")[-1]
+        else:
+            # pushed by the client: the import starts once the descriptor and its files are uploaded
+            template["_files"] = {"descriptor.ovf": {"size": -1, "received": {}, "data": {}}}
+        with self._lock:
+            self._vapp_templates[f"vappTemplate-{template_id}"] = template
+            # like VCD, the item is listed at once, its template resolves when the import is done
+            catalog["items"].append({**item, "template": f"vappTemplate-{template_id}"})
+
+        return 201, {}, {**item, "entity": {"href": template_href, "name": name,
+                                             "type": "application/vnd.vmware.vcloud.vAppTemplate+xml"}}
+
+    def _template_status(self, template: dict[str, Any]) -> int:
+        """VCD status of a vApp template, 8 resolved, 0 unresolved and -1 failed creation."""
+        with self._lock:
+            task = self._tasks.get(template["task_id"]) if template["task_id"] else None
+        if task is None:
+            return 0
+        status = task.status()
+        return 8 if status == "success" else -1 if status in ("error", "aborted") else 0
+
+    def delete_catalog_item(self, params, headers, body, id):
+        org = self._session_org(headers)
+        with self._lock:
+            for catalog in org.catalogs.values():
+                item = next((i for i in catalog["items"] if i["id"].endswith(f":{id}")), None)
+                if item is not None:
+                    catalog["items"].remove(item)
+                    self._vapp_templates.pop(item["template"], None)
+                    break
+            else:
+                raise FakeCloudError(404, f"unknown catalog item {id}")
+        return 202, {}, self._new_task("catalogDeleteCatalogItem", org)
+
+    def get_vapp_template(self, params, headers, body, id):
+        org = self._session_org(headers)
+        with self._lock:
+            template = self._vapp_templates.get(id)
+            task = self._tasks.get(template["task_id"]) if template and template["task_id"] else None
+        if template is None or template["org"] is not org:
+            raise FakeCloudError(404, f"unknown vAppTemplate {id}")
+
+        record = {k: v for k, v in template.items() if k not in ("task_id", "org") and not k.startswith("_")}
+        record["status"] = self._template_status(template)
+        if "_files" in template:
+            with self._lock:
+                files = [{"name": n, "size": f["size"], "bytesTransferred": sum(f["received"].values()),
+                          "link": [{"rel": "upload:default", "href": f"{self.base_url}/transfer/{id}/{n}"}]}
+                         for n, f in template["_files"].items()]
+            record["files"] = {"file": files}
+            record["ovfDescriptorUploaded"] = files[0]["bytesTransferred"] == files[0]["size"]
+        if task is not None:
+            record["tasks"] = {"task": [self._task_record(task)]}
+        return 200, {}, record
+
+    def transfer(self, params, headers, body, id, file):
+        org = self._session_org(headers)
+        with self._lock:
+            template = self._vapp_templates.get(id)
+            f = template.get("_files", {}).get(file) if template else None
+        if f is None or template["org"] is not org:
+            raise FakeCloudError(404, f"unknown transfer {id}/{file}")
+
+        start, total = 0, len(body)
+        m = re.match(r"bytes (\d+)-(\d+)/(\d+)$", headers.get("content-range", ""))
+        if m:
+            start, end, total = (int(g) for g in m.groups())
+            if end - start + 1 != len(body):
+                raise FakeCloudError(400, f"Content-Range {m.group(0)} does not match {len(body)} bytes")
+
+        with self._lock:
+            if file == "descriptor.ovf":
+                f["size"] = total
+                f["data"][start] = body
+            elif total != f["size"]:
+                raise FakeCloudError(400, f"{file} has {f['size']} bytes, not {total}")
+            f["received"][start] = len(body)
+
+            descriptor = template["_files"]["descriptor.ovf"]
+            if file == "descriptor.ovf" and sum(descriptor["received"].values()) == descriptor["size"]:
+                data = b"".join(descriptor["data"][k] for k in sorted(descriptor["data"]))
+                for ref in re.findall(rb"<(?:ovf:)?File\b[^>]*>", data):
+                    href = re.search(rb'href="([^"]+)"', ref).group(1).decode()
+                    size = re.search(rb'size="(\d+)"', ref)
+                    template["_files"].setdefault(href, {"size": int(size.group(1)) if size else 0, "received": {}})
+
+            complete = all(sum(x["received"].values()) == x["size"] for x in template["_files"].values())
+            ready = complete and not template.get("_ready")
+            template["_ready"] = complete
+
+        if ready:
+            task = self._new_task("vdcUploadOvfContents", org)
+            with self._lock:
+                template["task_id"] = task["id"].split(":")[-1]
+
+        return 200, {}, None
+
+    def get_task(self, params, headers, body, id):
+        org = self._session_org(headers)
+        with self._lock:
+            task = self._tasks.get(id)
+        if task is None or task.org is not org:
+            raise FakeCloudError(404, f"unknown task {id}")
+        return 200, {}, self._task_record(task)
+
+    def _vm(self, org: _Org, id: str) -> dict[str, Any]:
+        # the last 12 hex digits of a VM id are its index in the org
+        if id[:24] == self._uuid("vm", org.index)[:24] and int(id[24:], 16) < self.vms:
+            return self._vm_record(org, int(id[24:], 16))
+        raise FakeCloudError(404, f"unknown vm {id}")
+
+    def get_vm(self, params, headers, body, id):
+        return 200, {}, self._vm(self._session_org(headers), id)
+
+    def get_vm_metadata(self, params, headers, body, id):
+        vm = self._vm(self._session_org(headers), id)
+        return 200, {}, {"href": f"{vm['href']}/metadata", "metadataEntry": [
+            {"key": "owner", "typedValue": {"value": "fake-user"}}]}
+
+    def power(self, params, headers, body, id, action):
+        org = self._session_org(headers)
+        self._vm(org, id)
+        return 202, {}, self._new_task(f"vappPower{action[5:]}", org)
+
+    # ---------------------------------------------------------------
+    # VCD IP spaces
+    # ---------------------------------------------------------------
+
+    def _ipspace_id(self) -> str:
+        return f"urn:vcloud:ipSpace:{self._uuid('ipspace')}"
+
+    def ipspace_summaries(self, params, headers, body):
+        self._session_org(headers)
+        values, page, page_size = self._page([{"id": self._ipspace_id(), "name": "fake-public"}], params)
+        return 200, {}, {"resultTotal": 1, "pageCount": 1, "page": page, "pageSize": page_size, "values": values}
+
+    def get_ipspace(self, params, headers, body, id):
+        self._session_org(headers)
+        if id != self._ipspace_id():
+            raise FakeCloudError(404, f"unknown IP space {id}")
+        return 200, {}, {"id": id, "name": "fake-public", "type": "PUBLIC",
+                         "ipSpaceInternalScope": ["150.240.0.0/16"]}
+
+    def ipspace_allocations(self, params, headers, body, id):
+        org = self._session_org(headers)
+        with self._lock:
+            allocations = list(org.allocations)
+        values, page, page_size = self._page(allocations, params)
+        return 200, {}, {"resultTotal": len(allocations), "pageCount": -(-len(allocations) // page_size),
+                         "page": page, "pageSize": page_size, "values": values}
+
+    def ipspace_allocate(self, params, headers, body, id):
+        org = self._session_org(headers)
+
+        def allocate() -> None:
+            with self._lock:
+                org.allocations.append({"id": self._uuid("allocation", org.index), "type": "FLOATING_IP",
+                                        "value": org.public_ip})
+
+        task = self._new_task("ipSpaceAllocate", org, on_success=allocate)
+        return 202, {"Location": task["href"]}, None
+
+    # ---------------------------------------------------------------
+    # Schematics
+    # ---------------------------------------------------------------
+
+    def list_workspaces(self, params, headers, body):
+        self._require_iam(headers)
+        with self._lock:
+            workspaces = list(self._workspaces.values())
+        return 200, {}, {"count": len(workspaces), "workspaces": workspaces}
+
+    def create_workspace(self, params, headers, body):
+        self._require_iam(headers)
+        payload = json.loads(body)
+        id = f"us-south.workspace.{payload['name']}.{self._next_id()[:8]}"
+        workspace = {"id": id, "name": payload["name"], "resource_group": payload.get("resource_group"),
+                     "template_data": [{"id": self._next_id(), "folder": t.get("folder")}
+                                       for t in payload.get("template_data", [])],
+                     "status": "INACTIVE"}
+        with self._lock:
+            self._workspaces[id] = workspace
+        return 201, {}, workspace
+
+    def update_workspace_variables(self, params, headers, body, id, template):
+        self._require_iam(headers)
+        with self._lock:
+            if id not in self._workspaces:
+                raise FakeCloudError(404, f"unknown workspace {id}")
+        return 200, {}, {"variablestore": json.loads(body)["variablestore"]}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cloud: FakeCloud
+
+    def _serve(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        headers = {k.lower(): v for k, v in self.headers.items()}
+
+        if self.path == "/_fake/stats":
+            status, response_headers, payload = 200, {}, self.cloud.stats()
+        elif self.path == "/_fake/reset":
+            self.cloud.reset_stats()
+            status, response_headers, payload = 204, {}, None
+        else:
+            status, response_headers, payload = self.cloud.handle(self.command, self.path, headers, body)
+
+        data = b"" if payload is None else json.dumps(payload).encode()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.command == "GET" and status == 200 and headers.get("if-none-match") == etag:
+            status, data = 304, b""
+
+        self.send_response(status)
+        for k, v in response_headers.items():
+            self.send_header(k, v)
+        if self.command == "GET" and status in (200, 304):
+            self.send_header("ETag", etag)
+        if data:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.cloud.count_bytes_out(len(data))
+
+    do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+    def log_message(self, format: str, *args: Any) -> None:
+        log.debug(format % args)
+
+
+class FakeCloudServer:
+    """A FakeCloud served on a local port in a background thread.
+
+    Args:
+        cloud: The backend state, a default FakeCloud when None.
+        host: Address to listen on.
+        port: Port to listen on, 0 picks a free one.
+    """
+
+    def __init__(self, cloud: Optional[FakeCloud] = None, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.cloud = cloud or FakeCloud()
+        handler = type("Handler", (_Handler,), {"cloud": self.cloud})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self.cloud.base_url = f"http://{host}:{self._server.server_port}"
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return self.cloud.base_url
+
+    def start(self) -> "FakeCloudServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeCloudServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def parse_arg() -> argparse.Namespace:
+    """Parse input arguments.
+
+    Returns:
+        argparse object with parsed arguments.
+    """
+
+    parser = argparse.ArgumentParser(prog="fake_cloud")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--orgs", type=int, default=1, help="Number of tenant orgs")
+    parser.add_argument("--vms", type=int, default=10, help="Number of VMs per org")
+    parser.add_argument("--regions", default="us-south", help="Comma separated VCFaaS regions")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of generated ids and errors")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 5xx responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--task-duration", type=float, default=2.0, help="Seconds a task runs")
+    parser.add_argument("--task-error-rate", type=float, default=0.0, help="Fraction of failing tasks")
+
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_arg()
+
+    cloud = FakeCloud(orgs=args.orgs, vms=args.vms, regions=args.regions.split(","), seed=args.seed,
+                      latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                      throttle_rate=args.throttle_rate, task_duration=args.task_duration,
+                      task_error_rate=args.task_error_rate)
+    server = FakeCloudServer(cloud, args.host, args.port)
+
+    print(f"Serving fake IBM Cloud on {server.url}, use it with:")
+    for k, v in cloud.environ().items():
+        print(f"    export {k}='{v}'")
+    print(f"Orgs: {', '.join(f'{o.name}/{o.vdc_name} ({o.region})' for o in cloud.orgs[:5])}"
+          f"{', ...' if len(cloud.orgs) > 5 else ''}")
+
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,228 @@
+"""Conditional GET cache of HTTP responses.
+
+Lib functions re-reading resources that rarely change, e.g.
+get_resource(href) during inventory sweeps, are marked with
+cache_responses. Their GET responses carrying an ETag or a Last-Modified
+header are kept, and the next identical GET is sent with If-None-Match
+or If-Modified-Since. A 304 answer is then served from the cache, so an
+unchanged resource costs its headers instead of its body.
+
+Entries are keyed like lib.coalesce keys requests: method, URL and
+headers, so each principal only ever sees what it was allowed to read.
+The cache is a LRU bounded by entries and by body bytes, set with
+VMWARE_L4_CACHE_ENTRIES and VMWARE_L4_CACHE_BYTES or configure_cache().
+"""
+
+import contextvars
+import functools
+import inspect
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Mapping, Optional, TypeVar
+
+from lib import coalesce
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("VMWARE_L4_CACHE_ENTRIES", 1024))
+DEFAULT_MAX_BYTES = int(os.environ.get("VMWARE_L4_CACHE_BYTES", 64 * 1024 * 1024))
+
+# headers of a 304 that replace the stored ones, RFC 9111 4.3.4
+_UPDATED_HEADERS = ("cache-control", "date", "etag", "expires", "last-modified", "vary")
+
+_caching: contextvars.ContextVar[bool] = contextvars.ContextVar("cache_responses", default=False)
+
+
+class CachedResponse:
+    """A stored 200 response."""
+
+    def __init__(self, status: int, headers: Mapping[str, str], body: bytes, url: str) -> None:
+        self.status = status
+        self.headers = dict(headers)
+        self.body = body
+        self.url = url
+
+    @property
+    def validators(self) -> dict[str, str]:
+        """Conditional request headers revalidating the response."""
+        headers = {k.lower(): v for k, v in self.headers.items()}
+        validators = {}
+        if "etag" in headers:
+            validators["If-None-Match"] = headers["etag"]
+        if "last-modified" in headers:
+            validators["If-Modified-Since"] = headers["last-modified"]
+        return validators
+
+    def refresh(self, headers: Mapping[str, str]) -> None:
+        """Update the stored headers from a 304 answer."""
+        for name, value in headers.items():
+            if name.lower() in _UPDATED_HEADERS:
+                for stored in [k for k in self.headers if k.lower() == name.lower()]:
+                    del self.headers[stored]
+                self.headers[name] = value
+
+
+def cacheable(status: int, headers: Mapping[str, str]) -> bool:
+    """Whether a response can be stored and revalidated."""
+    lowered = {k.lower(): v for k, v in headers.items()}
+    if status != 200 or "no-store" in lowered.get("cache-control", ""):
+        return False
+    return "etag" in lowered or "last-modified" in lowered
+
+
+class ResponseCache:
+    """Thread safe LRU of CachedResponse bounded by entries and body bytes.
+
+    Args:
+        max_entries: Most responses kept.
+        max_bytes: Most body bytes kept, larger bodies are not stored.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_bytes:
+            self.discard(key)
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                self.evictions += 1
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.body)
+
+    def record(self, hit: bool) -> None:
+        """Count a revalidation answered with 304, or a full response."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+_cache = ResponseCache()
+
+
+def response_cache() -> ResponseCache:
+    """The process wide ResponseCache."""
+    return _cache
+
+
+def cache_key(method: str, url: str, headers: Optional[Mapping[str, str]] = None,
+              params: Any = None) -> Optional[str]:
+    """Key of a request whose response is cached, None when caching is off or it is not a GET."""
+    if not _caching.get() or method.upper() != "GET":
+        return None
+    return coalesce.digest(method, url, headers, params)
+
+
+def configure_cache(max_entries: Optional[int] = None, max_bytes: Optional[int] = None) -> None:
+    """Change the bounds of the cache and empty it.
+
+    Args:
+        max_entries: Most responses kept, 0 turns the cache off.
+        max_bytes: Most body bytes kept.
+    """
+    if max_entries is not None:
+        _cache.max_entries = max_entries
+    if max_bytes is not None:
+        _cache.max_bytes = max_bytes
+    _cache.clear()
+
+
+def cache_stats() -> dict[str, int]:
+    """Entries, bytes, 304 hits, full responses and evictions of the cache."""
+    return _cache.stats()
+
+
+class _CacheResponses:
+    def __init__(self) -> None:
+        self._tokens: list[contextvars.Token] = []
+
+    def __enter__(self) -> ResponseCache:
+        self._tokens.append(_caching.set(True))
+        return _cache
+
+    def __exit__(self, *exc: Any) -> None:
+        _caching.reset(self._tokens.pop())
+
+    def __call__(self, func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = _caching.set(True)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _caching.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _caching.set(True)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _caching.reset(token)
+
+        return wrapper
+
+
+def cache_responses(func: Optional[F] = None) -> Any:
+    """Revalidate the GETs of a function or a block against the cache.
+
+    Example:
+        @cache_responses
+        def get_resource(...): ...
+
+        with cache_responses():
+            vdc = s.get(href, headers=headers).json()
+
+    Args:
+        func: The function to decorate, None for a context manager.
+
+    Returns:
+        The decorated function, or a context manager.
+    """
+    if func is None:
+        return _CacheResponses()
+    return _CacheResponses()(func)
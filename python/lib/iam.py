@@ -7,22 +7,34 @@ for a user or service ID.
 https://cloud.ibm.com/apidocs/iam-identity-token-api
 """
 
+import base64
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
 
+from lib.endpoints import iam_url
+from lib.local_store import JsonFileStore
+from lib.metrics import operation
 from lib.requests_session import requests_session
-from typing import Any
+from lib.retry import retry_policy
+from typing import Any, Optional
 
 log = logging.getLogger(__name__)
 
 
-def request_ibm_iam_access_token(ibm_api_key: str) -> str:
-    """The API call to get an IBM Cloud IAM access token.
+@operation
+@retry_policy(idempotent=True, read_timeout=30)
+def request_ibm_iam_token(ibm_api_key: str) -> dict[str, Any]:
+    """The API call to get an IBM Cloud IAM token.
 
     Args:
         ibm_api_key: IBM IAM API key.
 
     Returns:
-        IBM IAM access token.
+        IBM IAM token response, with access_token, expires_in and expiration.
 
     Raises:
         requests.RequestException: all Requests package exceptions
@@ -32,7 +44,7 @@ def request_ibm_iam_access_token(ibm_api_key: str) -> str:
     # request retry mechanism
     s = requests_session()
 
-    endpoint_url = "/".join(["https://iam.cloud.ibm.com", "identity", "token"])
+    endpoint_url = "/".join([iam_url(), "identity", "token"])
 
     payload = {
         "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
@@ -42,10 +54,28 @@ def request_ibm_iam_access_token(ibm_api_key: str) -> str:
     log.debug("Request IBM Cloud IAM access token.")
     r = s.post(url=endpoint_url, data=payload)
     r.raise_for_status()
-    log.debug(f'Got IBM Cloud IAM access token: {r.json()["access_token"][:7]}(...)')
+    token = r.json()
+    log.debug(f'Got IBM Cloud IAM access token: {token["access_token"][:7]}(...)')
+
+    return token
+
+def request_ibm_iam_access_token(ibm_api_key: str) -> str:
+    """The API call to get an IBM Cloud IAM access token.
 
-    return r.json()["access_token"]
+    Args:
+        ibm_api_key: IBM IAM API key.
 
+    Returns:
+        IBM IAM access token.
+
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    return request_ibm_iam_token(ibm_api_key)["access_token"]
+
+@operation
 def ibm_iam_apikey_details(ibm_api_key: str, ibm_iam_access_token: str) -> dict[str, Any]:
     """The API call to get the details of an API Key
 
@@ -65,7 +95,7 @@ def ibm_iam_apikey_details(ibm_api_key: str, ibm_iam_access_token: str) -> dict[
     # request retry mechanism
     s = requests_session()
 
-    endpoint_url = "https://iam.cloud.ibm.com/v1/apikeys/details"
+    endpoint_url = "/".join([iam_url(), "v1", "apikeys", "details"])
 
     headers = {"authorization": f"Bearer {ibm_iam_access_token}",
                "IAM-Apikey": ibm_api_key,
@@ -77,3 +107,172 @@ def ibm_iam_apikey_details(ibm_api_key: str, ibm_iam_access_token: str) -> dict[
     log.debug(f'Got IBM Cloud IAM access token Details: {r.json()}')
 
     return r.json()
+
+
+def iam_principal(ibm_iam_access_token: str) -> str:
+    """The IAM id of the user or service ID an IAM access token was issued to.
+
+    IAM access tokens are JWTs, the id is read from their iam_id or sub
+    claim without verifying the signature, it only tells callers apart.
+    A token that is no JWT stands for itself, by hash.
+
+    Args:
+        ibm_iam_access_token: IBM IAM access token.
+
+    Returns:
+        The IAM id, e.g. IBMid-550006ABCD.
+    """
+
+    try:
+        payload = ibm_iam_access_token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return claims.get("iam_id") or claims["sub"]
+    except (IndexError, ValueError, KeyError, TypeError, AttributeError):
+        return hashlib.sha256(ibm_iam_access_token.encode()).hexdigest()
+
+
+class IamTokenProvider:
+    """Cache of IBM Cloud IAM access tokens, refreshed ahead of expiry.
+
+    Tokens are keyed on a hash of the API key, the key itself is never
+    stored. Concurrent callers asking for the same key share a single
+    in-flight IAM request. With a cache_path the tokens are also kept in a
+    locked file, so consecutive script runs skip the IAM round-trip.
+
+    Args:
+        cache_path: Optional JSON file to persist tokens between runs.
+        refresh_margin: Seconds before expiry a token is refreshed.
+        background_refresh: Refresh tokens in a daemon thread before they
+            expire instead of on the next get_token() call.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None, refresh_margin: int = 300,
+                 background_refresh: bool = False) -> None:
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self._store = JsonFileStore(cache_path) if cache_path else None
+        self._tokens: dict[str, dict[str, Any]] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._timers: dict[str, threading.Timer] = {}
+
+    @staticmethod
+    def _key(ibm_api_key: str) -> str:
+        return hashlib.sha256(ibm_api_key.encode()).hexdigest()
+
+    def _lock(self, key: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, token: Optional[dict[str, Any]]) -> bool:
+        return token is not None and time.time() < token["refresh_at"]
+
+    def _request(self, ibm_api_key: str) -> dict[str, Any]:
+        response = request_ibm_iam_token(ibm_api_key)
+
+        now = time.time()
+        expires_at = response.get("expiration") or now + response.get("expires_in", 3600)
+        lifetime = max(expires_at - now, 0)
+
+        return {
+            "access_token": response["access_token"],
+            "expires_at": expires_at,
+            # refresh short lived tokens halfway instead of after expiry
+            "refresh_at": expires_at - min(self.refresh_margin, lifetime / 2),
+        }
+
+    def _refresh(self, ibm_api_key: str, key: str, force: bool = False) -> dict[str, Any]:
+        with self._lock(key):
+            token = self._tokens.get(key)
+            if self._fresh(token) and not force:
+                return token
+
+            if self._store is None:
+                token = self._request(ibm_api_key)
+            else:
+                # the file lock also makes concurrent processes share a refresh
+                with self._store.update() as tokens:
+                    token = tokens.get(key)
+                    if force or not self._fresh(token):
+                        token = self._request(ibm_api_key)
+                        tokens[key] = token
+
+            self._tokens[key] = token
+
+        if self.background_refresh:
+            self._schedule(ibm_api_key, key, token)
+
+        return token
+
+    def _schedule(self, ibm_api_key: str, key: str, token: dict[str, Any]) -> None:
+        def refresh() -> None:
+            try:
+                self._refresh(ibm_api_key, key, force=True)
+            except Exception as e:
+                log.warning(f"Background refresh of IBM Cloud IAM token failed: {e}")
+
+        timer = threading.Timer(max(token["refresh_at"] - time.time(), 0), refresh)
+        timer.daemon = True
+
+        with self._locks_lock:
+            previous = self._timers.pop(key, None)
+            if previous is not None:
+                previous.cancel()
+            self._timers[key] = timer
+
+        timer.start()
+
+    def get_token(self, ibm_api_key: str) -> str:
+        """Get a valid IBM Cloud IAM access token for an API key.
+
+        Args:
+            ibm_api_key: IBM IAM API key.
+
+        Returns:
+            IBM IAM access token.
+
+        Raises:
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        key = self._key(ibm_api_key)
+
+        token = self._tokens.get(key)
+        if not self._fresh(token):
+            token = self._refresh(ibm_api_key, key)
+
+        return token["access_token"]
+
+    def invalidate(self, ibm_api_key: str) -> None:
+        """Drop the cached token of an API key, e.g., after it was revoked."""
+        key = self._key(ibm_api_key)
+
+        with self._lock(key):
+            self._tokens.pop(key, None)
+            if self._store is not None:
+                with self._store.update() as tokens:
+                    tokens.pop(key, None)
+
+
+_token_provider = IamTokenProvider(cache_path=os.environ.get("VMWARE_L4_IAM_TOKEN_CACHE"))
+
+
+def get_ibm_iam_access_token(ibm_api_key: str) -> str:
+    """Get an IBM Cloud IAM access token from the process wide token cache.
+
+    The token is only requested from IAM when none is cached or the cached
+    one is about to expire. Set VMWARE_L4_IAM_TOKEN_CACHE to a file path to
+    keep tokens between script runs.
+
+    Args:
+        ibm_api_key: IBM IAM API key.
+
+    Returns:
+        IBM IAM access token.
+
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    return _token_provider.get_token(ibm_api_key)
@@ -0,0 +1,99 @@
+"""Journal of the provisioning steps a lab completed.
+
+A lab, one VDC provisioned with an API key, records each step it
+completes with the ids of the resources it created, as soon as the step
+is done. A rerun after a failure reads the journal, checks the recorded
+resources still exist with one cheap request each, and only redoes the
+steps whose resources are missing, instead of scanning and re-checking
+everything or creating duplicates.
+
+The journal is a locked JSON file, ~/.vmware-l4-automation/journal.json,
+shared by the labs of all accounts and processes; set VMWARE_L4_JOURNAL
+to change it.
+
+Example:
+    lab = journal.lab_journal(ibm_api_key, region, site_name, vdc_name)
+    catalog = lab.get("catalog")
+    if catalog is None:
+        catalog = create_catalog(...)
+        lab.record("catalog", id=catalog["id"], href=catalog["href"])
+"""
+
+import hashlib
+import logging
+import os
+import time
+from typing import Any, Optional
+
+from lib.local_store import JsonFileStore, state_path
+
+log = logging.getLogger(__name__)
+
+
+class Journal:
+    """Completed steps of one lab, written through to a JsonFileStore.
+
+    Args:
+        store: Store shared by the labs.
+        lab: Key of the lab in the store.
+    """
+
+    def __init__(self, store: JsonFileStore, lab: str) -> None:
+        self.store = store
+        self.lab = lab
+        self.steps: dict[str, dict[str, Any]] = store.load().get(lab, {})
+
+    def get(self, step: str) -> Optional[dict[str, Any]]:
+        """Resources recorded by a completed step, None when the step was not completed."""
+        return self.steps.get(step)
+
+    def record(self, step: str, **resources: Any) -> None:
+        """Record a completed step and the ids of its resources.
+
+        Args:
+            step: Step name, e.g. "catalog".
+            resources: JSON serializable ids of the resources, e.g. id and href.
+        """
+        self.steps[step] = {**resources, "completed": time.time()}
+        with self.store.update() as labs:
+            labs.setdefault(self.lab, {})[step] = self.steps[step]
+        log.debug(f"Journal {self.lab[:12]}: {step} completed {resources}")
+
+    def forget(self, step: str) -> None:
+        """Drop a step whose resources no longer exist, so it runs again."""
+        if self.steps.pop(step, None) is None:
+            return
+        with self.store.update() as labs:
+            labs.get(self.lab, {}).pop(step, None)
+        log.debug(f"Journal {self.lab[:12]}: {step} forgotten")
+
+    def clear(self) -> None:
+        """Drop every step of the lab."""
+        self.steps.clear()
+        with self.store.update() as labs:
+            labs.pop(self.lab, None)
+
+
+def lab_key(ibm_api_key: str, region: str, site_name: str, vdc_name: str) -> str:
+    """Key of a lab in the journal."""
+    # the API key itself is never stored
+    return f"{hashlib.sha256(ibm_api_key.encode()).hexdigest()}|{region}|{site_name}|{vdc_name}"
+
+
+_store = JsonFileStore(os.environ.get("VMWARE_L4_JOURNAL", state_path("journal.json")))
+
+
+def lab_journal(ibm_api_key: str, region: str, site_name: str, vdc_name: str) -> Journal:
+    """Journal of a lab in the process wide journal file.
+
+    Args:
+        ibm_api_key: IBM IAM API key.
+        region: VCF as a Service region, e.g. "eu-de".
+        site_name: Director site name.
+        vdc_name: Virtual data center name.
+
+    Returns:
+        The Journal of the lab, with the steps completed by earlier runs.
+    """
+
+    return Journal(_store, lab_key(ibm_api_key, region, site_name, vdc_name))
@@ -0,0 +1,92 @@
+"""Small locked JSON files used to keep state between script runs.
+
+Files live in ~/.vmware-l4-automation unless VMWARE_L4_STATE_DIR is set.
+They may contain credentials, so they are only readable by the owner.
+Updates take an exclusive lock on a sibling .lock file, so concurrent
+processes never interleave their writes.
+"""
+
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows, fall back to unlocked access
+    fcntl = None
+
+
+def state_dir() -> str:
+    """Directory for files kept between script runs."""
+    return os.environ.get("VMWARE_L4_STATE_DIR",
+                          os.path.join(os.path.expanduser("~"), ".vmware-l4-automation"))
+
+
+def state_path(name: str) -> str:
+    """Path of a file in state_dir()."""
+    return os.path.join(state_dir(), name)
+
+
+class JsonFileStore:
+    """A JSON object persisted in a single file.
+
+    Args:
+        path: Location of the JSON file, created on first write.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @contextmanager
+    def _lock(self, exclusive: bool) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read(self) -> dict[str, Any]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write(self, data: dict[str, Any]) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=1)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self) -> dict[str, Any]:
+        """Read the whole object under a shared lock."""
+        with self._lock(exclusive=False):
+            return self._read()
+
+    @contextmanager
+    def update(self) -> Iterator[dict[str, Any]]:
+        """Read, modify in place and write back under an exclusive lock.
+
+        Other processes block in update() until the block exits, so a
+        read-check-fetch-write sequence inside it runs only once.
+        """
+        with self._lock(exclusive=True):
+            data = self._read()
+            yield data
+            self._write(data)
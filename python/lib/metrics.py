@@ -0,0 +1,290 @@
+"""In-process metrics of the HTTP calls made by the lib.
+
+Every request sent through the shared session is recorded against the
+logical operation it belongs to, e.g. "cloud_director.iter_query_vm" for
+each page fetched by query_vm. Per operation the registry keeps:
+
+    - a latency histogram
+    - request counts by method and status code, "error" when no response
+    - the number of retries done by the transport
+    - a response size histogram
+    - the number of requests in flight and its peak
+
+Lib functions are labelled with the operation decorator; scripts can
+label a block with "with operation('petclinic.discovery'):". Requests
+outside any operation are recorded under "METHOD host".
+
+The registry renders to the Prometheus text format or to JSON. Set
+VMWARE_L4_METRICS to a .json or .prom file to dump it on exit.
+"""
+
+import atexit
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+from typing import Any, Callable, Iterator, Optional, TypeVar, Union
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_current_operation: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("operation", default=None)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values."""
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """(upper bound, count of values <= bound) pairs, ending with +Inf."""
+        total = 0
+        result = []
+        for bound, count in zip([*map(_format_number, self.buckets), "+Inf"], self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"count": self.count, "sum": self.sum, "buckets": dict(self.cumulative())}
+
+
+class OperationMetrics:
+    """Everything recorded for one operation."""
+
+    def __init__(self) -> None:
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.requests: dict[tuple[str, str], int] = {}
+        self.retries = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "requests": {f"{method} {status}": n for (method, status), n in sorted(self.requests.items())},
+            "retries": self.retries,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency_seconds": self.latency.as_dict(),
+            "response_size_bytes": self.response_size.as_dict(),
+        }
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Thread safe store of the metrics of every operation."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._operations: dict[str, OperationMetrics] = {}
+
+    def _get(self, operation: str) -> OperationMetrics:
+        metrics = self._operations.get(operation)
+        if metrics is None:
+            metrics = self._operations[operation] = OperationMetrics()
+        return metrics
+
+    def start(self, operation: str) -> None:
+        """Count a request of the operation as in flight."""
+        with self._lock:
+            metrics = self._get(operation)
+            metrics.in_flight += 1
+            metrics.max_in_flight = max(metrics.max_in_flight, metrics.in_flight)
+
+    def finish(self, operation: str, method: str, status: Union[int, str], latency: float,
+               size: Optional[int] = None, retries: int = 0) -> None:
+        """Record a completed request of the operation started with start()."""
+        with self._lock:
+            metrics = self._get(operation)
+            metrics.in_flight -= 1
+            key = (method, str(status))
+            metrics.requests[key] = metrics.requests.get(key, 0) + 1
+            metrics.retries += retries
+            metrics.latency.observe(latency)
+            if size is not None:
+                metrics.response_size.observe(size)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._operations.clear()
+
+    def as_dict(self) -> dict[str, Any]:
+        """Metrics of every operation keyed by operation name."""
+        with self._lock:
+            return {name: m.as_dict() for name, m in sorted(self._operations.items())}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=1)
+
+    def to_prometheus(self) -> str:
+        """Render in the Prometheus text exposition format."""
+        prefix = "vmware_l4_http"
+        lines = []
+
+        with self._lock:
+            operations = sorted(self._operations.items())
+
+            lines.append(f"# HELP {prefix}_requests_total HTTP requests by operation, method and status.")
+            lines.append(f"# TYPE {prefix}_requests_total counter")
+            for name, m in operations:
+                for (method, status), n in sorted(m.requests.items()):
+                    lines.append(f'{prefix}_requests_total{{operation="{_escape(name)}",method="{method}",'
+                                 f'status="{status}"}} {n}')
+
+            lines.append(f"# HELP {prefix}_retries_total Retries done by the transport.")
+            lines.append(f"# TYPE {prefix}_retries_total counter")
+            for name, m in operations:
+                lines.append(f'{prefix}_retries_total{{operation="{_escape(name)}"}} {m.retries}')
+
+            lines.append(f"# HELP {prefix}_in_flight Requests in flight.")
+            lines.append(f"# TYPE {prefix}_in_flight gauge")
+            for name, m in operations:
+                lines.append(f'{prefix}_in_flight{{operation="{_escape(name)}"}} {m.in_flight}')
+
+            lines.append(f"# HELP {prefix}_max_in_flight Peak of requests in flight.")
+            lines.append(f"# TYPE {prefix}_max_in_flight gauge")
+            for name, m in operations:
+                lines.append(f'{prefix}_max_in_flight{{operation="{_escape(name)}"}} {m.max_in_flight}')
+
+            for metric, attr, help in (("request_duration_seconds", "latency", "Request latency."),
+                                       ("response_size_bytes", "response_size", "Response body size.")):
+                lines.append(f"# HELP {prefix}_{metric} {help}")
+                lines.append(f"# TYPE {prefix}_{metric} histogram")
+                for name, m in operations:
+                    histogram = getattr(m, attr)
+                    label = f'operation="{_escape(name)}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{prefix}_{metric}_bucket{{{label},le="{bound}"}} {count}')
+                    lines.append(f"{prefix}_{metric}_sum{{{label}}} {_format_number(histogram.sum)}")
+                    lines.append(f"{prefix}_{metric}_count{{{label}}} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write to a file, in Prometheus format when it ends with .prom, else JSON."""
+        with open(path, "w") as f:
+            f.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+
+
+_registry = MetricsRegistry()
+
+
+def registry() -> MetricsRegistry:
+    """The process wide registry the transport records to."""
+    return _registry
+
+
+def current_operation() -> Optional[str]:
+    """Name of the innermost operation of the calling context, if any."""
+    return _current_operation.get()
+
+
+def _wrap_iterator(name: str, iterator: Iterator[Any]) -> Iterator[Any]:
+    # lazy results run their requests when consumed, label each step
+    try:
+        while True:
+            token = _current_operation.set(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                _current_operation.reset(token)
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+class _Operation:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._tokens: list[contextvars.Token] = []
+
+    def __enter__(self) -> "_Operation":
+        self._tokens.append(_current_operation.set(self.name))
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        _current_operation.reset(self._tokens.pop())
+
+    def __call__(self, func: F) -> F:
+        name = self.name
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                # a task runs in a copy of the context, the label stays local to it
+                token = _current_operation.set(name)
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _current_operation.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_operation.set(name)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                _current_operation.reset(token)
+            if inspect.isgenerator(result):
+                return _wrap_iterator(name, result)
+            return result
+
+        return wrapper
+
+
+def operation(name: Union[str, F]) -> Any:
+    """Label the requests of a function or a block with an operation name.
+
+    Used bare as @operation, the name is the module and function name,
+    e.g. "vcfaas.list_vcfaas_vdcs" or "aio.vcfaas.list_vcfaas_vdcs".
+    Generators returned by the function keep the label while they are
+    consumed, coroutine functions keep it until they return. Nested operations record
+    under the innermost one.
+
+    Args:
+        name: Operation name, or the function to decorate.
+
+    Returns:
+        A decorator and context manager, or the decorated function.
+    """
+    if callable(name):
+        module = name.__module__.removeprefix("lib.")
+        return _Operation(f"{module}.{name.__qualname__}")(name)
+    return _Operation(name)
+
+
+def _dump_at_exit() -> None:
+    path = os.environ.get("VMWARE_L4_METRICS")
+    if path:
+        _registry.dump(path)
+
+
+atexit.register(_dump_at_exit)
@@ -0,0 +1,388 @@
+"""Push upload of local OVF and OVA packages to a catalog.
+
+upload_ovf() has VCD pull an OVF from a public sourceHref. push_ovf()
+uploads a package from local disk instead, e.g. from a build farm,
+following the VCD transfer protocol:
+
+    1. create_catalog_item() posts the UploadVAppTemplateParams, VCD
+       creates an empty vApp template with an upload:default transfer
+       link for descriptor.ovf
+    2. the descriptor is PUT to that link, VCD reads it and lists the
+       files it references, e.g. VMDKs, each with its own transfer link
+    3. each file is PUT in chunks of chunk_size bytes with a
+       Content-Range header, up to parallel chunks at once
+    4. VCD imports the files, push_ovf() waits for the import task
+
+Files are mmapped and the chunks are sent as memoryview slices of the
+map, never copied into Python buffers; an OVA is mapped once and its
+members sliced at their offset in the tar. Each chunk is its own PUT,
+retried on its own by the transport, see lib.retry.
+
+The byte ranges sent are checkpointed in
+~/.vmware-l4-automation/uploads.json (VMWARE_L4_UPLOADS to change it),
+keyed by catalog, item name and the size and mtime of every file of the
+package. push_ovf() called again for an interrupted upload resumes it
+with the ranges still missing, whatever its chunk_size, and skips the
+files VCD reports fully transferred. Rebuilding a file of the package
+starts a new upload.
+"""
+
+import contextvars
+import hashlib
+import logging
+import mmap
+import os
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from lxml import etree
+
+import lib.cloud_director as cloud_director
+from lib.local_store import JsonFileStore, state_path
+from lib.metrics import operation
+from lib.requests_session import requests_session
+from lib.retry import retry_policy
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+DESCRIPTOR = "descriptor.ovf"
+
+
+class PackageFile:
+    """A file of an OVF package, a region of a memory map.
+
+    Args:
+        name: Name of the file in the OVF References, e.g. "disk1.vmdk".
+        data: Memory map, or bytes, holding the file.
+        offset: Offset of the file in data.
+        size: Size of the file in bytes.
+    """
+
+    def __init__(self, name: str, data: Any, offset: int, size: int) -> None:
+        self.name = name
+        self.offset = offset
+        self.size = size
+        self._data = data
+
+    def chunk(self, start: int, end: int) -> memoryview:
+        """Bytes start to end of the file, a view of the map without copy."""
+        return memoryview(self._data)[self.offset + start:self.offset + end]
+
+
+class OvfPackage:
+    """The descriptor and the files of a local .ovf, with its files next to it, or .ova.
+
+    Args:
+        path: Path of the .ovf or .ova file.
+
+    Raises:
+        ValueError: the package has no descriptor.
+        OSError: a file of the package cannot be read.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.files: dict[str, PackageFile] = {}
+        self._maps: list[mmap.mmap] = []
+        self._paths = [path]
+
+        if path.lower().endswith(".ova"):
+            self._open_ova(path)
+        else:
+            data = self._map(path)
+            self.descriptor = PackageFile(DESCRIPTOR, data, 0, os.path.getsize(path))
+            directory = os.path.dirname(path)
+            for name, _ in self.references():
+                file_path = os.path.join(directory, name)
+                self._paths.append(file_path)
+                self.files[name] = PackageFile(name, self._map(file_path), 0, os.path.getsize(file_path))
+
+    def _map(self, path: str) -> Any:
+        if os.path.getsize(path) == 0:
+            return b""
+        with open(path, "rb") as f:
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(m)
+        return m
+
+    def _open_ova(self, path: str) -> None:
+        # an OVA is a tar, its members are sliced from one map of the whole file
+        data = self._map(path)
+        with tarfile.open(path) as tar:
+            members = [m for m in tar.getmembers() if m.isfile()]
+
+        descriptors = [m for m in members if m.name.lower().endswith(".ovf")]
+        if not descriptors:
+            raise ValueError(f"{path} has no OVF descriptor")
+
+        self.descriptor = PackageFile(DESCRIPTOR, data, descriptors[0].offset_data, descriptors[0].size)
+
+        # only the files of the References are uploaded, not e.g. the .mf manifest or the .cert
+        by_name = {m.name: m for m in members}
+        for name, _ in self.references():
+            m = by_name.get(name)
+            if m is None:
+                raise ValueError(f"{path} has no file {name} referenced by its descriptor")
+            self.files[name] = PackageFile(name, data, m.offset_data, m.size)
+
+    def references(self) -> list[tuple[str, int]]:
+        """Name and size of each file the descriptor references."""
+        with self.descriptor.chunk(0, self.descriptor.size) as view:
+            root = etree.fromstring(bytes(view))
+
+        references = []
+        for f in root.xpath("//*[local-name()='References']/*[local-name()='File']"):
+            attributes = {etree.QName(k).localname: v for k, v in f.attrib.items()}
+            references.append((attributes["href"], int(attributes.get("size", 0))))
+        return references
+
+    def fingerprint(self) -> str:
+        """Identity of the package on disk, changes when any of its files is rebuilt."""
+        identity = []
+        for path in self._paths:
+            st = os.stat(path)
+            identity.append(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}")
+        return hashlib.sha256("\n".join(identity).encode()).hexdigest()
+
+    def close(self) -> None:
+        for m in self._maps:
+            m.close()
+        self._maps.clear()
+
+    def __enter__(self) -> "OvfPackage":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def _missing(sent: list[tuple[int, int]], size: int, chunk_size: int) -> list[tuple[int, int]]:
+    """Chunks, [start, end) pairs of at most chunk_size bytes, of the bytes of a file not in sent."""
+    if size == 0:
+        # an empty file is one empty PUT
+        return [] if sent else [(0, 0)]
+
+    chunks = []
+    position = 0
+    for a, b in sorted(sent) + [(size, size)]:
+        # the gap before each range sent, split in chunks
+        chunks += [(start, min(start + chunk_size, a)) for start in range(position, a, chunk_size)]
+        position = max(position, b)
+    return chunks
+
+
+class _Checkpoint:
+    """Byte ranges of an upload already sent, written through to the uploads file."""
+
+    def __init__(self, store: JsonFileStore, key: str) -> None:
+        self.store = store
+        self.key = key
+        self.state: dict[str, Any] = store.load().get(key) or {}
+        self._lock = threading.Lock()
+
+    def _save(self) -> None:
+        with self.store.update() as uploads:
+            uploads[self.key] = self.state
+
+    def start(self, item: dict[str, Any]) -> None:
+        with self._lock:
+            self.state = {"item": item, "chunks": {}}
+            self._save()
+
+    def sent(self, name: str) -> list[tuple[int, int]]:
+        return [(r[0], r[1]) for r in self.state.get("chunks", {}).get(name, []) if isinstance(r, list)]
+
+    def record(self, name: str, start: int, end: int) -> None:
+        with self._lock:
+            self.state["chunks"].setdefault(name, []).append([start, end])
+            self._save()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.state = {}
+            with self.store.update() as uploads:
+                uploads.pop(self.key, None)
+
+
+_store = JsonFileStore(os.environ.get("VMWARE_L4_UPLOADS", state_path("uploads.json")))
+
+
+def _headers(vmware_access_token: str) -> dict[str, str]:
+    return {
+        "Authorization": f"Bearer {vmware_access_token}",
+        "Accept": "application/*+json;version=38.0",
+    }
+
+
+@retry_policy(total=8, deadline=900.0)
+def _put(vmware_access_token: str, href: str, data: Any, start: int, size: int) -> None:
+    """PUT bytes start to start + len(data) of a file of size bytes to its transfer link."""
+
+    # request retry mechanism
+    s = requests_session()
+
+    headers = {"Authorization": f"Bearer {vmware_access_token}", "Content-Type": "application/octet-stream"}
+    if size:
+        headers["Content-Range"] = f"bytes {start}-{start + len(data) - 1}/{size}"
+
+    r = s.put(url=href, headers=headers, data=data)
+    r.raise_for_status()
+
+
+def _template(vmware_access_token: str, item: dict[str, Any]) -> Optional[dict[str, Any]]:
+    """The vApp template of a catalog item, None when it no longer exists."""
+    s = requests_session()
+
+    r = s.get(url=item["entity"]["href"], headers=_headers(vmware_access_token))
+    if r.status_code in (403, 404):
+        return None
+    r.raise_for_status()
+
+    return r.json()
+
+
+def _transfers(template: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    """Size, bytes transferred and upload link of each file of a vApp template, by name."""
+    transfers = {}
+    for f in (template.get("files") or {}).get("file") or []:
+        links = [link["href"] for link in f.get("link") or [] if link.get("rel") == "upload:default"]
+        transfers[f["name"]] = {"size": f.get("size", -1), "transferred": f.get("bytesTransferred", 0),
+                                "href": links[0] if links else None}
+    return transfers
+
+
+def _wait_template(vmware_access_token: str, item: dict[str, Any], ready: Callable[[dict[str, Any]], bool],
+                   timeout: float, what: str) -> dict[str, Any]:
+    """Poll the vApp template of an item until ready(template) is true."""
+    deadline = time.monotonic() + timeout
+    interval = 0.5
+    while True:
+        template = _template(vmware_access_token, item)
+        if template is None:
+            raise LookupError(f"vApp template {item['entity']['href']} is gone")
+        if ready(template):
+            return template
+        if time.monotonic() + interval > deadline:
+            raise TimeoutError(f"{item['name']}: {what} after {timeout}s")
+        time.sleep(interval)
+        interval = min(interval * 1.5, 10.0)
+
+
+@operation
+def push_ovf(vmware_access_token: str, catalog_href: str, path: str, item_name: str,
+             chunk_size: int = DEFAULT_CHUNK_SIZE, parallel: int = 4, timeout: float = 600.0,
+             on_progress: Optional[Callable[[str, int, int], None]] = None) -> dict[str, Any]:
+    """Upload a local OVF or OVA package to a catalog as a new item
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        catalog_href: HREF to a catalog eg. https://dirw002.eu-de.vmware.cloud.ibm.com/api/catalog/35a720ad-2b98-4706-b9a2-739b65af7965
+        path: Path of the .ovf, with its files next to it, or of the .ova.
+        item_name: Name of the catalog item.
+        chunk_size: Bytes per PUT of a file.
+        parallel: Chunks uploaded at once, over all files.
+        timeout: Seconds VCD may take to list the files and to import them.
+        on_progress: Called as on_progress(file name, bytes sent, file size) after each chunk.
+
+    Returns:
+        The upload, with the catalog item record, the import task href,
+        the bytes sent, seconds and throughput in bytes per second of
+        each file and of the whole transfer, and the seconds the import
+        took after it. A resumed upload only counts the bytes of this call.
+
+    Raises:
+        ValueError, OSError: the package cannot be read.
+        TimeoutError: VCD did not list the files of the descriptor in time.
+        TaskError: the import finished with error, was aborted or timed out.
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    started = time.perf_counter()
+
+    with OvfPackage(path) as package:
+        key = hashlib.sha256(f"{catalog_href}|{item_name}|{package.fingerprint()}".encode()).hexdigest()
+        checkpoint = _Checkpoint(_store, key)
+
+        item = checkpoint.state.get("item")
+        template = _template(vmware_access_token, item) if item else None
+        if template is None:
+            item = cloud_director.create_catalog_item(catalog_href, vmware_access_token, item_name)
+            checkpoint.start(item)
+            template = _template(vmware_access_token, item) or {}
+        else:
+            log.info(f"Resuming the upload of {item_name} to {catalog_href}")
+
+        # descriptor first, VCD then lists the files it references
+        transfers = _transfers(template)
+        descriptor = transfers.get(DESCRIPTOR)
+        if descriptor is not None and descriptor["transferred"] != package.descriptor.size:
+            with package.descriptor.chunk(0, package.descriptor.size) as view:
+                _put(vmware_access_token, descriptor["href"], view, 0, package.descriptor.size)
+
+        names = set(package.files)
+        template = _wait_template(vmware_access_token, item, lambda t: names <= set(_transfers(t)),
+                                  timeout, "files of the descriptor not listed")
+        transfers = _transfers(template)
+
+        # every missing chunk of every file, biggest files first
+        chunks = []
+        files = {}
+        for f in sorted(package.files.values(), key=lambda f: -f.size):
+            transfer = transfers[f.name]
+            files[f.name] = {"size": f.size, "sent": 0, "skipped": transfer["transferred"] == f.size, "seconds": 0.0}
+            if files[f.name]["skipped"]:
+                continue
+            missing = _missing(checkpoint.sent(f.name), f.size, chunk_size)
+            chunks += [(f, transfer["href"], start, end) for start, end in missing]
+
+        lock = threading.Lock()
+        # each file is timed from its first chunk, not from the item creation
+        first_chunk: dict[str, float] = {}
+
+        def upload(f: PackageFile, href: str, start: int, end: int) -> None:
+            with lock:
+                first_chunk.setdefault(f.name, time.perf_counter())
+            with f.chunk(start, end) as view:
+                _put(vmware_access_token, href, view, start, f.size)
+            checkpoint.record(f.name, start, end)
+            with lock:
+                files[f.name]["sent"] += end - start
+                files[f.name]["seconds"] = time.perf_counter() - first_chunk[f.name]
+                sent = files[f.name]["sent"]
+            if on_progress is not None:
+                on_progress(f.name, sent, f.size)
+
+        log.debug(f"Uploading {len(chunks)} chunks of {len(files)} files of {item_name}")
+        with ThreadPoolExecutor(max_workers=max(1, parallel)) as executor:
+            # the copies carry the metrics operation and retry policy of the caller
+            futures = [executor.submit(contextvars.copy_context().run, upload, *chunk) for chunk in chunks]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # stop at the first chunk failing for good, a new call resumes from the checkpoint
+                for future in futures:
+                    future.cancel()
+                raise
+
+    seconds = time.perf_counter() - started
+    total = sum(f["sent"] for f in files.values())
+    for f in files.values():
+        f["throughput"] = f["sent"] / f["seconds"] if f["seconds"] else 0.0
+    log.info(f"Sent {total} bytes of {item_name} in {seconds:.1f}s, {total / seconds / 2**20:.1f} MiB/s")
+
+    # the import starts once every file is in
+    template = _wait_template(vmware_access_token, item, lambda t: bool((t.get("tasks") or {}).get("task")),
+                              timeout, "import did not start")
+    task = template["tasks"]["task"][0]["href"]
+    cloud_director.wait_for_tasks(vmware_access_token, [task], timeout)
+    checkpoint.clear()
+
+    return {"item": item, "task": task, "files": files, "bytes": total, "seconds": seconds,
+            "throughput": total / seconds if seconds else 0.0,
+            "import_seconds": time.perf_counter() - started - seconds}
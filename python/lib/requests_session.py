@@ -1,33 +1,456 @@
+import copy
+import http.cookiejar
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
 import requests
 import urllib3
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from lib import circuit, coalesce, http_cache, metrics, retry
+from lib.cassette import CassetteWriter, ReplayAdapter
+from lib.circuit import CircuitOpenError
+from lib.throttle import ThrottleTimeout, throttle
+
+log = logging.getLogger(__name__)
+
+# Connection pool defaults, overridable with configure_pools() or the environment.
+DEFAULT_POOL_CONNECTIONS = int(os.environ.get("VMWARE_L4_POOL_CONNECTIONS", 16))
+DEFAULT_POOL_MAXSIZE = int(os.environ.get("VMWARE_L4_POOL_MAXSIZE", 32))
+DEFAULT_POOL_BLOCK = os.environ.get("VMWARE_L4_POOL_BLOCK", "false").lower() == "true"
+
+
+class PoolStats:
+    """Connection reuse counters for a single host pool.
+
+    A hit is a request served on an already open keep-alive connection,
+    a miss is a request that had to open a new TCP (and TLS) connection.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_stats_lock = threading.Lock()
+_pool_stats: dict[str, PoolStats] = {}
+
+
+def _record_checkout(pool: HTTPConnectionPool, new_connection: bool) -> None:
+    key = f"{pool.scheme}://{pool.host}:{pool.port}"
+    with _stats_lock:
+        stats = _pool_stats.setdefault(key, PoolStats())
+        if new_connection:
+            stats.misses += 1
+        else:
+            stats.hits += 1
+
+
+_checkout = threading.local()
+
+
+class _CountingPoolMixin:
+    """Count connection checkouts that reuse or open a connection."""
+
+    def _get_conn(self, timeout=None):
+        _checkout.opened = False
+        conn = super()._get_conn(timeout=timeout)
+        _record_checkout(self, _checkout.opened)
+        return conn
+
+    def _new_conn(self):
+        _checkout.opened = True
+        return super()._new_conn()
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+def _connected(e: requests.RequestException) -> bool:
+    """False when a request failed before a connection was established."""
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return False
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return not isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def _rewindable(request: requests.PreparedRequest) -> Optional[Callable[[], None]]:
+    """A callable resetting the request body for a new attempt, None when impossible."""
+    body = request.body
+    if body is None or isinstance(body, (bytes, str, bytearray, memoryview)):
+        return lambda: None
+    if hasattr(body, "seek") and hasattr(body, "tell"):
+        position = body.tell()
+        return lambda: body.seek(position)
+    return None
 
 
 class TimeoutHTTPAdapter(requests.adapters.HTTPAdapter):
-    """Timeout and retry custom Transport Adapter"""
+    """Timeout and retry custom Transport Adapter
+
+    Retries follow the lib.retry policy of the calling context: jittered
+    backoff, Retry-After, a per-call deadline and the process retry budget.
+    urllib3 itself does not retry. Each attempt waits for the rate and
+    concurrency limits of its host, see lib.throttle, and fails at once
+    with CircuitOpenError while the target is tripped, see lib.circuit.
+    Identical concurrent GETs share one request, see lib.coalesce, and
+    GETs of cache_responses functions are revalidated, see lib.http_cache.
+    """
+
+    def __init__(self, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 pool_block: bool = DEFAULT_POOL_BLOCK) -> None:
+        super().__init__(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                         max_retries=urllib3.util.Retry(total=0, read=False, redirect=False),
+                         pool_block=pool_block)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def _attempt(self, request, host_breaker, host_throttle, timeout, remaining, verify, cert, proxies):
+        """Send once through the circuit breaker and the throttle of the target."""
+        host_breaker.check()
+
+        success = None
+        try:
+            with host_throttle.slot(remaining) as slot:
+                success = False
+                r = super().send(request, stream=False, timeout=timeout, verify=verify, cert=cert,
+                                 proxies=proxies)
+                slot.status = r.status_code
+                success = not circuit.is_failure(r.status_code)
+                return r
+        except ThrottleTimeout as e:
+            raise requests.exceptions.ConnectTimeout(e, request=request)
+        finally:
+            host_breaker.record(success)
+
+    def _send_with_retries(self, request, timeout, verify, cert, proxies):
+        """Send, retrying as the policy allows, returns (Response, retries)."""
+        policy = retry.current_policy()
+        budget = retry.budget()
+        rewind = _rewindable(request)
+        method = request.method
+        host_throttle = throttle(urlparse(request.url).netloc)
+        host_breaker = circuit.breaker(request.url)
+
+        deadline = time.monotonic() + policy.deadline
+        delay = policy.base
+        attempt = 0
+        budget.record_request()
+
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                r = self._attempt(request, host_breaker, host_throttle, timeout or policy.timeout(remaining),
+                                  remaining, verify, cert, proxies)
+            except CircuitOpenError:
+                raise
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not policy.retry_error(method, _connected(e)):
+                    raise
+                error, wait = e, None
+            else:
+                if not policy.retry_status(method, r.status_code, r.headers):
+                    return r, attempt
+                error, wait = None, retry.retry_after(r.headers)
+                if wait is not None and wait > policy.max_retry_after:
+                    log.debug(f"{method} {request.url} asked to retry in {wait}s, giving up")
+                    return r, attempt
+
+            delay = policy.backoff(delay)
+            if wait is not None:
+                delay = max(delay, wait)
+
+            if (attempt >= policy.total or rewind is None
+                    or time.monotonic() + delay >= deadline or not budget.try_retry()):
+                if error is not None:
+                    raise error
+                return r, attempt
+
+            if error is None:
+                r.close()
+            attempt = attempt + 1
+            log.debug(f"Retrying {method} {request.url} in {delay:.2f}s (attempt {attempt}, "
+                      f"{error or r.status_code})")
+            time.sleep(delay)
+            rewind()
 
     def send(
         self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None
     ):
         """Sends PreparedRequest object. Returns Response object."""
-        self.max_retries = urllib3.util.Retry(
-            total=4,
-            backoff_factor=7,
-            allowed_methods={"GET", "POST", "PUT"},
-            status_forcelist={500, 501, 502, 503, 504, 505, 506, 507, 509, 510, 511},
-        )
-        self.DEFAULT_BACKOFF_MAX=30*60
-        return super().send(
-            request, stream=False, timeout=180, verify=True, cert=None, proxies=None
-        )
+        key = None if request.body is not None else coalesce.request_key(request.method, request.url,
+                                                                         request.headers)
+        if key is None:
+            return self._send(request, timeout, verify, cert, proxies)
+
+        r, shared = coalesce.single_flight().do(key, lambda: self._send(request, timeout, verify, cert, proxies))
+        if shared:
+            # the caller that sent it owns the original, hooks may change it
+            r = copy.copy(r)
+            r.request = request
+            r.connection = self
+        return r
+
+    def _send(self, request, timeout, verify, cert, proxies):
+        """Send through the response cache, recording what the caller gets to the cassette."""
+        start = time.perf_counter()
+        key = http_cache.cache_key(request.method, request.url, request.headers)
+        if key is None:
+            r = self._send_measured(request, timeout, verify, cert, proxies)
+        else:
+            r = self._revalidate(key, request, timeout, verify, cert, proxies)
+
+        recorder = _recorder
+        if recorder is not None:
+            r.elapsed = timedelta(seconds=time.perf_counter() - start)
+            recorder.record(request, r)
+
+        return r
+
+    def _revalidate(self, key, request, timeout, verify, cert, proxies):
+        """Send a GET conditional on the cached response, serving a 304 from the cache."""
+        cache = http_cache.response_cache()
+        entry = cache.get(key)
+        if entry is None:
+            r = self._send_measured(request, timeout, verify, cert, proxies)
+        else:
+            # the hooks resend r.request, which must stay unconditional
+            conditional = request.copy()
+            conditional.headers.update(entry.validators)
+            r = self._send_measured(conditional, timeout, verify, cert, proxies)
+            r.request = request
+
+        cache.record(entry is not None and r.status_code == 304)
+        if entry is not None and r.status_code == 304:
+            entry.refresh(r.headers)
+            return _cached_response(entry, request, r, self)
+
+        if http_cache.cacheable(r.status_code, r.headers):
+            cache.put(key, http_cache.CachedResponse(r.status_code, r.headers, r.content, r.url))
+        elif entry is not None:
+            cache.discard(key)
+        return r
+
+    def _send_measured(self, request, timeout, verify, cert, proxies):
+        """Send with retries, recording the metrics of the operation."""
+        operation = metrics.current_operation() or f"{request.method} {urlparse(request.url).netloc}"
+        registry = metrics.registry()
+
+        registry.start(operation)
+        start = time.perf_counter()
+        try:
+            r, retries = self._send_with_retries(request, timeout, verify, cert, proxies)
+        except Exception:
+            registry.finish(operation, request.method, "error", time.perf_counter() - start)
+            raise
+
+        registry.finish(operation, request.method, r.status_code, time.perf_counter() - start, len(r.content),
+                        retries)
+        return r
+
+
+def _cached_response(entry: http_cache.CachedResponse, request: requests.PreparedRequest,
+                     revalidation: requests.Response, adapter: TimeoutHTTPAdapter) -> requests.Response:
+    """Response built from a cache entry revalidated by a 304."""
+    r = requests.Response()
+    r.status_code = entry.status
+    r.reason = "OK"
+    r.headers = requests.structures.CaseInsensitiveDict(entry.headers)
+    r.encoding = requests.utils.get_encoding_from_headers(r.headers)
+    r._content = entry.body
+    r.url = entry.url
+    r.request = request
+    r.connection = adapter
+    r.elapsed = revalidation.elapsed
+    return r
+
+
+_registry_lock = threading.Lock()
+_shared_session: requests.Session | None = None
+_shared_pid: int | None = None
+_pool_config = {
+    "pool_connections": DEFAULT_POOL_CONNECTIONS,
+    "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+    "pool_block": DEFAULT_POOL_BLOCK,
+}
+
+
+# Cassette written by every adapter, see configure_cassette().
+_recorder: Optional[CassetteWriter] = (CassetteWriter(os.environ["VMWARE_L4_RECORD"])
+                                       if os.environ.get("VMWARE_L4_RECORD") else None)
+_replay_config: dict = {
+    "path": os.environ.get("VMWARE_L4_REPLAY"),
+    "speed": float(os.environ.get("VMWARE_L4_REPLAY_SPEED", 0)),
+}
+
+# Callables mapping a rejected Bearer token to a fresh one, or None.
+_auth_refreshers: list[Callable[[str], Optional[str]]] = []
+
+
+def add_auth_refresher(refresher: Callable[[str], Optional[str]]) -> None:
+    """Register a callable that renews a Bearer token rejected with 401.
+
+    When a response is 401, each refresher is asked for a replacement of
+    the rejected token and the request is sent once more with the first
+    one returned.
+
+    Args:
+        refresher: Callable taking the rejected token, returning a new
+            token or None when the token is not one it manages.
+    """
+    if refresher not in _auth_refreshers:
+        _auth_refreshers.append(refresher)
+
+
+def _reauthenticate(r: requests.Response, *args, **kwargs) -> requests.Response:
+    """Response hook resending a 401 request with a renewed Bearer token."""
+    auth = r.request.headers.get("Authorization", "")
+    if r.status_code != 401 or not auth.startswith("Bearer "):
+        return r
+
+    rejected = auth[len("Bearer "):]
+    for refresher in _auth_refreshers:
+        token = refresher(rejected)
+        if token is None or token == rejected:
+            continue
+
+        log.debug(f"Retrying {r.request.method} {r.request.url} with a renewed session")
+        request = r.request.copy()
+        request.headers["Authorization"] = f"Bearer {token}"
+        r.close()
+
+        # the adapter does not run hooks, so this cannot loop
+        retried = r.connection.send(request, **kwargs)
+        retried.history.append(r)
+        retried.request = request
+        return retried
+
+    return r
+
+
+def _new_session() -> requests.Session:
+    s = requests.Session()
+    # Every call authenticates with an explicit bearer token, never let
+    # cookies from one principal leak into another caller's requests.
+    s.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    if _replay_config["path"]:
+        adapter = ReplayAdapter(_replay_config["path"], _replay_config["speed"])
+    else:
+        adapter = TimeoutHTTPAdapter(**_pool_config)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    s.hooks["response"].append(_reauthenticate)
+
+    return s
 
 
 def requests_session() -> requests.Session:
     """Request Session definition.
 
+    The session is shared by the whole process so that every lib call reuses
+    the keep-alive connection pools (one per host) instead of paying for a
+    new TCP and TLS handshake.
+
     Returns:
         requests Session object.
     """
-    s = requests.Session()
-    s.mount("https://", TimeoutHTTPAdapter())
+    global _shared_session, _shared_pid
 
-    return s
+    s = _shared_session
+    if s is not None and _shared_pid == os.getpid():
+        return s
+
+    with _registry_lock:
+        # connection pools must not be shared with a forked child
+        if _shared_session is None or _shared_pid != os.getpid():
+            _shared_session = _new_session()
+            _shared_pid = os.getpid()
+
+        return _shared_session
+
+
+def configure_pools(pool_connections: int | None = None, pool_maxsize: int | None = None,
+                    pool_block: bool | None = None) -> None:
+    """Configure the size of the shared connection pools.
+
+    Args:
+        pool_connections: Number of host pools kept open.
+        pool_maxsize: Maximum keep-alive connections per host.
+        pool_block: Block when a host pool is exhausted instead of opening
+            a throw-away connection.
+    """
+    if pool_connections is not None:
+        _pool_config["pool_connections"] = pool_connections
+    if pool_maxsize is not None:
+        _pool_config["pool_maxsize"] = pool_maxsize
+    if pool_block is not None:
+        _pool_config["pool_block"] = pool_block
+
+    reset_session()
+
+
+def configure_cassette(record: Optional[str] = None, replay: Optional[str] = None,
+                       replay_speed: float = 0.0) -> None:
+    """Record the HTTP traffic of the process or replay a recording.
+
+    Also enabled with VMWARE_L4_RECORD, VMWARE_L4_REPLAY and
+    VMWARE_L4_REPLAY_SPEED. Calling it without arguments turns both off.
+    See lib.cassette for the file format and the redaction of secrets.
+
+    Args:
+        record: Append every request and response, redacted, to this JSONL file.
+        replay: Answer every request from this JSONL file, nothing is sent.
+        replay_speed: 0 replays at once, 1 at the recorded response times.
+    """
+    global _recorder
+
+    with _registry_lock:
+        if _recorder is not None:
+            _recorder.close()
+        _recorder = CassetteWriter(record) if record else None
+
+    _replay_config["path"] = replay
+    _replay_config["speed"] = replay_speed
+
+    reset_session()
+
+
+def reset_session() -> None:
+    """Close the shared session and all of its pooled connections."""
+    global _shared_session
+
+    with _registry_lock:
+        if _shared_session is not None:
+            _shared_session.close()
+        _shared_session = None
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """Connection pool hit and miss counters keyed by scheme://host:port."""
+    with _stats_lock:
+        return {k: v.as_dict() for k, v in _pool_stats.items()}
+
+
+def reset_pool_stats() -> None:
+    with _stats_lock:
+        _pool_stats.clear()
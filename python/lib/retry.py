@@ -0,0 +1,261 @@
+"""Retry policy of the HTTP transports.
+
+A RetryPolicy decides whether a failed attempt is retried and how long to
+wait before the next one:
+
+    - 429 and 5xx answers, connection errors and timeouts are retried
+    - a Retry-After header is honoured, up to max_retry_after seconds
+    - waits use decorrelated jitter, sleep = uniform(base, 3 * last sleep)
+      capped at cap, so concurrent callers do not retry in lockstep
+    - no attempt starts after the per-call deadline
+    - the process wide RetryBudget caps retries to a fraction of the
+      requests, so a retry storm against a sick endpoint fails fast
+
+Requests that are not idempotent, e.g., POSTs creating a VDC or a
+catalog, are only retried when the server cannot have acted on them:
+the connection was never established, or the answer is 429, or 503
+with Retry-After. POSTs that are safe to repeat, like requesting a
+token, are marked with retry_policy(idempotent=True).
+
+Functions set their own timeouts and limits with retry_policy(), used as
+a decorator or a context manager.
+"""
+
+import contextvars
+import email.utils
+import functools
+import inspect
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Mapping, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# answers sent before the request was processed, safe for any method
+REJECTED_STATUSES = frozenset({429})
+
+
+class RetryPolicy:
+    """Retry and timeout settings of a call.
+
+    Args:
+        total: Maximum number of retries.
+        base: Minimum wait between attempts in seconds.
+        cap: Maximum wait between attempts in seconds.
+        deadline: Seconds from the first attempt after which no attempt starts.
+        connect_timeout: Seconds to establish a connection.
+        read_timeout: Seconds to wait for the answer.
+        max_retry_after: Longest Retry-After wait honoured, longer waits
+            return the answer at once.
+        statuses: Answer statuses that are retried.
+        idempotent: Retry a POST like a GET, for POSTs safe to repeat.
+    """
+
+    def __init__(self, total: int = 4, base: float = 0.5, cap: float = 30.0, deadline: float = 300.0,
+                 connect_timeout: float = 10.0, read_timeout: float = 180.0, max_retry_after: float = 60.0,
+                 statuses: frozenset[int] = RETRY_STATUSES, idempotent: bool = False) -> None:
+        self.total = total
+        self.base = base
+        self.cap = cap
+        self.deadline = deadline
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+        self.idempotent = idempotent
+
+    def copy(self, **overrides: Any) -> "RetryPolicy":
+        """A copy with some settings replaced."""
+        settings = {**vars(self), **overrides}
+        return RetryPolicy(**settings)
+
+    def is_idempotent(self, method: str) -> bool:
+        return self.idempotent or method.upper() in IDEMPOTENT_METHODS
+
+    def retry_status(self, method: str, status: int, headers: Mapping[str, str]) -> bool:
+        """Whether an answer with this status is retried."""
+        if status not in self.statuses:
+            return False
+        if self.is_idempotent(method) or status in REJECTED_STATUSES:
+            return True
+        # the server asked to come back later, it did not process the request
+        return status == 503 and "Retry-After" in headers
+
+    def retry_error(self, method: str, connected: bool) -> bool:
+        """Whether a connection error or timeout is retried.
+
+        Args:
+            method: HTTP method.
+            connected: False when the connection was never established,
+                so the server did not see the request.
+        """
+        return self.is_idempotent(method) or not connected
+
+    def backoff(self, last: float) -> float:
+        """Decorrelated jitter wait following a wait of last seconds."""
+        return min(self.cap, random.uniform(self.base, max(self.base, last * 3)))
+
+    def timeout(self, remaining: float) -> tuple[float, float]:
+        """(connect, read) timeout of an attempt that must end within remaining seconds."""
+        remaining = max(remaining, 0.001)
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, in seconds or an HTTP date."""
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget:
+    """Process wide limit on retries over a sliding window.
+
+    Retries are allowed while they stay below ratio times the requests of
+    the last window seconds, plus min_retries so a quiet process can still
+    retry. When an endpoint fails everything, the retries stop at the
+    budget instead of multiplying the load.
+
+    Args:
+        ratio: Retries allowed per request.
+        min_retries: Retries always allowed per window.
+        window: Length of the window in seconds.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10, window: float = 10.0) -> None:
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._lock = threading.Lock()
+        self._requests: deque[float] = deque()
+        self._retries: deque[float] = deque()
+        self.exhausted = 0
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        """Count a first attempt."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        """Take a retry from the budget, False when it is spent."""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                self.exhausted += 1
+                return False
+            self._retries.append(now)
+            return True
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            self._trim(time.monotonic())
+            return {"requests": len(self._requests), "retries": len(self._retries),
+                    "exhausted": self.exhausted}
+
+
+_default_policy = RetryPolicy()
+_budget = RetryBudget()
+_current_policy: contextvars.ContextVar[Optional[RetryPolicy]] = contextvars.ContextVar("retry_policy",
+                                                                                        default=None)
+
+
+def current_policy() -> RetryPolicy:
+    """Policy of the calling context, the default one outside retry_policy()."""
+    return _current_policy.get() or _default_policy
+
+
+def budget() -> RetryBudget:
+    """The process wide retry budget."""
+    return _budget
+
+
+def configure_retries(ratio: Optional[float] = None, min_retries: Optional[int] = None,
+                      **defaults: Any) -> None:
+    """Change the default policy and the retry budget of the process.
+
+    Args:
+        ratio: Retries allowed per request by the budget.
+        min_retries: Retries always allowed per budget window.
+        defaults: RetryPolicy settings, e.g., total=2 or deadline=60.
+    """
+    global _default_policy
+
+    _default_policy = _default_policy.copy(**defaults)
+    if ratio is not None:
+        _budget.ratio = ratio
+    if min_retries is not None:
+        _budget.min_retries = min_retries
+
+
+class _PolicyOverride:
+    def __init__(self, overrides: dict[str, Any]) -> None:
+        self.overrides = overrides
+        self._tokens: list[contextvars.Token] = []
+
+    def __enter__(self) -> RetryPolicy:
+        policy = current_policy().copy(**self.overrides)
+        self._tokens.append(_current_policy.set(policy))
+        return policy
+
+    def __exit__(self, *exc: Any) -> None:
+        _current_policy.reset(self._tokens.pop())
+
+    def __call__(self, func: F) -> F:
+        overrides = self.overrides
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                token = _current_policy.set(current_policy().copy(**overrides))
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _current_policy.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _current_policy.set(current_policy().copy(**overrides))
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _current_policy.reset(token)
+
+        return wrapper
+
+
+def retry_policy(**overrides: Any) -> Any:
+    """Override RetryPolicy settings for the requests of a function or block.
+
+    Example:
+        @retry_policy(idempotent=True, read_timeout=30)
+        def request_ibm_iam_token(...): ...
+
+    Args:
+        overrides: RetryPolicy settings to replace.
+
+    Returns:
+        A decorator that is also a context manager.
+    """
+    return _PolicyOverride(overrides)
@@ -7,12 +7,15 @@ https://us-east.schematics.cloud.ibm.com
 
 import logging
 
+from lib.endpoints import schematics_url
+from lib.metrics import operation
 from lib.requests_session import requests_session
 from typing import Any
 
 log = logging.getLogger(__name__)
 
 
+@operation
 def ibm_schematics_list_workspaces(ibm_iam_access_token: str, resource_group: str) -> dict[str, Any]:
     """The API call to list schematics workspaces
 
@@ -32,7 +35,7 @@ def ibm_schematics_list_workspaces(ibm_iam_access_token: str, resource_group: st
     # request retry mechanism
     s = requests_session()
 
-    endpoint_url = "https://schematics.cloud.ibm.com/v1/workspaces"
+    endpoint_url = "/".join([schematics_url(), "v1", "workspaces"])
 
     headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
 
@@ -47,6 +50,7 @@ def ibm_schematics_list_workspaces(ibm_iam_access_token: str, resource_group: st
 
     return r.json()
 
+@operation
 def ibm_schematics_create_workspace(ibm_iam_access_token: str, resource_group: str, workspace_name: str, description: str,
                                     template_repo: str, folder: str, type: str, variablestore: dict[str, Any]) -> dict[str, Any]:
     """The API call to Create a schematics workspaces
@@ -73,7 +77,7 @@ def ibm_schematics_create_workspace(ibm_iam_access_token: str, resource_group: s
     
     s = requests_session()
 
-    endpoint_url = "https://schematics.cloud.ibm.com/v1/workspaces"
+    endpoint_url = "/".join([schematics_url(), "v1", "workspaces"])
     headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
 
     payload = {
@@ -104,6 +108,9 @@ def ibm_schematics_create_workspace(ibm_iam_access_token: str, resource_group: s
     r = s.post(url=endpoint_url, headers=headers, json=payload)
     r.raise_for_status()
 
+    return r.json()
+
+@operation
 def ibm_schematics_update_workspace_variables(ibm_iam_access_token: str, workspace_id: str, template_id: str, variablestore: dict[str, Any]) -> dict[str, Any]:
     """The API call to Update an existing workspace variablestore
         https://cloud.ibm.com/apidocs/schematics/schematics#replace-workspace
@@ -124,7 +131,7 @@ def ibm_schematics_update_workspace_variables(ibm_iam_access_token: str, workspa
     """
     
     s = requests_session()
-    base_url = "https://schematics.cloud.ibm.com/v1/workspaces"
+    base_url = "/".join([schematics_url(), "v1", "workspaces"])
 
     endpoint_url = "/".join([base_url, workspace_id, "template_data", template_id, "values"])
     headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
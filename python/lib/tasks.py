@@ -0,0 +1,219 @@
+"""Batch tracking of VMware Cloud Director tasks.
+
+Instead of one polling thread per task, TaskTracker asks the query service
+for the status of many tasks at once (type=task filtered on their hrefs),
+so waiting on a thousand tasks costs a few requests per interval.
+"""
+
+import logging
+import time
+from typing import Any, Callable, Iterator, Optional
+from urllib.parse import urlparse
+
+from lib.pagination import LEGACY_QUERY, paginate
+from lib.requests_session import requests_session
+
+log = logging.getLogger(__name__)
+
+RUNNING_STATUS = {"queued", "prerunning", "running"}
+COMPLETED_STATUS = {"success", "error", "aborted"}
+
+
+class TaskError(Exception):
+    """One or more tasks finished with error, were aborted or timed out.
+
+    Attributes:
+        failed: Status of each failed task keyed by task href.
+    """
+
+    def __init__(self, failed: dict[str, str]) -> None:
+        self.failed = failed
+        details = ", ".join(f"{href} ({status})" for href, status in failed.items())
+        super().__init__(f"{len(failed)} task(s) failed: {details}")
+
+
+class TaskTimeoutError(TaskError):
+    """One or more tasks did not complete before their deadline.
+
+    Tasks that finished with error or were aborted meanwhile are reported
+    as well, failed holds both.
+
+    Attributes:
+        timed_out: Last status of each timed out task keyed by task href.
+    """
+
+    def __init__(self, timed_out: dict[str, str], failed: Optional[dict[str, str]] = None) -> None:
+        self.timed_out = timed_out
+        super().__init__({**(failed or {}), **timed_out})
+        self.args = (", ".join(f"{href} ({'timed out ' if href in timed_out else ''}{status})"
+                               for href, status in self.failed.items()),)
+
+
+class _Task:
+    def __init__(self, href: str, deadline: Optional[float]) -> None:
+        self.href = href
+        self.deadline = deadline
+        self.status = "queued"
+        self.record: dict[str, Any] = {}
+
+
+class TaskTracker:
+    """Wait for many VMware Cloud Director tasks with a few requests per round.
+
+    Args:
+        vmware_access_token: A VMWare VCD Session token.
+        poll_interval: Seconds between polls while task statuses change.
+        max_interval: Upper bound of the poll interval while nothing changes.
+        backoff: Factor the interval grows by after a round without changes.
+        batch_size: Number of tasks per query service request.
+        on_progress: Called as on_progress(href, status, record) whenever the
+            status of a task changes.
+    """
+
+    def __init__(self, vmware_access_token: str, poll_interval: float = 1.0, max_interval: float = 15.0,
+                 backoff: float = 1.5, batch_size: int = 25,
+                 on_progress: Optional[Callable[[str, str, dict[str, Any]], None]] = None) -> None:
+        self.vmware_access_token = vmware_access_token
+        self.poll_interval = poll_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.on_progress = on_progress
+        self._tasks: dict[str, _Task] = {}
+        self._interval = poll_interval
+
+    def add(self, href: str, timeout: Optional[float] = None) -> None:
+        """Track a task.
+
+        Args:
+            href: Task href, eg, https://dirw002.eu-de.vmware.cloud.ibm.com/api/task/6d2c3a4e-...
+            timeout: Seconds from now the task must complete in, None waits forever.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self._tasks[href] = _Task(href, deadline)
+
+    def _headers(self) -> dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.vmware_access_token}",
+            "Accept": "application/*+json;version=38.1"
+        }
+
+    def _query_params(self, tasks: list[_Task]) -> dict[str, str]:
+        return {
+            "type": "task",
+            "format": "records",
+            "filter": "(" + ",".join(f"href=={t.href}" for t in tasks) + ")",
+        }
+
+    def _batches(self, pending: list[_Task]) -> Iterator[tuple[str, list[_Task]]]:
+        """Pending tasks grouped by director, in batches of batch_size."""
+        by_director: dict[str, list[_Task]] = {}
+        for task in pending:
+            u = urlparse(task.href)
+            by_director.setdefault(f"{u.scheme}://{u.netloc}", []).append(task)
+
+        for director_url, tasks in by_director.items():
+            for i in range(0, len(tasks), self.batch_size):
+                yield director_url, tasks[i:i + self.batch_size]
+
+    def _update(self, task: _Task, record: dict[str, Any]) -> bool:
+        """Record the status of a task, returns True when it changed."""
+        status = record["status"]
+        if status == task.status:
+            return False
+
+        task.status = status
+        task.record = record
+        if self.on_progress is not None:
+            self.on_progress(task.href, status, record)
+        return True
+
+    def _pending(self, timed_out: dict[str, str]) -> tuple[list[_Task], float]:
+        """Tasks still running, after moving those past their deadline to timed_out.
+
+        Returns:
+            The pending tasks and the seconds to sleep before the next poll,
+            at most the time left to the nearest deadline.
+        """
+        pending = [t for t in self._tasks.values()
+                   if t.status.lower() not in COMPLETED_STATUS and t.href not in timed_out]
+
+        now = time.monotonic()
+        for task in pending:
+            if task.deadline is not None and now >= task.deadline:
+                log.debug(f"Task {task.href} timed out in status {task.status}")
+                timed_out[task.href] = task.status
+        pending = [t for t in pending if t.href not in timed_out]
+
+        deadlines = [t.deadline - now for t in pending if t.deadline is not None]
+        return pending, max(min([self._interval, *deadlines]), 0)
+
+    def _result(self, timed_out: dict[str, str]) -> dict[str, str]:
+        failed = {t.href: t.status for t in self._tasks.values()
+                  if t.href not in timed_out and t.status.lower() != "success"}
+        if timed_out:
+            raise TaskTimeoutError(timed_out, failed)
+        if failed:
+            raise TaskError(failed)
+
+        return {t.href: t.status for t in self._tasks.values()}
+
+    def _backoff(self, changed: bool) -> None:
+        if changed:
+            self._interval = self.poll_interval
+        else:
+            self._interval = min(self._interval * self.backoff, self.max_interval)
+
+    def _query(self, director_url: str, tasks: list[_Task]) -> dict[str, dict[str, Any]]:
+        """Task records of a batch of tasks on one director keyed by href."""
+        endpoint_url = "/".join([director_url, "api", "query"])
+        params = self._query_params(tasks)
+
+        return {r["href"]: r for r in paginate(endpoint_url, self._headers(), params, LEGACY_QUERY)}
+
+    def _get(self, task: _Task) -> dict[str, Any]:
+        s = requests_session()
+
+        r = s.get(url=task.href, headers=self._headers())
+        r.raise_for_status()
+
+        return r.json()
+
+    def _poll(self, pending: list[_Task]) -> bool:
+        """Refresh the status of pending tasks, returns True when any changed."""
+        changed = False
+        for director_url, batch in self._batches(pending):
+            log.debug(f"Querying {len(batch)} tasks on {director_url}")
+            records = self._query(director_url, batch)
+
+            for task in batch:
+                # tasks the query service does not list yet are read directly
+                changed = self._update(task, records.get(task.href) or self._get(task)) or changed
+
+        return changed
+
+    def wait(self) -> dict[str, str]:
+        """Wait until every tracked task completed.
+
+        Returns:
+            The final status of each task keyed by task href.
+
+        Raises:
+            TaskTimeoutError: a task did not complete before its deadline,
+                it reports the tasks that failed meanwhile as well.
+            TaskError: a task finished with error or was aborted.
+            requests.RequestException: all Requests package exceptions
+                can be raised due to, e.g., connection or authorization errors.
+        """
+        self._interval = self.poll_interval
+        timed_out: dict[str, str] = {}
+
+        while True:
+            pending, sleep = self._pending(timed_out)
+            if not pending:
+                break
+
+            time.sleep(sleep)
+            self._backoff(self._poll(pending))
+
+        return self._result(timed_out)
@@ -0,0 +1,332 @@
+"""Client side rate and concurrency limits per host.
+
+Every request sent by the lib passes through the HostThrottle of its
+host, shared by all threads and event loops of the process:
+
+    - a TokenBucket caps the request rate, so fan-outs stay under the
+      IAM, VCFaaS and director quotas
+    - an AimdLimiter caps the requests in flight. The limit grows by
+      about one per round trip while latencies stay close to the recent
+      median, and is cut by half on 429, 503, errors or slow answers.
+
+A director that is fast gets up to max_concurrency parallel requests,
+one that starts throttling is backed off from within a few requests.
+
+Defaults come from VMWARE_L4_RATE (requests per second, 0 for no limit),
+VMWARE_L4_BURST, VMWARE_L4_CONCURRENCY and VMWARE_L4_MAX_CONCURRENCY,
+and can be changed per host with configure_throttle().
+"""
+
+import asyncio
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Iterator, Optional
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RATE = float(os.environ.get("VMWARE_L4_RATE", 50))
+DEFAULT_BURST = int(os.environ.get("VMWARE_L4_BURST", 100))
+DEFAULT_CONCURRENCY = int(os.environ.get("VMWARE_L4_CONCURRENCY", 8))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("VMWARE_L4_MAX_CONCURRENCY", 32))
+
+OVERLOAD_STATUSES = frozenset({429, 503})
+
+
+class ThrottleTimeout(TimeoutError):
+    """No request slot to a host freed up before the deadline."""
+
+
+class TokenBucket:
+    """Thread safe token bucket.
+
+    Args:
+        rate: Tokens added per second, 0 for no limit.
+        burst: Maximum number of tokens.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, timeout: Optional[float] = None) -> Optional[float]:
+        """Take a token, returns the seconds to wait before using it.
+
+        Args:
+            timeout: Most seconds the caller can wait, None for no limit.
+
+        Returns:
+            The seconds to wait, None when that is more than timeout, in
+            which case no token is taken.
+        """
+        if self.rate <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # a negative balance is a queue of callers already waiting
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if timeout is not None and wait > timeout:
+                # a rejected caller does not add to the queue of the others
+                return None
+            self._tokens -= 1
+            return wait
+
+    def refund(self) -> None:
+        """Give back a token taken by reserve() and never used."""
+        if self.rate <= 0:
+            return
+
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class AimdLimiter:
+    """Additive increase, multiplicative decrease limit on requests in flight.
+
+    Args:
+        initial: Starting limit.
+        minimum: Lowest limit.
+        maximum: Highest limit.
+        backoff: Factor the limit is multiplied by on overload.
+        tolerance: A latency above tolerance times the recent median counts
+            as overload.
+    """
+
+    def __init__(self, initial: int = DEFAULT_CONCURRENCY, minimum: int = 1,
+                 maximum: int = DEFAULT_MAX_CONCURRENCY, backoff: float = 0.5,
+                 tolerance: float = 3.0) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.in_flight = 0
+        self.decreases = 0
+        self._latencies: deque[float] = deque(maxlen=100)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        # futures of the coroutines waiting for a slot, with their event loop
+        self._async_waiters: deque[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a free slot, False when none freed up in time."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        """acquire() for coroutines, sleeping on a future that release() resolves."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return True
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError
+                await asyncio.wait_for(waiter, remaining)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                with self._cond:
+                    try:
+                        self._async_waiters.remove((loop, waiter))
+                    except ValueError:
+                        # woken already, the wake up goes to the next waiter
+                        self._wake_async()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                return False
+
+    def _wake_async(self) -> None:
+        # called with self._cond held, wakes one coroutine per free slot
+        for _ in range(int(self.limit) - self.in_flight):
+            while self._async_waiters:
+                loop, waiter = self._async_waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+                    break
+                except RuntimeError:
+                    # its event loop is closed
+                    continue
+
+    def release(self, latency: Optional[float], overloaded: bool) -> None:
+        """Free a slot and adapt the limit to the outcome of its request.
+
+        Args:
+            latency: Seconds the request took, None when it failed.
+            overloaded: The answer or error signals the server is overloaded.
+        """
+        with self._cond:
+            self.in_flight -= 1
+
+            typical = statistics.median(self._latencies) if self._latencies else 0.0
+            if latency is not None and not overloaded:
+                overloaded = len(self._latencies) >= 10 and latency > self.tolerance * typical
+                self._latencies.append(latency)
+
+            now = time.monotonic()
+            if overloaded:
+                # one cut per round trip, the requests in flight saw the same overload
+                if now - self._last_decrease > typical:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = now
+                    self.decreases += 1
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+            self._cond.notify_all()
+            self._wake_async()
+
+
+class HostThrottle:
+    """Rate and concurrency limits of one host."""
+
+    def __init__(self, host: str, rate: float, burst: int, concurrency: int, max_concurrency: int) -> None:
+        self.host = host
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AimdLimiter(initial=concurrency, maximum=max_concurrency)
+        self.waited = 0.0
+
+    def _outcome(self, start: float, status: Optional[int]) -> tuple[Optional[float], bool]:
+        if status is None:
+            return None, True
+        return time.monotonic() - start, status in OVERLOAD_STATUSES
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator["_Slot"]:
+        """Wait for the rate limit and a concurrency slot, for one request.
+
+        Set status on the yielded slot to the answer status; a slot left
+        without one counts as a failure.
+
+        Raises:
+            ThrottleTimeout: no slot freed up within timeout seconds.
+        """
+        start = time.monotonic()
+        wait = self.bucket.reserve(timeout)
+        if wait is None:
+            raise ThrottleTimeout(f"Rate limit of {self.host} exceeds the deadline")
+        try:
+            if wait:
+                time.sleep(wait)
+            if not self.limiter.acquire(None if timeout is None else timeout - (time.monotonic() - start)):
+                raise ThrottleTimeout(f"No request slot to {self.host} freed up in time")
+        except BaseException:
+            # no request is sent, its token goes to the next caller
+            self.bucket.refund()
+            raise
+        self.waited += time.monotonic() - start
+
+        slot = _Slot()
+        sent = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self.limiter.release(*self._outcome(sent, slot.status))
+
+    @asynccontextmanager
+    async def async_slot(self, timeout: Optional[float] = None) -> AsyncIterator["_Slot"]:
+        """slot() for coroutines, waiting without blocking the event loop."""
+        start = time.monotonic()
+        wait = self.bucket.reserve(timeout)
+        if wait is None:
+            raise ThrottleTimeout(f"Rate limit of {self.host} exceeds the deadline")
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            if not await self.limiter.acquire_async(None if timeout is None else timeout - (time.monotonic() - start)):
+                raise ThrottleTimeout(f"No request slot to {self.host} freed up in time")
+        except BaseException:
+            # timed out or cancelled, no request is sent
+            self.bucket.refund()
+            raise
+        self.waited += time.monotonic() - start
+
+        slot = _Slot()
+        sent = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self.limiter.release(*self._outcome(sent, slot.status))
+
+    def stats(self) -> dict[str, Any]:
+        return {"limit": int(self.limiter.limit), "in_flight": self.limiter.in_flight,
+                "decreases": self.limiter.decreases, "rate": self.bucket.rate, "waited": self.waited}
+
+
+class _Slot:
+    status: Optional[int] = None
+
+
+_lock = threading.Lock()
+_throttles: dict[str, HostThrottle] = {}
+_defaults: dict[str, Any] = {"rate": DEFAULT_RATE, "burst": DEFAULT_BURST,
+                             "concurrency": DEFAULT_CONCURRENCY, "max_concurrency": DEFAULT_MAX_CONCURRENCY}
+_host_config: dict[str, dict[str, Any]] = {}
+
+
+def throttle(host: str) -> HostThrottle:
+    """The shared HostThrottle of a host, e.g. "dirw002.eu-de.vmware.cloud.ibm.com"."""
+    t = _throttles.get(host)
+    if t is None:
+        with _lock:
+            t = _throttles.get(host)
+            if t is None:
+                t = _throttles[host] = HostThrottle(host, **{**_defaults, **_host_config.get(host, {})})
+    return t
+
+
+def configure_throttle(host: Optional[str] = None, rate: Optional[float] = None, burst: Optional[int] = None,
+                       concurrency: Optional[int] = None, max_concurrency: Optional[int] = None) -> None:
+    """Change the limits of one host, or the defaults of all hosts.
+
+    Args:
+        host: Host to configure, None for the defaults.
+        rate: Requests per second, 0 for no limit.
+        burst: Requests allowed at once above the rate.
+        concurrency: Starting limit of requests in flight.
+        max_concurrency: Highest limit of requests in flight.
+    """
+    settings = {k: v for k, v in (("rate", rate), ("burst", burst), ("concurrency", concurrency),
+                                  ("max_concurrency", max_concurrency)) if v is not None}
+    with _lock:
+        if host is None:
+            _defaults.update(settings)
+            _throttles.clear()
+        else:
+            _host_config.setdefault(host, {}).update(settings)
+            _throttles.pop(host, None)
+
+
+def throttle_stats() -> dict[str, dict[str, Any]]:
+    """Current limits and waits keyed by host."""
+    with _lock:
+        return {host: t.stats() for host, t in _throttles.items()}
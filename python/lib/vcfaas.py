@@ -5,13 +5,23 @@ https://cloud.ibm.com/apidocs/vmware-service#list-director-sites
 
 
 import logging
-from typing import Any
-
-from lib.requests_session import requests_session
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from lib.endpoints import vcfaas_url
+from lib.http_cache import cache_responses
+from lib.iam import iam_principal
+from lib.metrics import operation
+from lib.requests_session import add_auth_refresher, requests_session
+from lib.retry import retry_policy
 
 log = logging.getLogger(__name__)
 
 
+@operation
 def list_director_sites(ibm_iam_access_token: str, region: str) -> dict[str, Any]:
     """List Cloud Director site instances.
 
@@ -31,7 +41,7 @@ def list_director_sites(ibm_iam_access_token: str, region: str) -> dict[str, Any
     """
     s = requests_session()
 
-    base_url = f"https://api.{region}.vmware.cloud.ibm.com"
+    base_url = vcfaas_url(region)
 
     endpoint_url = "/".join([base_url, "v1", "director_sites"])
 
@@ -44,6 +54,8 @@ def list_director_sites(ibm_iam_access_token: str, region: str) -> dict[str, Any
 
     return r.json()
 
+@operation
+@cache_responses
 def get_director_site(ibm_iam_access_token: str, region: str, site_id: str) -> dict[str, Any]:
     """Get a director site based on its ID
 
@@ -61,7 +73,7 @@ def get_director_site(ibm_iam_access_token: str, region: str, site_id: str) -> d
     """
     s = requests_session()
 
-    base_url = f"https://api.{region}.vmware.cloud.ibm.com"
+    base_url = vcfaas_url(region)
 
     endpoint_url = "/".join([base_url, "v1", "director_sites", site_id])
 
@@ -78,6 +90,8 @@ def get_director_site(ibm_iam_access_token: str, region: str, site_id: str) -> d
 def get_vmware_access_token(ibm_iam_access_token: str, url: str, org: str) -> str:
     """Retreive a VMWare Cloud Director session token represent in the X-VMWARE-VCLOUD-ACCESS-TOKEN header.
 
+    The token comes from the cached session of get_vmware_session.
+
     Args:
         ibm_iam_access_token : An IBM IAM Session key
         url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
@@ -91,21 +105,10 @@ def get_vmware_access_token(ibm_iam_access_token: str, url: str, org: str) -> st
             can be raised due to, e.g., connection or authorization errors.
     """
 
-   # request retry mechanism
-    s = requests_session()
-
-    endpoint_url = "/".join([url, "cloudapi", "1.0.0", "sessions"])
-
-    headers = {"Authorization": f"Bearer {ibm_iam_access_token}; org={org}",
-               "Accept": "application/*;version=39.0"}
-
-    log.debug("Requesting VMWare Access Token")
-    r = s.post(url=endpoint_url, headers=headers)
-    r.raise_for_status()
-
-    return r.headers["X-VMWARE-VCLOUD-ACCESS-TOKEN"]
+    return get_vmware_session(ibm_iam_access_token, url, org).access_token
 
 
+@operation
 def list_vcfaas_vdcs(ibm_iam_access_token: str, region: str) -> dict[str, Any]:
     """Retreive all VDC's for a specific region
 
@@ -124,7 +127,7 @@ def list_vcfaas_vdcs(ibm_iam_access_token: str, region: str) -> dict[str, Any]:
    # request retry mechanism
     s = requests_session()
 
-    base_url = f"https://api.{region}.vmware.cloud.ibm.com"
+    base_url = vcfaas_url(region)
 
     endpoint_url = "/".join([base_url, "v1", "vdcs"])
 
@@ -136,6 +139,7 @@ def list_vcfaas_vdcs(ibm_iam_access_token: str, region: str) -> dict[str, Any]:
     r.raise_for_status()
     return r.json()
 
+@operation
 def create_vdc(ibm_iam_access_token: str, region: str, director_site_id: str,
                pvdc_id: str, vdc_name: str, resource_group_id: str, cpu: int = 1, ram: int = 1,
                edge: bool = False) -> dict[str, Any]:
@@ -162,7 +166,7 @@ def create_vdc(ibm_iam_access_token: str, region: str, director_site_id: str,
     # request retry mechanism
     s = requests_session()
 
-    base_url = f"https://api.{region}.vmware.cloud.ibm.com"
+    base_url = vcfaas_url(region)
     endpoint_url = "/".join([base_url, "v1", "vdcs"])
 
     headers = {"authorization": f"Bearer {ibm_iam_access_token}",
@@ -197,6 +201,7 @@ def create_vdc(ibm_iam_access_token: str, region: str, director_site_id: str,
 
 
 
+@operation
 def delete_vdc(ibm_iam_access_token: str, region: str, vdc_id: str) -> dict[str, Any]:
     """Delete a Virtual Data Center
 
@@ -216,7 +221,7 @@ def delete_vdc(ibm_iam_access_token: str, region: str, vdc_id: str) -> dict[str,
     # request retry mechanism
     s = requests_session()
 
-    base_url = f"https://api.{region}.vmware.cloud.ibm.com"
+    base_url = vcfaas_url(region)
     endpoint_url = "/".join([base_url, "v1", "vdcs", vdc_id])
     headers = {"authorization": f"Bearer {ibm_iam_access_token}"}
 
@@ -230,9 +235,11 @@ def delete_vdc(ibm_iam_access_token: str, region: str, vdc_id: str) -> dict[str,
 def get_org_id(ibm_iam_access_token: str, director_url: str, org: str) -> str:
     """Get the ORG ID 
 
+    The id comes from the cached session of get_vmware_session.
+
     Args:
         ibm_iam_access_token : An IBM IAM Session key
-        director: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
         org: The organization the Director Site is a memeber of
 
     Returns:
@@ -243,15 +250,313 @@ def get_org_id(ibm_iam_access_token: str, director_url: str, org: str) -> str:
             can be raised due to, e.g., connection or authorization errors.
     """
 
+    return get_vmware_session(ibm_iam_access_token, director_url, org).org_id
+
+
+class VmwareSession:
+    """A VMware Cloud Director session created from an IBM IAM token.
+
+    Attributes:
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        access_token: The X-VMWARE-VCLOUD-ACCESS-TOKEN to use as Bearer token.
+        org_id: The org id, eg, 35a720ad-2b98-4706-b9a2-739b65af7965
+        org_name: The org name.
+        user: The user the session belongs to.
+        expires_at: Epoch seconds after which the session is considered idle timed out.
+        idle_timeout: Seconds of inactivity after which the director times the session out.
+    """
+
+    def __init__(self, director_url: str, access_token: str, org_id: str, org_name: str,
+                 user: str, expires_at: float, idle_timeout: float = 1800) -> None:
+        self.director_url = director_url
+        self.access_token = access_token
+        self.org_id = org_id
+        self.org_name = org_name
+        self.user = user
+        self.expires_at = expires_at
+        self.idle_timeout = idle_timeout
+
+    def expired(self, margin: float = 60) -> bool:
+        return time.time() + margin >= self.expires_at
+
+    def touch(self) -> None:
+        """Push expires_at back, the idle timeout restarts each time the session is used."""
+        self.expires_at = time.time() + self.idle_timeout
+
+    def __repr__(self) -> str:
+        return f"VmwareSession({self.director_url}, org={self.org_name}, user={self.user})"
+
+
+@operation
+@retry_policy(idempotent=True, read_timeout=60)
+def create_vmware_session(ibm_iam_access_token: str, director_url: str, org: str) -> VmwareSession:
+    """Create a VMware Cloud Director session with a single POST to /cloudapi/1.0.0/sessions.
+
+    Args:
+        ibm_iam_access_token : An IBM IAM Session key
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        org: The organization the Director Site is a memeber of
+
+    Returns:
+        The new session with its access token, org and user.
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
    # request retry mechanism
     s = requests_session()
 
     endpoint_url = "/".join([director_url, "cloudapi", "1.0.0", "sessions"])
 
     headers = {"Authorization": f"Bearer {ibm_iam_access_token}; org={org}",
-               "Accept": "application/json;version=40.0.0-alpha"}
+               "Accept": "application/json;version=39.0"}
 
-    log.debug("Getting ORG ID for {org}")
+    log.debug(f"Creating VMware session for {org}")
     r = s.post(url=endpoint_url, headers=headers)
     r.raise_for_status()
-    return r.json()['org']['id'].split(':')[-1]
\ No newline at end of file
+    body = r.json()
+
+    idle_timeout = body.get("sessionIdleTimeoutMinutes") or 30
+
+    return VmwareSession(director_url = director_url,
+                         access_token = r.headers["X-VMWARE-VCLOUD-ACCESS-TOKEN"],
+                         org_id = body["org"]["id"].split(":")[-1],
+                         org_name = body["org"]["name"],
+                         user = body["user"]["name"],
+                         expires_at = time.time() + idle_timeout*60,
+                         idle_timeout = idle_timeout*60)
+
+
+@operation
+def delete_vmware_session(session: VmwareSession) -> None:
+    """Log out a VMware Cloud Director session with DELETE /cloudapi/1.0.0/sessions/current.
+
+    Args:
+        session: The session to log out.
+
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    s = requests_session()
+
+    endpoint_url = "/".join([session.director_url, "cloudapi", "1.0.0", "sessions", "current"])
+
+    headers = {"Authorization": f"Bearer {session.access_token}",
+               "Accept": "application/json;version=39.0"}
+
+    log.debug(f"Logging out VMware session for {session.org_name}")
+    r = s.delete(url=endpoint_url, headers=headers)
+    r.raise_for_status()
+
+
+class VmwareSessionPool:
+    """Bounded pool of VMware Cloud Director sessions keyed by (director_url, org, principal).
+
+    The principal is the IAM id the IAM access token was issued to, see
+    lib.iam.iam_principal, so callers of different API keys in the same org
+    each get a session of their own user.
+
+    The least recently used session is logged out when the pool is full,
+    and a session replaced after its idle timeout is logged out as well, so
+    long running fleet tooling does not pile up server side sessions. Each
+    get() restarts the idle timeout of the session it returns. A request
+    rejected with 401 because its session timed out is sent again with a
+    new session of the same org, see renew().
+
+    Args:
+        maxsize: Maximum number of live sessions.
+    """
+
+    def __init__(self, maxsize: int = 32) -> None:
+        self.maxsize = maxsize
+        self._sessions: OrderedDict[tuple[str, str, str], VmwareSession] = OrderedDict()
+        self._iam_tokens: dict[tuple[str, str, str], str] = {}
+        self._keys_by_token: dict[str, tuple[str, str, str]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple[str, str, str], threading.Lock] = {}
+        self.created = 0
+        self.evicted = 0
+        self.renewed = 0
+
+    def _key_lock(self, key: tuple[str, str, str]) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _forget_tokens(self, key: tuple[str, str, str]) -> None:
+        # called with self._lock held
+        for token in [t for t, k in self._keys_by_token.items() if k == key]:
+            del self._keys_by_token[token]
+
+    def _create(self, ibm_iam_access_token: str, key: tuple[str, str, str], logout_replaced: bool = True) -> VmwareSession:
+        session = create_vmware_session(ibm_iam_access_token, key[0], key[1])
+
+        evicted = []
+        with self._lock:
+            self.created += 1
+            replaced = self._sessions.pop(key, None)
+            # the tokens of the replaced session no longer map to the key, so
+            # its logout below is not redirected to the new session on 401
+            self._forget_tokens(key)
+            self._sessions[key] = session
+            self._iam_tokens[key] = ibm_iam_access_token
+            self._keys_by_token[session.access_token] = key
+
+            while len(self._sessions) > self.maxsize:
+                old_key, old_session = self._sessions.popitem(last=False)
+                self._iam_tokens.pop(old_key, None)
+                self._forget_tokens(old_key)
+                self.evicted += 1
+                evicted.append(old_session)
+
+        for old_session in evicted:
+            self._logout(old_session)
+
+        if replaced is not None and logout_replaced:
+            self._logout(replaced)
+            with self._lock:
+                if self._sessions.get(key) is session:
+                    # callers still holding the replaced session are redirected on 401
+                    self._keys_by_token[replaced.access_token] = key
+
+        return session
+
+    def _logout(self, session: VmwareSession) -> None:
+        try:
+            delete_vmware_session(session)
+        except Exception as e:
+            log.warning(f"Failed to log out {session}: {e}")
+
+    @staticmethod
+    def _key(ibm_iam_access_token: str, director_url: str, org: str) -> tuple[str, str, str]:
+        return (director_url.rstrip("/"), org, iam_principal(ibm_iam_access_token))
+
+    def get(self, ibm_iam_access_token: str, director_url: str, org: str) -> VmwareSession:
+        """Get the live session of the IAM token's user in an org, creating it when needed."""
+        key = self._key(ibm_iam_access_token, director_url, org)
+
+        with self._key_lock(key):
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is not None and not session.expired():
+                    self._sessions.move_to_end(key)
+                    session.touch()
+                    return session
+
+            return self._create(ibm_iam_access_token, key)
+
+    def renew(self, access_token: str) -> Optional[str]:
+        """Replace a session the director rejected with 401.
+
+        Args:
+            access_token: The rejected VMware access token.
+
+        Returns:
+            The access token of the replacement session, None when the
+            token does not belong to this pool.
+        """
+        with self._lock:
+            key = self._keys_by_token.get(access_token)
+        if key is None:
+            return None
+
+        with self._key_lock(key):
+            with self._lock:
+                session = self._sessions.get(key)
+                ibm_iam_access_token = self._iam_tokens.get(key)
+            if session is not None and session.access_token != access_token:
+                # another caller already renewed it
+                session.touch()
+                return session.access_token
+            if ibm_iam_access_token is None:
+                return None
+
+            try:
+                # the director rejected the session, there is nothing left to log out
+                session = self._create(ibm_iam_access_token, key, logout_replaced=False)
+            except Exception as e:
+                log.warning(f"Failed to renew VMware session of {key[2]} for {key[1]}: {e}")
+                return None
+
+        with self._lock:
+            self.renewed += 1
+            # callers still holding the old token are redirected as well
+            self._keys_by_token[access_token] = key
+
+        return session.access_token
+
+    def logout(self, ibm_iam_access_token: str, director_url: str, org: str) -> None:
+        """Log out and forget the session of the IAM token's user in an org."""
+        key = self._key(ibm_iam_access_token, director_url, org)
+
+        with self._lock:
+            session = self._sessions.pop(key, None)
+            self._iam_tokens.pop(key, None)
+            self._forget_tokens(key)
+
+        if session is not None:
+            self._logout(session)
+
+    def close(self) -> None:
+        """Log out every live session."""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._iam_tokens.clear()
+            self._keys_by_token.clear()
+
+        for session in sessions:
+            self._logout(session)
+
+    def stats(self) -> dict[str, int]:
+        """Counts of live, created, evicted and renewed sessions."""
+        with self._lock:
+            return {"live": len(self._sessions), "created": self.created,
+                    "evicted": self.evicted, "renewed": self.renewed}
+
+
+_session_pool = VmwareSessionPool(maxsize=int(os.environ.get("VMWARE_L4_VCD_SESSION_POOL_SIZE", 32)))
+add_auth_refresher(_session_pool.renew)
+
+
+def get_vmware_session(ibm_iam_access_token: str, director_url: str, org: str) -> VmwareSession:
+    """Get the pooled VMware Cloud Director session of an org, creating it when needed.
+
+    Sessions are pooled per (director_url, org) and IAM user, so every later
+    call of the same user in the process reuses the same server side session.
+
+    Args:
+        ibm_iam_access_token : An IBM IAM Session key
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        org: The organization the Director Site is a memeber of
+
+    Returns:
+        A VMware Cloud Director session.
+    
+    Raises:
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
+
+    return _session_pool.get(ibm_iam_access_token, director_url, org)
+
+
+def logout_vmware_session(ibm_iam_access_token: str, director_url: str, org: str) -> None:
+    """Log out the pooled VMware Cloud Director session of the IAM token's user in an org.
+
+    Args:
+        ibm_iam_access_token : An IBM IAM Session key
+        director_url: Director site base URL, eg, https://dirw002.eu-de.vmware.cloud.ibm.com
+        org: The organization the Director Site is a memeber of
+    """
+
+    _session_pool.logout(ibm_iam_access_token, director_url, org)
+
+
+def vmware_session_stats() -> dict[str, int]:
+    """Live, created, evicted and renewed counts of the VMware session pool."""
+
+    return _session_pool.stats()
@@ -2,16 +2,23 @@ import argparse
 import os
 import json
 import re
+import threading
 import uuid
 
 import lib.iam as iam
 import lib.vcfaas as vcfass
 import lib.cloud_director as cloud_director
 import lib.schematics as schematics
+import lib.api_tokens as api_tokens
+import lib.context as context
+import lib.dag as dag
+import lib.journal as journal
+from lib.tasks import COMPLETED_STATUS, TaskError
 
 from urllib.parse import urlparse
 from types import SimpleNamespace
 from netaddr import IPNetwork, IPAddress
+import requests
 
 schematics_catalog = {
     "petclinic" : {"folder": "petclinic",
@@ -19,6 +26,13 @@ schematics_catalog = {
           "workspace" : "petclinic"}
 }
 
+# answers meaning a resource recorded in the journal is gone
+_GONE = (403, 404)
+
+# labs of one org in this process share its catalog, see manage_catalog
+_catalog_locks: dict[tuple[str, str], threading.Lock] = {}
+_catalog_locks_lock = threading.Lock()
+
 lab_catalog = "PetClinic"
 lab_terraform = "petclinic"
 catalog_items = ["ibm-vcfaas-lab-apache2", "ibm-vcfaas-lab-mysql", "ibm-vcfaas-lab-tomcat"]
@@ -27,6 +41,10 @@ lab_catalog_items = {
         "ibm-vcfaas-lab-mysql": "https://s3.us-east.cloud-object-storage.appdomain.cloud/vcfaas-lab-images/ibm-vcfaas-lab-mysql.ovf",
         "ibm-vcfaas-lab-tomcat": "https://s3.us-east.cloud-object-storage.appdomain.cloud/vcfaas-lab-images/ibm-vcfaas-lab-tomcat.ovf"}
 
+def _catalog_lock(director_url: str, org: str) -> threading.Lock:
+    with _catalog_locks_lock:
+        return _catalog_locks.setdefault((director_url, org), threading.Lock())
+
 def parse_arg() -> argparse.Namespace:
     """Parse input arguments.
 
@@ -89,48 +107,55 @@ def generate_variable_store(env: dict, lab_number: str):
 
     return variablestore
 
-def main() -> int:
+def provision_lab(ibmcloud_api_key: str, ibmcloud_region: str, director_site_name: str,
+                  vdc_name: str) -> dag.Dag:
+    """Check the PetClinic lab of a VDC and provision what it misses.
 
-    # parse input arguments
-    args = parse_arg()
+    The output is printed with dag.echo(), see dag.capture_output() to
+    collect it.
+
+    Args:
+        ibmcloud_api_key: IBM IAM API key.
+        ibmcloud_region: VCF as a Service region, e.g. "eu-de".
+        director_site_name: Director site name.
+        vdc_name: Virtual data center name.
+
+    Returns:
+        The Dag of the checks and actions that ran, with their results
+        and times.
+
+    Raises:
+        lib.context.ContextNotFound: no site or VDC of that name in the region.
+        lib.dag.DagError: checks or actions failed.
+        requests.RequestException: all Requests package exceptions
+            can be raised due to, e.g., connection or authorization errors.
+    """
 
     #--------------------------------------------------------------
     # Get environment
     #--------------------------------------------------------------
 
-    print("Processing args...")
     # Get IBM Cloud Session Token
-    ibm_iam_access_token = iam.request_ibm_iam_access_token(
-        ibm_api_key=args.ibmcloud_api_key
+    ibm_iam_access_token = iam.get_ibm_iam_access_token(
+        ibm_api_key=ibmcloud_api_key
     )
 
-    # Get director site
-    print(f'Retrieving Director Site - {args.director_site_name} in region {args.ibmcloud_region}')
-    director_sites = vcfass.list_director_sites(
-        ibm_iam_access_token=ibm_iam_access_token, region=args.ibmcloud_region
-    )['director_sites']
-
-    site_names = [d["name"] for d in director_sites]
-    if args.director_site_name not in site_names:
-        print(f'Error: Site not found : {args.director_site_name}')
-        exit(1)
-
-    director_site = [d for d in director_sites if d.get('name') == args.director_site_name][0]
-
-    # Get Director URL for the Site
-    # Note: We assume we have at least 1 VDC which is always the case for multi-tenant sites
+    # Resolve the director site, VDC and org, from the context cache when warm
+    dag.echo(f'Retrieving Director Site - {director_site_name} in region {ibmcloud_region}')
+    dag.echo(f'Retrieving VDC- {vdc_name}')
+    ctx = context.resolve_context(ibmcloud_api_key, ibmcloud_region, director_site_name, vdc_name)
 
-    print(f'Retrieving VDC- {args.vdc_name}')
-    vdcs = vcfass.list_vcfaas_vdcs(region = args.ibmcloud_region,ibm_iam_access_token=ibm_iam_access_token)['vdcs']
-    vdc =  [v for v in vdcs if v['director_site']['id'] == director_site["id"] and v['name'] == args.vdc_name][0]
-    public_ip = vdc['edges'][0]['public_ips'][0]
-    director_url = urlparse(vdc['director_site']['url']).scheme + "://" + urlparse(vdc['director_site']['url']).netloc
-    org = vdc['org_name']
-    print(f'ORG = {org}')
-    print(f'Director_URL = {director_url}')
+    # Get VMware session, one POST gives both the access token and the Org Id.
+    # A stale cached context is resolved again, read it afterwards.
+    vmware_session = context.get_vmware_session(ibmcloud_api_key, ctx)
+    org_id = vmware_session.org_id
 
-    # Get Org Id
-    org_id = vcfass.get_org_id(ibm_iam_access_token, director_url, org)
+    vdc = ctx.vdc
+    public_ip = ctx.public_ip
+    director_url = ctx.director_url
+    org = ctx.org_name
+    dag.echo(f'ORG = {org}')
+    dag.echo(f'Director_URL = {director_url}')
 
     # Get Resource Group ID
     
@@ -140,218 +165,328 @@ def main() -> int:
     env = SimpleNamespace()
 
     env.schematics_lab = lab_terraform
-    env.schematics_workspace = f'{schematics_catalog[env.schematics_lab]["workspace"]}-{args.ibmcloud_region}'
+    env.schematics_workspace = f'{schematics_catalog[env.schematics_lab]["workspace"]}-{ibmcloud_region}'
     env.schematics_github = f'{schematics_catalog[env.schematics_lab]["github"]}'
     env.schematics_folder = f'{schematics_catalog[env.schematics_lab]["folder"]}'
     
-    env.ibmcloud_region = args.ibmcloud_region
-    env.director_site_name = args.director_site_name
+    env.ibmcloud_region = ibmcloud_region
+    env.director_site_name = director_site_name
     env.director_url = director_url
     env.director_vdc = vdc["name"]
     env.director_org_name = vdc["org_name"]
     env.org_id = org_id
-    env.director_site_id = vdc["director_site"]["id"]
-    env.ibmcloud_api_key = args.ibmcloud_api_key
-    env.resource_group_id = vdc['resource_group']['id']
+    env.director_site_id = ctx.site_id
+    env.ibmcloud_api_key = ibmcloud_api_key
+    env.resource_group_id = ctx.resource_group_id
     env.public_ip = public_ip
 
-    print('-----------------------------------------------')
-    print(f'ibmcloud_region: {env.ibmcloud_region}')
-    print(f'director_site_name: {env.director_site_name}')
-    print(f'director_url: {env.director_url}')
-    print(f'director_vdc_vdc: {env.director_vdc}')
-    print(f'director_org: {env.director_org_name}')
-    print(f'director_org: {env.org_id}')
-    print(f'director_site_id: {env.director_site_id}')
-    print(f'resource_group_id: {env.resource_group_id}')
-    print(f'schematics_workspace: {env.schematics_workspace}')
-    print(f'Schematics Lab: {env.schematics_lab}')
-    print(f'public_ip={env.public_ip}')
-    print('-----------------------------------------------')
+    dag.echo('-----------------------------------------------')
+    dag.echo(f'ibmcloud_region: {env.ibmcloud_region}')
+    dag.echo(f'director_site_name: {env.director_site_name}')
+    dag.echo(f'director_url: {env.director_url}')
+    dag.echo(f'director_vdc_vdc: {env.director_vdc}')
+    dag.echo(f'director_org: {env.director_org_name}')
+    dag.echo(f'director_org: {env.org_id}')
+    dag.echo(f'director_site_id: {env.director_site_id}')
+    dag.echo(f'resource_group_id: {env.resource_group_id}')
+    dag.echo(f'schematics_workspace: {env.schematics_workspace}')
+    dag.echo(f'Schematics Lab: {env.schematics_lab}')
+    dag.echo(f'public_ip={env.public_ip}')
+    dag.echo('-----------------------------------------------')
     
     # Get VMWare Access Token
-    print(f'Retrieving VMware Access Token')
-    vmware_access_token = vcfass.get_vmware_access_token(
-                                ibm_iam_access_token = ibm_iam_access_token, 
-                                url = env.director_url,
-                                org = env.director_org_name)
-    
-    # Check Schematics
-    print('')
-    print('Checking Schematics......')
-    print('--------------------------------------------------------')
-
-    workspace = {}
-    workspace_name = env.schematics_workspace
-    print(f'Searching for Schematics workspace {workspace_name}')
-    print('')
-    workspaces = schematics.ibm_schematics_list_workspaces(ibm_iam_access_token, 'Default')
-    for w in workspaces["workspaces"]:
-        if w["name"] == workspace_name:
-            workspace = w
-    
-    if workspace == {}:
-         print(f'Workspace: {workspace_name} not found, will need to be created')
-         action_schematics = True
-    else:
-        print(f'Workspace: {workspace_name} found. ')
-        action_schematics = False
-
-    # Check Catalog
-    print('')
-    print(f'Checking Catalog for {lab_catalog}......')
-    print('--------------------------------------------------------')
-
-    catalog_query = cloud_director.query_catalogs(director_url, vmware_access_token, filter=f'name=={lab_catalog}')
-    if len(catalog_query) == 1:
-        action_create_catalog = False
-        print(f'Found catalog {catalog_query[0]["name"]} with a HREF of : {catalog_query[0]["href"]}')
-
-    else:
-        print(f'Catalog {lab_catalog} does not exist and needs to be created.')
-        print('')
-        action_create_catalog = True
-
-    # Check if Public IP has been allocated as a FIP
-
-    ipspaces =  cloud_director.get_ipspaces(director_url = env.director_url, 
-                                            vmware_access_token = vmware_access_token)
-    ipspace_id = ""
-    for ipspace in ipspaces:
-        ipspace_details = cloud_director.get_ipspace(director_url = env.director_url, 
-                                            vmware_access_token = vmware_access_token,
-                                            ipspace_id = ipspace['id'])
-        if IPAddress(public_ip) in IPNetwork(ipspace_details['ipSpaceInternalScope'][0]):
-            ipspace_id = ipspace_details['id']
-            break
-    
-    if ipspace_id == "":
-        print(f'Error: Expected Public IP Address {args.director_site_name} has no associated IP Space')
-        exit(1)
-
-    print(f'Determine if public IP {public_ip} has been allocated yet')
-    ipspace_allocations =  cloud_director.ipspace_allocations(director_url = env.director_url, 
-                                            vmware_access_token = vmware_access_token,
-                                            ipspace_id = ipspace_id)
-    
-    if public_ip in [i['value'] for i in ipspace_allocations]:
-        action_fip = False
-    else:
-        action_fip = True
+    dag.echo(f'Retrieving VMware Access Token')
+    vmware_access_token = vmware_session.access_token
 
     #--------------------------------------------------------------
-    # Summary
+    # Checks and actions, each action runs as soon as its check is done
     #--------------------------------------------------------------
 
-    print('---------------------------------------')
-    print('ACTION SUMMARY')
-    print('---------------------------------------')
-
-    print(f'CATALOG CREATE : {action_create_catalog}')
-    print(f'CREATE SCHEMATICS : {action_schematics}')
-    print(f'ALLOCATION PUBLIC IP : {action_fip}')
-
-
-    # Manage Catalog
+    # steps completed by earlier runs, checked and skipped when their resources still exist
+    lab = journal.lab_journal(ibmcloud_api_key, ibmcloud_region, director_site_name, vdc_name)
 
-    print('---------------------------------------')
-    print('Manage Catalog')
-    print('---------------------------------------')
-
-    if action_create_catalog:
-
-        tasks = []
-        print(f'Creating Catalog: {lab_catalog}')
+    def get_if_exists(href):
         try:
-            catalog = cloud_director.create_catalog(director_url = env.director_url,
-                                                    vmware_access_token = vmware_access_token,
-                                                    org_id = org_id,
-                                                    catalog_name = lab_catalog)
-
-            tasks.append(catalog['tasks']['task'][0]["href"])
-
-        except Exception as e:
-            print((f'Failed to create Catalog: {lab_catalog}'))
-            print(e)
-
-        print('Waiting for tasks.....')
-        cloud_director.wait_for_tasks(
-                vmware_access_token=vmware_access_token,
-                tasks=tasks)
-        
-        print(f'Uploading {len(catalog_items)} Catalog Items')
+            return cloud_director.get_resource(vmware_access_token, href)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code not in _GONE:
+                raise
+            return None
+
+    def check_schematics():
+        workspace_name = env.schematics_workspace
+        workspaces = schematics.ibm_schematics_list_workspaces(ibm_iam_access_token, 'Default')
+        workspace = next((w for w in workspaces["workspaces"] if w["name"] == workspace_name), None)
+        if workspace is not None and (lab.get("workspace") or {}).get("id") != workspace["id"]:
+            lab.record("workspace", id=workspace["id"])
+        elif workspace is None:
+            lab.forget("workspace")
+
+        dag.echo('', 'Checking Schematics......', '--------------------------------------------------------',
+                 f'Searching for Schematics workspace {workspace_name}', '',
+                 f'Workspace: {workspace_name} not found, will need to be created' if workspace is None
+                 else f'Workspace: {workspace_name} found. ')
+        return workspace is None
+
+    def check_catalog():
+        lines = ['', f'Checking Catalog for {lab_catalog}......', '--------------------------------------------------------']
+
+        # the catalog of an earlier run, or the one of that name
+        catalog = None
+        recorded = lab.get("catalog")
+        if recorded is not None:
+            catalog = get_if_exists(recorded["href"])
+            if catalog is None:
+                lab.forget("catalog")
+        if catalog is None:
+            catalog_query = cloud_director.query_catalogs(director_url, vmware_access_token, filter=f'name=={lab_catalog}')
+            if len(catalog_query) == 1:
+                catalog = cloud_director.get_resource(vmware_access_token, catalog_query[0]["href"])
+                lab.record("catalog", id=catalog["id"], href=catalog["href"])
+
+        if catalog is None:
+            lines += [f'Catalog {lab_catalog} does not exist and needs to be created.', '']
+            dag.echo(*lines)
+            return {"catalog": None, "missing": list(catalog_items), "importing": {}, "broken": {}}
+
+        lines.append(f'Found catalog {catalog["name"]} with a HREF of : {catalog["href"]}')
+
+        # an item is listed as soon as it is uploaded, only a resolved one was imported,
+        # one still importing is waited for and one whose import failed is imported again
+        items = {i["name"]: i for i in cloud_director.query_catalog_items(director_url, vmware_access_token,
+                                                                          filter=f'catalog=={catalog["href"]}')}
+        missing, importing, broken = [], {}, {}
         for catalog_item in catalog_items:
-                
+            item = items.get(catalog_item)
+            if item is not None and item["status"] == "RESOLVED":
+                if lab.get(f'catalog_item:{catalog_item}') is None:
+                    lab.record(f'catalog_item:{catalog_item}', href=item["href"], entity=item["entity"])
+                continue
+
+            lab.forget(f'catalog_item:{catalog_item}')
+            if item is not None and item["status"] == "UNRESOLVED":
+                template = get_if_exists(item["entity"]) or {}
+                running = [t["href"] for t in (template.get("tasks") or {}).get("task") or []
+                           if t["status"].lower() not in COMPLETED_STATUS]
+                if running:
+                    importing[catalog_item] = running[0]
+                    continue
+            if item is not None:
+                broken[catalog_item] = item["href"]
+            missing.append(catalog_item)
+
+        if importing:
+            lines.append(f'Catalog items still importing: {", ".join(importing)}')
+        if broken:
+            lines.append(f'Catalog items failed to import: {", ".join(broken)}')
+        if missing:
+            lines.append(f'Catalog items missing: {", ".join(missing)}')
+        dag.echo(*lines)
+        return {"catalog": catalog, "missing": missing, "importing": importing, "broken": broken}
+
+    def find_ipspace():
+        # the IP space of an earlier run saves the scan of all of them
+        recorded = lab.get("ipspace")
+        if recorded is not None:
             try:
-                print(f'    Uploading {catalog_item}: {lab_catalog_items[catalog_item]}')
-                catalog_item = cloud_director.upload_ovf(director_url = env.director_url,
+                ipspace_details = cloud_director.get_ipspace(director_url = env.director_url,
+                                                             vmware_access_token = vmware_access_token,
+                                                             ipspace_id = recorded["id"])
+                if IPAddress(public_ip) in IPNetwork(ipspace_details['ipSpaceInternalScope'][0]):
+                    return ipspace_details['id']
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code not in _GONE:
+                    raise
+            lab.forget("ipspace")
+
+        ipspaces =  cloud_director.get_ipspaces(director_url = env.director_url,
+                                                vmware_access_token = vmware_access_token)
+        for ipspace in ipspaces:
+            ipspace_details = cloud_director.get_ipspace(director_url = env.director_url,
+                                                vmware_access_token = vmware_access_token,
+                                                ipspace_id = ipspace['id'])
+            if IPAddress(public_ip) in IPNetwork(ipspace_details['ipSpaceInternalScope'][0]):
+                lab.record("ipspace", id=ipspace_details['id'])
+                return ipspace_details['id']
+
+        raise LookupError(f'Expected Public IP Address {public_ip} has no associated IP Space')
+
+    def check_fip(ipspace):
+        dag.echo(f'Determine if public IP {public_ip} has been allocated yet')
+        ipspace_allocations =  cloud_director.ipspace_allocations(director_url = env.director_url,
+                                                vmware_access_token = vmware_access_token,
+                                                ipspace_id = ipspace)
+        allocated = public_ip in [i['value'] for i in ipspace_allocations]
+        if allocated and lab.get("fip") is None:
+            lab.record("fip", ipspace_id=ipspace, ip=public_ip)
+        elif not allocated:
+            lab.forget("fip")
+        return not allocated
+
+    def manage_catalog(catalog):
+        dag.echo('---------------------------------------', 'Manage Catalog', '---------------------------------------')
+
+        if not catalog["missing"] and not catalog["importing"]:
+            dag.echo("Nothing to do...")
+            return
+
+        # the catalog belongs to the org, another lab of this process, e.g. a
+        # classroom student of the same org, may have created it since the check
+        with _catalog_lock(director_url, org):
+            catalog = check_catalog()
+            while catalog["importing"]:
+                dag.echo('Waiting for the imports of an earlier run.....')
+                try:
+                    cloud_director.wait_for_tasks(vmware_access_token=vmware_access_token,
+                                                  tasks=list(catalog["importing"].values()))
+                except TaskError as e:
+                    dag.echo(f'    {e}')
+                # the failed imports are checked again as broken
+                catalog = check_catalog()
+
+            if not catalog["missing"]:
+                dag.echo("Nothing to do...")
+                return
+
+            if catalog["catalog"] is None:
+                dag.echo(f'Creating Catalog: {lab_catalog}')
+                created = cloud_director.create_catalog(director_url = env.director_url,
                                                         vmware_access_token = vmware_access_token,
-                                                        catalog_id = catalog['id'].split(':')[-1],
-                                                        ovf_url = lab_catalog_items[catalog_item],
-                                                        item_name = catalog_item)
+                                                        org_id = org_id,
+                                                        catalog_name = lab_catalog)
+
+                dag.echo('Waiting for tasks.....')
+                cloud_director.wait_for_tasks(
+                        vmware_access_token=vmware_access_token,
+                        tasks=[created['tasks']['task'][0]["href"]])
+                lab.record("catalog", id=created["id"], href=created["href"])
+                catalog_id = created["id"]
+            else:
+                catalog_id = catalog["catalog"]["id"]
+
+            if catalog["broken"]:
+                dag.echo(f'Deleting {len(catalog["broken"])} failed Catalog Items',
+                         *[f'    Deleting {i}: {href}' for i, href in catalog["broken"].items()])
+                deleted = [cloud_director.delete_catalog_item(vmware_access_token, href)["href"]
+                           for href in catalog["broken"].values()]
+                cloud_director.wait_for_tasks(vmware_access_token=vmware_access_token, tasks=deleted)
+
+            dag.echo(f'Uploading {len(catalog["missing"])} Catalog Items',
+                     *[f'    Uploading {i}: {lab_catalog_items[i]}' for i in catalog["missing"]])
+
+            def imported(catalog_item, result):
+                dag.echo(f'    {catalog_item}: {result["status"]} in {result["duration"]:.1f}s')
+                if result["status"] == "success":
+                    lab.record(f'catalog_item:{catalog_item}', href=result["item"]["href"],
+                               entity=result["item"]["entity"]["href"])
+
+            # all items are uploaded at once, the catalog is ready when the slowest import is
+            cloud_director.import_catalog_items(director_url = env.director_url,
+                                                vmware_access_token = vmware_access_token,
+                                                catalog_id = catalog_id.split(':')[-1],
+                                                items = {i: lab_catalog_items[i] for i in catalog["missing"]},
+                                                on_item = imported)
+
+    def get_api_token(action_schematics):
+        if not action_schematics:
+            return None
+
+        dag.echo(f'Retrieving API Token')
+        return api_tokens.get_apitoken(director_url, vmware_access_token, env.director_org_name, org_id,
+                                     vmware_session.user)
+
+    def manage_schematics(action_schematics, api_token):
+        dag.echo('---------------------------------------', 'Manage Schematics', '---------------------------------------')
+
+        if not action_schematics:
+            dag.echo("Nothing to do...")
+            return
+
+        env.api_token = api_token
+        dag.echo(f'Creating Scheamtics Workspace: {env.schematics_workspace}')
+        workspace = schematics.ibm_schematics_create_workspace(ibm_iam_access_token = ibm_iam_access_token,
+                                                               resource_group =  env.resource_group_id,
+                                                               workspace_name = f'{env.schematics_workspace}',
+                                                               description = 'Created by automation',
+                                                               template_repo = env.schematics_github,
+                                                               folder = env.schematics_folder,
+                                                               type = 'terraform_v1.6',
+                                                               variablestore = generate_variable_store(env, env.schematics_lab))
+        lab.record("workspace", id=workspace["id"])
+        dag.echo('Worspace creation successful, please visit https://cloud.ibm.com/schematics/workspaces.')
+
+        dag.echo('---------------------------------------',
+                 'Terrfaform Variables',
+                 '---------------------------------------',
+                 f'ibmcloud_api_key="{env.ibmcloud_api_key}"',
+                 f'ibmcloud_region="{env.ibmcloud_region}"',
+                 f'director_site_name="{env.director_site_name}"',
+                 f'director_url="{env.director_url}/api"',
+                 f'director_org_name="{env.director_org_name}"',
+                 f'vmware_api_token="{env.api_token}"',
+                 f'director_vdc="{env.director_vdc}"',
+                 f'public_ip="{env.public_ip}"')
+
+    def manage_fip(ipspace, action_fip):
+        dag.echo('---------------------------------------', 'Manage Public IP', '---------------------------------------')
+
+        if not action_fip:
+            return
+
+        dag.echo('Allocating Public IP Address as FIP')
+        task = cloud_director.ipspaces_allocate_ip(director_url = env.director_url,
+                                                   vmware_access_token = vmware_access_token,
+                                                   ipspace_id = ipspace)
+        cloud_director.wait_for_tasks(vmware_access_token=vmware_access_token, tasks=[task])
+        lab.record("fip", ipspace_id=ipspace, ip=public_ip)
+
+    steps = dag.Dag()
+    steps.add("action_schematics", check_schematics)
+    steps.add("catalog", check_catalog)
+    steps.add("ipspace", find_ipspace)
+    steps.add("action_fip", check_fip, after=["ipspace"])
+    steps.add("manage_catalog", manage_catalog, after=["catalog"])
+    steps.add("api_token", get_api_token, after=["action_schematics"])
+    steps.add("manage_schematics", manage_schematics, after=["action_schematics", "api_token"])
+    steps.add("manage_fip", manage_fip, after=["ipspace", "action_fip"])
+
+    results = steps.run()
+
+    #--------------------------------------------------------------
+    # Summary
+    #--------------------------------------------------------------
 
-            except Exception as e:
-                print((f'Failed to Upload Catalog Item: {catalog_item}'))
-                print(e)
+    dag.echo('---------------------------------------')
+    dag.echo('ACTION SUMMARY')
+    dag.echo('---------------------------------------')
 
-    else:
-        print("Nothing to do...")
+    dag.echo(f'CATALOG CREATE : {results["catalog"]["catalog"] is None}')
+    dag.echo(f'CATALOG ITEMS UPLOAD : {len(results["catalog"]["missing"])}')
+    dag.echo(f'CREATE SCHEMATICS : {results["action_schematics"]}')
+    dag.echo(f'ALLOCATION PUBLIC IP : {results["action_fip"]}')
 
-    # Manage Schematics
+    dag.echo('---------------------------------------')
+    dag.echo('STEP TIMES')
+    dag.echo('---------------------------------------')
+    dag.echo(steps.summary())
 
-    print('---------------------------------------')
-    print('Manage Schematics')
-    print('---------------------------------------')
+    return steps
 
-    if action_schematics:
+def main() -> int:
 
-        token_name = f'TOKEN-{uuid.uuid4()}'
-        print(f'Creating API Token {token_name}')
-        env.api_token = cloud_director.create_apitoken(director_url, vmware_access_token, env.director_org_name,  org_id, token_name)
+    # parse input arguments
+    args = parse_arg()
 
-        print(f'Creating Scheamtics Workspace: {env.schematics_workspace}')
-        try:
-            s = schematics.ibm_schematics_create_workspace(ibm_iam_access_token = ibm_iam_access_token,
-                                                            resource_group =  env.resource_group_id,
-                                                            workspace_name = f'{env.schematics_workspace}',
-                                                            description = 'Created by automation',
-                                                            template_repo = env.schematics_github,
-                                                            folder = env.schematics_folder,
-                                                            type = 'terraform_v1.6',
-                                                            variablestore = generate_variable_store(env, env.schematics_lab))
-            print('Worspace creation successful, please visit https://cloud.ibm.com/schematics/workspaces.')
-
-        except Exception as e:
-            print((f'Failed to create workspace: {env.schematics_workspace}'))
-            print(e)
-
-        print('---------------------------------------')
-        print('Terrfaform Variables')
-        print('---------------------------------------')
-
-        print(f'ibmcloud_api_key="{env.ibmcloud_api_key}"')
-        print(f'ibmcloud_region="{env.ibmcloud_region}"')
-        print(f'director_site_name="{env.director_site_name}"')
-        print(f'director_url="{env.director_url}/api"')
-        print(f'director_org_name="{env.director_org_name}"')
-        print(f'vmware_api_token="{env.api_token}"')
-        print(f'director_vdc="{env.director_vdc}"')
-        print(f'public_ip="{env.public_ip}"')
-
-    else:
-        print("Nothing to do...")
-
-    # Managed Public IP
-    print('---------------------------------------')
-    print('Manage Public IP')
-    print('---------------------------------------')
-
-    if action_fip:
-
-        print('Allocating Public IP Address as FIP')
-        task = cloud_director.ipspaces_allocate_ip(director_url = env.director_url,
-                                    vmware_access_token = vmware_access_token,
-                                    ipspace_id = ipspace_id)
+    print("Processing args...")
+    try:
+        provision_lab(args.ibmcloud_api_key, args.ibmcloud_region, args.director_site_name, args.vdc_name)
+    except context.ContextNotFound as e:
+        print(f'Error: {e}')
+        exit(1)
+    except dag.DagError as e:
+        print(f'Error: {e}')
+        print(e.dag.summary())
+        exit(1)
 
 if __name__ == "__main__":
     exit(main())
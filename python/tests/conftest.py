@@ -0,0 +1,80 @@
+"""Fixtures of the lib tests.
+
+The tests run against lib.fake_cloud, never against IBM Cloud. Run them
+from the python directory with:
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+import tempfile
+
+# the lib keeps its state files in VMWARE_L4_STATE_DIR, read when its modules are imported
+os.environ["VMWARE_L4_STATE_DIR"] = tempfile.mkdtemp(prefix="vmware-l4-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from lib import circuit, http_cache, retry, throttle
+from lib.fake_cloud import FakeCloud, FakeCloudServer
+
+
+@pytest.fixture(autouse=True)
+def fresh_transport(monkeypatch):
+    """Process wide retry budget, breakers, throttles and cache of each test start empty."""
+    monkeypatch.setattr(retry, "_budget", retry.RetryBudget())
+    monkeypatch.setattr(retry, "_default_policy", retry.RetryPolicy(base=0.01, cap=0.05))
+    monkeypatch.setattr(circuit, "_config", {})
+    circuit.configure_breakers()
+    monkeypatch.setattr(throttle, "_host_config", {})
+    throttle.configure_throttle()
+    http_cache.configure_cache()
+    yield
+
+
+@pytest.fixture
+def cloud(monkeypatch, request, tmp_path):
+    """A FakeCloud served on a local port, the lib pointed at it.
+
+    The process wide caches of IAM tokens, contexts, API tokens and lab
+    journals start empty, their entries would outlive the cloud of the
+    test. Tests pass FakeCloud arguments with @pytest.mark.cloud(...).
+    """
+    import lib.api_tokens as api_tokens
+    import lib.context as context
+    import lib.iam as iam
+    import lib.journal as journal
+    import lib.vcfaas as vcfaas
+    from lib.local_store import JsonFileStore
+
+    monkeypatch.setattr(iam, "_token_provider", iam.IamTokenProvider())
+    monkeypatch.setattr(context, "_resolver", context.ContextResolver(None))
+    monkeypatch.setattr(api_tokens, "_apitoken_store", api_tokens.ApiTokenStore(None))
+    monkeypatch.setattr(journal, "_store", JsonFileStore(str(tmp_path / "journal.json")))
+
+    marker = request.node.get_closest_marker("cloud")
+    fake = FakeCloud(**(marker.kwargs if marker else {}))
+    with FakeCloudServer(fake):
+        for name, value in fake.environ().items():
+            monkeypatch.setenv(name, value)
+        yield fake
+        # the pooled sessions of this cloud, before its port is reused
+        vcfaas._session_pool.close()
+
+
+@pytest.fixture
+def vcd(cloud):
+    """An IAM token and a VMware session of the first org of the cloud."""
+    import lib.iam as iam
+    import lib.vcfaas as vcfaas
+
+    org = cloud.orgs[0]
+    # not the token cache, its tokens would outlive the cloud of the test
+    ibm_iam_access_token = iam.request_ibm_iam_access_token("test-key")
+    session = vcfaas.create_vmware_session(ibm_iam_access_token, cloud.base_url, org.name)
+    return ibm_iam_access_token, session
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "cloud(**kwargs): FakeCloud arguments of the cloud fixture")
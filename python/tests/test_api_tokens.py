@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import lib.cloud_director as cloud_director
+import lib.iam as iam
+import lib.vcfaas as vcfaas
+from lib.api_tokens import ApiTokenStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ApiTokenStore(str(tmp_path / "api_tokens.json"))
+
+
+def _get(store, session):
+    return store.get_apitoken(session.director_url, session.access_token, session.org_name, session.org_id,
+                              session.user)
+
+
+def _names(session):
+    return [t["name"] for t in cloud_director.iter_apitokens(session.director_url, session.access_token)]
+
+
+def test_stored_token_is_reused(cloud, vcd, store):
+    _, session = vcd
+
+    assert _get(store, session) == _get(ApiTokenStore(store._store.path), session)
+    assert len(_names(session)) == 1
+
+
+def test_revoked_token_is_replaced(cloud, vcd, store):
+    _, session = vcd
+    first = _get(store, session)
+    token, = cloud_director.iter_apitokens(session.director_url, session.access_token)
+    cloud_director.delete_apitoken(session.director_url, session.access_token, token["id"])
+
+    assert _get(store, session) != first
+    # the replaced token is gone already, there is nothing to revoke
+    assert store.collect_stale(session.director_url, session.access_token, session.org_name, session.user) == []
+
+
+def test_replaced_token_still_listed_is_revoked(cloud, vcd, store, monkeypatch):
+    _, session = vcd
+    _get(store, session)
+    old, = _names(session)
+
+    # the listing lagged behind, the store took the live token for revoked
+    iter_apitokens = cloud_director.iter_apitokens
+    monkeypatch.setattr(cloud_director, "iter_apitokens", lambda *args, **kwargs: iter([]))
+    _get(store, session)
+    monkeypatch.setattr(cloud_director, "iter_apitokens", iter_apitokens)
+
+    assert store.collect_stale(session.director_url, session.access_token, session.org_name, session.user) == [old]
+    assert old not in _names(session)
+    assert len(_names(session)) == 1
+
+
+def test_concurrent_callers_share_one_token(cloud, vcd, store):
+    _, session = vcd
+
+    with ThreadPoolExecutor(8) as executor:
+        tokens = set(executor.map(lambda _: _get(store, session), range(8)))
+
+    assert len(tokens) == 1
+    assert len(_names(session)) == 1
+
+
+def test_users_of_one_org_get_their_own_tokens(cloud, vcd, store):
+    _, student1 = vcd
+    student2 = vcfaas.create_vmware_session(iam.request_ibm_iam_access_token("other-key"), cloud.base_url,
+                                            cloud.orgs[0].name)
+
+    assert student1.user != student2.user
+    assert _get(store, student1) != _get(store, student2)
+    assert _get(store, student1) == _get(store, student1)
+    assert store.collect_stale(student2.director_url, student2.access_token, student2.org_name, student2.user) == []
+    assert len(_names(student1)) == 1
+    assert len(_names(student2)) == 1
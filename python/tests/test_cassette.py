@@ -0,0 +1,87 @@
+import json
+
+import pytest
+import requests
+
+import lib.iam as iam
+import lib.requests_session as requests_session
+import lib.vcfaas as vcfaas
+from lib.cassette import ReplayAdapter, _placeholder, _redact_json, redact_headers, redact_url
+from lib.cloud_director import query_vm
+
+
+@pytest.fixture
+def cassette(tmp_path):
+    """Path of a cassette, recording and replay are off again after the test."""
+    yield str(tmp_path / "cassette.jsonl")
+    requests_session.configure_cassette()
+
+
+def _run(cloud):
+    org = cloud.orgs[0].name
+    ibm_iam_access_token = iam.request_ibm_iam_access_token("test-key")
+    session = vcfaas.create_vmware_session(ibm_iam_access_token, cloud.base_url, org)
+    return ibm_iam_access_token, session, query_vm(cloud.base_url, session.access_token, "")
+
+
+@pytest.mark.cloud(vms=300)
+def test_a_recorded_run_replays_without_the_cloud(cloud, cassette):
+    requests_session.configure_cassette(record=cassette)
+    _, _, vms = _run(cloud)
+    requests_session.configure_cassette()
+
+    cloud.reset_stats()
+    requests_session.configure_cassette(replay=cassette)
+    _, session, replayed = _run(cloud)
+
+    assert replayed == vms
+    assert session.org_id
+    assert cloud.stats()["total_requests"] == 0
+
+
+def test_secrets_are_redacted_and_stay_recognizable(cloud, cassette):
+    requests_session.configure_cassette(record=cassette)
+    ibm_iam_access_token, session, _ = _run(cloud)
+    requests_session.configure_cassette()
+
+    text = open(cassette).read()
+    for secret in ("test-key", ibm_iam_access_token, session.access_token):
+        assert secret not in text
+
+    interactions = [json.loads(line) for line in text.splitlines()]
+    # the IAM token issued in one response is the one sent in the next request
+    issued = json.loads(interactions[0]["response_body"])["access_token"]
+    assert issued == _placeholder(ibm_iam_access_token)
+    assert interactions[1]["request_headers"]["Authorization"].startswith(f"Bearer {issued}")
+
+
+def test_redaction_of_fields_headers_and_urls():
+    variablestore = [{"name": "ibmcloud_api_key", "value": "key", "secure": True},
+                     {"name": "director_vdc", "value": "vdc"}]
+
+    assert _redact_json(variablestore) == [{"name": "ibmcloud_api_key", "value": _placeholder("key"), "secure": True},
+                                           {"name": "director_vdc", "value": "vdc"}]
+    assert redact_headers({"Authorization": "Bearer abc;org=lab", "Accept": "application/json"}) == \
+        {"Authorization": f"Bearer {_placeholder('abc')};org=lab", "Accept": "application/json"}
+    assert redact_url("https://host/path?apikey=abc&page=2") == f"https://host/path?apikey={_placeholder('abc')}&page=2"
+
+
+def test_replay_serves_recordings_in_order(tmp_path):
+    path = tmp_path / "cassette.jsonl"
+    polls = [{"method": "GET", "url": "https://host/api/task/1", "request_headers": {}, "request_body": None,
+              "status": 200, "reason": "OK", "response_headers": {"Content-Type": "application/json"},
+              "response_body": json.dumps({"status": status}), "elapsed": 0.01, "time": 0}
+             for status in ("running", "success")]
+    page = {**polls[0], "url": "https://host/api/query?type=vm&page=2", "response_body": '{"page": 2}'}
+    path.write_text("\n".join(json.dumps(i) for i in polls + [page]) + "\n")
+
+    s = requests.Session()
+    adapter = ReplayAdapter(str(path))
+    s.mount("https://", adapter)
+
+    assert [s.get("https://host/api/task/1").json()["status"] for _ in range(3)] == ["running", "success", "success"]
+    assert adapter.unused() == [("GET", "https://host/api/query?page=2&type=vm")]
+    # the query parameters match in any order
+    assert s.get("https://host/api/query", params={"page": 2, "type": "vm"}).json() == {"page": 2}
+    with pytest.raises(requests.ConnectionError):
+        s.get("https://host/api/task/2")
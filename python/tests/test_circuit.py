@@ -0,0 +1,66 @@
+import time
+
+import pytest
+import requests
+
+from lib import circuit, retry
+from lib.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from lib.requests_session import requests_session
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("test", consecutive_failures=2, open_seconds=0.05)
+    breaker.record(False)
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # the probe is in flight, the other callers are still rejected
+    assert not breaker.allow()
+
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_failed_probe_doubles_the_open_time():
+    breaker = CircuitBreaker("test", consecutive_failures=1, open_seconds=0.05)
+    breaker.record(False)
+    time.sleep(0.06)
+
+    assert breaker.allow()
+    breaker.record(False)
+
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert not breaker.allow()
+    time.sleep(0.05)
+    assert breaker.allow()
+
+
+def test_probe_never_sent_frees_the_probe():
+    breaker = CircuitBreaker("test", consecutive_failures=1, open_seconds=0.0)
+    breaker.record(False)
+
+    assert breaker.allow()
+    breaker.record(None)
+    assert breaker.allow()
+
+
+@pytest.mark.cloud(error_rate=1.0)
+def test_open_breaker_rejects_without_sending(cloud):
+    circuit.configure_breakers(consecutive_failures=2, open_seconds=60)
+    url = f"{cloud.base_url}/us-south/v1/director_sites"
+
+    with retry.retry_policy(total=0):
+        for _ in range(2):
+            assert requests_session().get(url).status_code >= 500
+        with pytest.raises(circuit.CircuitOpenError):
+            requests_session().get(url)
+
+    assert cloud.stats()["total_requests"] == 2
+    assert isinstance(circuit.CircuitOpenError("x"), requests.ConnectionError)
@@ -0,0 +1,85 @@
+import argparse
+import threading
+import time
+import uuid
+
+import pytest
+
+import classroom
+
+
+def _lab(name, api_key, director_url="https://dir1.example.com"):
+    return {"name": name, "log": name, "ibmcloud_api_key": api_key, "ibmcloud_region": "us-south",
+            "director_site_name": "site", "vdc_name": f"vdc-{name}", "director_url": director_url}
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    """Labs run by run_labs without a cloud, with the peak count of each account and director."""
+    running = {}
+    peaks = {}
+    lock = threading.Lock()
+
+    def provision(lab, queued, logs=None):
+        keys = [lab["ibmcloud_api_key"], lab["director_url"], "all"]
+        with lock:
+            for key in keys:
+                running[key] = running.get(key, 0) + 1
+                peaks[key] = max(peaks.get(key, 0), running[key])
+        time.sleep(0.05)
+        with lock:
+            for key in keys:
+                running[key] -= 1
+        return {**classroom._result(lab, queued), "time": 0.05}
+
+    monkeypatch.setattr(classroom, "resolve", lambda lab: lab["director_url"])
+    monkeypatch.setattr(classroom, "provision", provision)
+    return peaks
+
+
+def test_labs_run_within_the_caps(scheduled):
+    labs = [_lab(f"a{i}", "key-a") for i in range(4)] + [_lab(f"b{i}", "key-b", "https://dir2.example.com")
+                                                       for i in range(4)]
+
+    results = classroom.run_labs(labs, classroom.Limits(per_director=8, per_account=2), max_labs=3)
+
+    assert [r["status"] for r in results] == ["ok"] * 8
+    assert scheduled["key-a"] == scheduled["key-b"] == 2
+    assert scheduled["all"] == 3
+
+
+def test_caps_below_one_are_rejected():
+    with pytest.raises(ValueError):
+        classroom.Limits(per_director=0, per_account=1)
+    with pytest.raises(ValueError):
+        classroom.run_labs([], classroom.Limits(1, 1), max_labs=0)
+    with pytest.raises(argparse.ArgumentTypeError):
+        classroom.positive_int("0")
+
+
+def test_labs_that_can_never_start_fail(scheduled):
+    class Closed(classroom.Limits):
+        def free(self, lab):
+            return False
+
+    results = classroom.run_labs([_lab("a", "key-a")], Closed(1, 1), max_labs=1)
+
+    assert results[0]["status"] == "failed"
+
+
+@pytest.mark.cloud(task_duration=0.1)
+def test_two_students_of_one_org(cloud):
+    org = cloud.orgs[0]
+    labs = [{"name": name, "log": name, "ibmcloud_api_key": f"{name}-{uuid.uuid4()}", "ibmcloud_region": org.region,
+             "director_site_name": cloud.sites[org.region]["name"], "vdc_name": org.vdc_name}
+            for name in ("alice", "bob")]
+
+    results = classroom.run_labs(labs, classroom.Limits(per_director=8, per_account=1), max_labs=2)
+
+    assert [r["status"] for r in results] == ["ok", "ok"], [r["error"] for r in results]
+    # each student signed in as their own user, with a token of their own
+    assert len({user for _, _, user in cloud._sessions.values()}) == 2
+    assert len({t["user"] for t in cloud._api_tokens.values()}) == 2
+    # the org catalog was created once and filled once
+    catalog, = cloud.orgs[0].catalogs.values()
+    assert len(catalog["items"]) == 3
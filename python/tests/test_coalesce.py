@@ -0,0 +1,72 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lib import coalesce
+from lib.requests_session import requests_session
+
+
+def test_concurrent_calls_share_one_flight():
+    flight = coalesce.SingleFlight()
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    def call():
+        barrier.wait()
+        return flight.do("key", work)
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: call(), range(8)))
+
+    assert len(calls) == 1
+    assert all(result == "result" for result, _ in results)
+    assert sum(shared for _, shared in results) == 7
+
+
+def test_error_reaches_every_caller():
+    flight = coalesce.SingleFlight()
+    barrier = threading.Barrier(4)
+
+    def work():
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    def call():
+        barrier.wait()
+        with pytest.raises(ValueError):
+            flight.do("key", work)
+
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda _: call(), range(4)))
+
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_only_gets_are_coalesced():
+    assert coalesce.request_key("GET", "https://h/a") is not None
+    assert coalesce.request_key("POST", "https://h/a") is None
+    # other principals never share a response
+    assert (coalesce.request_key("GET", "https://h/a", {"Authorization": "Bearer a"})
+            != coalesce.request_key("GET", "https://h/a", {"Authorization": "Bearer b"}))
+
+
+@pytest.mark.cloud(latency=0.3)
+def test_identical_gets_send_one_request(cloud, vcd):
+    ibm_iam_access_token, _ = vcd
+    url = f"{cloud.base_url}/us-south/v1/director_sites"
+    headers = {"Authorization": f"Bearer {ibm_iam_access_token}"}
+    cloud.reset_stats()
+
+    with ThreadPoolExecutor(8) as executor:
+        responses = list(executor.map(lambda _: requests_session().get(url, headers=headers), range(8)))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.text for r in responses}) == 1
+    assert cloud.stats()["total_requests"] < 8
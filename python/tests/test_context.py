@@ -0,0 +1,117 @@
+import pytest
+import requests
+
+from lib import context, endpoints, retry
+from lib.circuit import CircuitOpenError
+
+
+def test_default_regions_cover_the_regions_the_lib_uses(monkeypatch):
+    monkeypatch.delenv("VCFAAS_REGIONS", raising=False)
+
+    assert {"us-south", "eu-de", "eu-fr2"} <= set(endpoints.vcfaas_regions())
+
+    monkeypatch.setenv("VCFAAS_REGIONS", "eu-fr2, xx-new")
+    assert endpoints.vcfaas_regions() == ["eu-fr2", "xx-new"]
+
+
+@pytest.mark.cloud(orgs=4, regions=["us-south", "eu-fr2"])
+def test_discovery_merges_every_region(cloud):
+    resolver = context.ContextResolver(None)
+
+    discovery = resolver.discover("discovery-key")
+
+    assert set(discovery.inventories) == {"us-south", "eu-fr2"}
+    assert not discovery.errors
+    assert len(discovery.vdcs) == 4
+    org = cloud.orgs[1]
+    found, = discovery.find_vdc(org.vdc_name)
+    assert found.region == org.region == "eu-fr2"
+    assert found.site_name == cloud.sites["eu-fr2"]["name"]
+
+
+@pytest.mark.cloud(regions=["us-south"])
+def test_failed_region_is_reported_not_raised(cloud):
+    resolver = context.ContextResolver(None)
+
+    discovery = resolver.discover("discovery-key", regions=["us-south", "xx-gone"])
+
+    assert set(discovery.inventories) == {"us-south"}
+    assert set(discovery.errors) == {"xx-gone"}
+
+
+@pytest.mark.cloud(orgs=2, regions=["us-south", "eu-fr2"])
+def test_discovery_fetches_each_region_once(cloud):
+    resolver = context.ContextResolver(None)
+    resolver.discover("discovery-key")
+    cloud.reset_stats()
+
+    resolver.discover("discovery-key")
+
+    assert cloud.stats()["total_requests"] == 0
+
+
+def _cached_context(resolver, cloud, api_key="context-key"):
+    org = cloud.orgs[0]
+    resolver.resolve(api_key, org.region, cloud.sites[org.region]["name"], org.vdc_name)
+    ctx = resolver.resolve(api_key, org.region, cloud.sites[org.region]["name"], org.vdc_name)
+    assert ctx.cached
+    return ctx
+
+
+def _move_director(ctx, url):
+    # the cached lists still name a director the VDC has left
+    ctx.vdc["director_site"]["url"] = url
+
+
+def test_warm_resolve_needs_no_request(cloud):
+    resolver = context.ContextResolver(None)
+    _cached_context(resolver, cloud)
+
+    assert resolver.fetches == 1
+
+
+def test_director_that_no_longer_resolves_is_resolved_again(cloud):
+    resolver = context.ContextResolver(None)
+    ctx = _cached_context(resolver, cloud)
+    _move_director(ctx, "https://director.invalid")
+
+    session = resolver.vmware_session("context-key", ctx)
+
+    assert resolver.fetches == 2
+    assert ctx.director_url == session.director_url == cloud.base_url
+
+
+def test_org_the_director_rejects_is_resolved_again(cloud):
+    resolver = context.ContextResolver(None)
+    ctx = _cached_context(resolver, cloud)
+    ctx.vdc["org_name"] = "org-gone"
+
+    session = resolver.vmware_session("context-key", ctx)
+
+    assert resolver.fetches == 2
+    assert ctx.org_name == session.org_name == cloud.orgs[0].name
+
+
+@pytest.mark.parametrize("error", [CircuitOpenError("open"), requests.ConnectionError("refused")])
+def test_outage_is_raised_without_discovery(cloud, monkeypatch, error):
+    resolver = context.ContextResolver(None)
+    ctx = _cached_context(resolver, cloud)
+
+    def get_vmware_session(*args):
+        raise error
+
+    monkeypatch.setattr(context.vcfaas, "get_vmware_session", get_vmware_session)
+
+    with pytest.raises(requests.ConnectionError):
+        resolver.vmware_session("context-key", ctx)
+    assert resolver.fetches == 1
+
+
+def test_refused_connection_to_the_director_is_raised(cloud):
+    resolver = context.ContextResolver(None)
+    ctx = _cached_context(resolver, cloud)
+    _move_director(ctx, "http://127.0.0.1:9")
+
+    with retry.retry_policy(total=0), pytest.raises(requests.ConnectionError):
+        resolver.vmware_session("context-key", ctx)
+    assert resolver.fetches == 1
@@ -0,0 +1,51 @@
+import threading
+import time
+
+import pytest
+
+from lib.dag import Dag, DagError
+
+
+def test_failed_step_skips_its_dependents_only():
+    dag = Dag()
+    dag.add("vdc", lambda: "vdc-1")
+    dag.add("network", lambda vdc: (_ for _ in ()).throw(RuntimeError("no edge")), after=["vdc"])
+    dag.add("vapp", lambda network: "vapp-1", after=["network"])
+    dag.add("catalog", lambda: "catalog-1")
+
+    with pytest.raises(DagError) as e:
+        dag.run()
+
+    assert list(e.value.failures) == ["network"]
+    assert isinstance(e.value.failures["network"], RuntimeError)
+    assert e.value.skipped == ["vapp"]
+    assert dag.steps["catalog"].result == "catalog-1"
+
+
+def test_results_reach_the_steps_that_need_them():
+    dag = Dag()
+    dag.add("a", lambda: 1)
+    dag.add("b", lambda: 2)
+    dag.add("sum", lambda a, b: a + b, after=["a", "b"])
+
+    assert dag.run()["sum"] == 3
+
+
+def test_independent_steps_overlap():
+    dag = Dag(max_workers=4)
+    barrier = threading.Barrier(4, timeout=2)
+    for name in "abcd":
+        # each step waits for the other three, so they must run at once
+        dag.add(name, barrier.wait)
+
+    start = time.perf_counter()
+    dag.run()
+
+    assert time.perf_counter() - start < 1
+
+
+def test_unknown_dependency_is_rejected():
+    dag = Dag()
+
+    with pytest.raises(ValueError):
+        dag.add("vapp", lambda network: None, after=["network"])
@@ -0,0 +1,53 @@
+import pytest
+
+from lib import http_cache
+from lib.requests_session import requests_session
+
+
+@pytest.mark.cloud()
+def test_unchanged_resource_is_served_from_a_304(cloud, vcd):
+    ibm_iam_access_token, _ = vcd
+    url = f"{cloud.base_url}/us-south/v1/director_sites"
+    headers = {"Authorization": f"Bearer {ibm_iam_access_token}"}
+
+    with http_cache.cache_responses():
+        first = requests_session().get(url, headers=headers)
+        bytes_out = cloud.stats()["bytes_out"]
+        second = requests_session().get(url, headers=headers)
+
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    # the second answer was a 304 without a body
+    assert cloud.stats()["bytes_out"] == bytes_out
+    assert http_cache.cache_stats()["hits"] == 1
+
+
+@pytest.mark.cloud()
+def test_gets_outside_cache_responses_are_not_cached(cloud, vcd):
+    ibm_iam_access_token, _ = vcd
+    url = f"{cloud.base_url}/us-south/v1/director_sites"
+    headers = {"Authorization": f"Bearer {ibm_iam_access_token}"}
+
+    requests_session().get(url, headers=headers)
+    requests_session().get(url, headers=headers)
+
+    assert http_cache.cache_stats()["entries"] == 0
+
+
+def test_cache_evicts_least_recently_used():
+    cache = http_cache.ResponseCache(max_entries=2)
+    for key in ("a", "b"):
+        cache.put(key, http_cache.CachedResponse(200, {"ETag": '"1"'}, b"x", key))
+    cache.get("a")
+    cache.put("c", http_cache.CachedResponse(200, {"ETag": '"1"'}, b"x", "c"))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+
+
+def test_304_refreshes_the_stored_validators():
+    entry = http_cache.CachedResponse(200, {"ETag": '"1"', "Content-Type": "application/json"}, b"{}", "u")
+    entry.refresh({"etag": '"2"'})
+
+    assert entry.validators == {"If-None-Match": '"2"'}
+    assert entry.headers["Content-Type"] == "application/json"
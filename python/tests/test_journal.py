@@ -0,0 +1,86 @@
+import pytest
+
+import lib.cloud_director as cloud_director
+import lib.journal as journal
+import petclinic
+from lib.local_store import JsonFileStore
+
+
+def test_steps_survive_a_rerun(tmp_path):
+    store = JsonFileStore(str(tmp_path / "journal.json"))
+    lab = journal.Journal(store, journal.lab_key("key", "us-south", "site", "vdc"))
+
+    lab.record("catalog", id="urn:vcloud:catalog:1", href="https://dir/api/catalog/1")
+    lab.record("fip", ip="10.0.0.1")
+    lab.forget("fip")
+
+    rerun = journal.Journal(store, journal.lab_key("key", "us-south", "site", "vdc"))
+    assert rerun.get("catalog")["id"] == "urn:vcloud:catalog:1"
+    assert rerun.get("fip") is None
+    # the labs of other keys are apart, and the key itself is not stored
+    assert journal.Journal(store, journal.lab_key("other", "us-south", "site", "vdc")).get("catalog") is None
+    assert "key|" not in (tmp_path / "journal.json").read_text()
+
+    rerun.clear()
+    assert journal.Journal(store, rerun.lab).steps == {}
+
+
+def _provision(cloud):
+    org = cloud.orgs[0]
+    site_name = cloud.sites[org.region]["name"]
+    petclinic.provision_lab("test-key", org.region, site_name, org.vdc_name)
+    return journal.lab_journal("test-key", org.region, site_name, org.vdc_name)
+
+
+def _catalog(cloud, vcd):
+    _, session = vcd
+    created = cloud_director.create_catalog(cloud.base_url, session.access_token, session.org_id,
+                                            petclinic.lab_catalog)
+    cloud_director.wait_for_tasks(session.access_token, [created["tasks"]["task"][0]["href"]])
+    return created
+
+
+def _items(cloud, vcd, catalog):
+    _, session = vcd
+    return {i["name"]: i for i in cloud_director.query_catalog_items(cloud.base_url, session.access_token,
+                                                                     filter=f'catalog=={catalog["href"]}')}
+
+
+@pytest.mark.cloud(task_duration=0.1)
+def test_failed_imports_are_imported_again(cloud, vcd):
+    _, session = vcd
+    catalog = _catalog(cloud, vcd)
+    cloud.task_error_rate = 1.0
+    with pytest.raises(cloud_director.CatalogImportError):
+        cloud_director.import_catalog_items(cloud.base_url, session.access_token, catalog["id"].split(":")[-1],
+                                            items=petclinic.lab_catalog_items)
+    # listed by name, but never imported
+    assert {i["status"] for i in _items(cloud, vcd, catalog).values()} == {"FAILED_CREATION"}
+    cloud.task_error_rate = 0.0
+
+    lab = _provision(cloud)
+
+    items = _items(cloud, vcd, catalog)
+    assert sorted(items) == sorted(petclinic.catalog_items)
+    assert {i["status"] for i in items.values()} == {"RESOLVED"}
+    for name, item in items.items():
+        assert lab.get(f"catalog_item:{name}")["href"] == item["href"]
+
+
+@pytest.mark.cloud(task_duration=0.5)
+def test_running_imports_are_waited_for(cloud, vcd):
+    _, session = vcd
+    catalog = _catalog(cloud, vcd)
+    name = petclinic.catalog_items[0]
+    cloud_director.upload_ovf(cloud.base_url, session.access_token, catalog["id"].split(":")[-1],
+                              petclinic.lab_catalog_items[name], name)
+    uploaded = _items(cloud, vcd, catalog)[name]
+    assert uploaded["status"] == "UNRESOLVED"
+
+    lab = _provision(cloud)
+
+    items = _items(cloud, vcd, catalog)
+    assert {i["status"] for i in items.values()} == {"RESOLVED"}
+    # the running import was not uploaded a second time
+    assert items[name]["href"] == uploaded["href"]
+    assert lab.get(f"catalog_item:{name}")["href"] == uploaded["href"]
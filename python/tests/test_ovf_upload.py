@@ -0,0 +1,129 @@
+import os
+import tarfile
+
+import pytest
+import requests
+
+import lib.cloud_director as cloud_director
+import lib.ovf_upload as ovf_upload
+from lib.local_store import JsonFileStore
+
+DISKS = {"disk1.vmdk": 10000, "disk2.vmdk": 3000}
+
+DESCRIPTOR = """<?xml version="1.0" encoding="UTF-8"?>
+<Envelope xmlns="http://schemas.dmtf.org/ovf/envelope/1" xmlns:ovf="http://schemas.dmtf.org/ovf/envelope/1">
+  <References>
+{files}
+  </References>
+</Envelope>
+"""
+
+
+@pytest.fixture
+def package(tmp_path):
+    """An .ovf with its disks next to it."""
+    for name, size in DISKS.items():
+        (tmp_path / name).write_bytes(os.urandom(size))
+    files = "\n".join(f'    <File ovf:href="{n}" ovf:id="{n}" ovf:size="{s}"/>' for n, s in DISKS.items())
+    (tmp_path / "item.ovf").write_text(DESCRIPTOR.format(files=files))
+    return str(tmp_path / "item.ovf")
+
+
+@pytest.fixture
+def checkpoints(monkeypatch, tmp_path):
+    """The upload checkpoints of the test, apart from those of the others."""
+    store = JsonFileStore(str(tmp_path / "uploads.json"))
+    monkeypatch.setattr(ovf_upload, "_store", store)
+    return store
+
+
+@pytest.fixture
+def catalog(vcd, cloud):
+    _, session = vcd
+    created = cloud_director.create_catalog(cloud.base_url, session.access_token, session.org_id, "Images")
+    cloud_director.wait_for_tasks(session.access_token, [created["tasks"]["task"][0]["href"]])
+    return created
+
+
+def _status(cloud, vcd, catalog):
+    _, session = vcd
+    return {i["name"]: i["status"] for i in cloud_director.query_catalog_items(
+        cloud.base_url, session.access_token, filter=f'catalog=={catalog["href"]}')}
+
+
+def test_missing_chunks_skip_the_ranges_sent():
+    assert ovf_upload._missing([], 5000, 2048) == [(0, 2048), (2048, 4096), (4096, 5000)]
+    assert ovf_upload._missing([(2048, 3072), (0, 1024)], 5000, 4096) == [(1024, 2048), (3072, 5000)]
+    assert ovf_upload._missing([(0, 5000)], 5000, 1024) == []
+    assert ovf_upload._missing([], 0, 1024) == [(0, 0)]
+
+
+@pytest.mark.cloud(task_duration=0.1)
+def test_push_ovf(cloud, vcd, catalog, package, checkpoints):
+    _, session = vcd
+
+    upload = ovf_upload.push_ovf(session.access_token, catalog["href"], package, "item", chunk_size=4096)
+
+    assert upload["bytes"] == sum(DISKS.values())
+    assert {n: f["sent"] for n, f in upload["files"].items()} == DISKS
+    assert _status(cloud, vcd, catalog) == {"item": "RESOLVED"}
+    # a finished upload leaves no checkpoint behind
+    assert checkpoints.load() == {}
+
+
+@pytest.mark.cloud(task_duration=0.1)
+def test_push_ova(cloud, vcd, catalog, package, checkpoints, tmp_path):
+    _, session = vcd
+    ova = str(tmp_path / "item.ova")
+    with tarfile.open(ova, "w") as tar:
+        for name in ["item.ovf", *DISKS]:
+            tar.add(str(tmp_path / name), arcname=name)
+
+    upload = ovf_upload.push_ovf(session.access_token, catalog["href"], ova, "item", chunk_size=4096)
+
+    assert upload["bytes"] == sum(DISKS.values())
+    assert _status(cloud, vcd, catalog) == {"item": "RESOLVED"}
+
+
+@pytest.mark.cloud(task_duration=0.1)
+def test_interrupted_push_resumes_with_the_missing_bytes(cloud, vcd, catalog, package, checkpoints, monkeypatch):
+    _, session = vcd
+    put = ovf_upload._put
+    sent = []
+
+    def interrupted(vmware_access_token, href, data, start, size):
+        if href.endswith(ovf_upload.DESCRIPTOR):
+            return put(vmware_access_token, href, data, start, size)
+        if len(sent) == 4:
+            raise requests.ConnectionError("connection lost")
+        put(vmware_access_token, href, data, start, size)
+        sent.append(len(data))
+
+    monkeypatch.setattr(ovf_upload, "_put", interrupted)
+    with pytest.raises(requests.ConnectionError):
+        ovf_upload.push_ovf(session.access_token, catalog["href"], package, "item", chunk_size=1024, parallel=1)
+    monkeypatch.setattr(ovf_upload, "_put", put)
+    assert _status(cloud, vcd, catalog) == {"item": "UNRESOLVED"}
+
+    # another chunk size, the ranges sent are still skipped
+    upload = ovf_upload.push_ovf(session.access_token, catalog["href"], package, "item", chunk_size=4096)
+
+    assert sum(sent) == 4 * 1024
+    assert upload["bytes"] == sum(DISKS.values()) - sum(sent)
+    assert _status(cloud, vcd, catalog) == {"item": "RESOLVED"}
+
+
+def test_rebuilt_files_change_the_fingerprint(package, tmp_path):
+    with ovf_upload.OvfPackage(package) as p:
+        before = p.fingerprint()
+        assert sorted(p.files) == sorted(DISKS)
+    with ovf_upload.OvfPackage(package) as p:
+        assert p.fingerprint() == before
+
+    disk = tmp_path / "disk2.vmdk"
+    disk.write_bytes(os.urandom(DISKS["disk2.vmdk"]))
+    stat = disk.stat()
+    os.utime(disk, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    with ovf_upload.OvfPackage(package) as p:
+        assert p.fingerprint() != before
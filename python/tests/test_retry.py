@@ -0,0 +1,66 @@
+import time
+
+import pytest
+import requests
+
+from lib import retry
+from lib.requests_session import requests_session
+
+
+def test_budget_stops_retries_once_spent():
+    budget = retry.RetryBudget(ratio=0.0, min_retries=2, window=60)
+    budget.record_request()
+
+    assert [budget.try_retry() for _ in range(3)] == [True, True, False]
+    assert budget.stats() == {"requests": 1, "retries": 2, "exhausted": 1}
+
+
+@pytest.mark.cloud(error_rate=1.0)
+def test_spent_budget_fails_fast(cloud):
+    retry.configure_retries(ratio=0.0, min_retries=1)
+
+    with retry.retry_policy(total=5):
+        r = requests_session().get(f"{cloud.base_url}/us-south/v1/director_sites")
+
+    assert r.status_code >= 500
+    # the first attempt and the one retry the budget allows
+    assert cloud.stats()["total_requests"] == 2
+
+
+@pytest.mark.cloud(throttle_rate=1.0)
+def test_retry_after_is_honoured(cloud):
+    # every answer is 429 with Retry-After: 1
+    start = time.monotonic()
+    with retry.retry_policy(total=1):
+        r = requests_session().get(f"{cloud.base_url}/us-south/v1/director_sites")
+
+    assert r.status_code == 429
+    assert cloud.stats()["total_requests"] == 2
+    assert time.monotonic() - start >= 1.0
+
+
+@pytest.mark.cloud(throttle_rate=1.0)
+def test_retry_after_beyond_max_returns_at_once(cloud):
+    with retry.retry_policy(total=3, max_retry_after=0.5):
+        r = requests_session().get(f"{cloud.base_url}/us-south/v1/director_sites")
+
+    assert r.status_code == 429
+    assert cloud.stats()["total_requests"] == 1
+
+
+def test_retry_after_http_date():
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+
+    assert 28 <= retry.retry_after({"Retry-After": date}) <= 30
+    assert retry.retry_after({"Retry-After": "2"}) == 2.0
+    assert retry.retry_after({}) is None
+
+
+@pytest.mark.cloud(error_rate=1.0)
+def test_post_not_retried_on_server_error(cloud):
+    with pytest.raises(requests.HTTPError):
+        r = requests_session().post(f"{cloud.base_url}/cloudapi/1.0.0/sessions")
+        r.raise_for_status()
+
+    # the server may have acted on it
+    assert cloud.stats()["total_requests"] == 1
@@ -0,0 +1,94 @@
+import asyncio
+import time
+
+import pytest
+
+from lib.cloud_director import powerOn, query_vm
+from lib.tasks import TaskError, TaskTimeoutError, TaskTracker
+
+
+def _power_on(cloud, session, n):
+    vms = query_vm(cloud.base_url, session.access_token, "")[:n]
+    return [powerOn(vm["href"], session.access_token)["href"] for vm in vms]
+
+
+@pytest.mark.cloud(task_duration=0.2)
+def test_tracker_waits_with_batched_queries(cloud, vcd):
+    _, session = vcd
+    hrefs = _power_on(cloud, session, 6)
+    tracker = TaskTracker(session.access_token, poll_interval=0.1, batch_size=25)
+    for href in hrefs:
+        tracker.add(href)
+    cloud.reset_stats()
+
+    assert set(tracker.wait().values()) == {"success"}
+    # one query of the six tasks per round, not one request per task
+    assert cloud.stats()["total_requests"] < len(hrefs)
+
+
+@pytest.mark.cloud(task_duration=5)
+def test_deadline_raises_without_waiting_for_the_task(cloud, vcd):
+    _, session = vcd
+    href, = _power_on(cloud, session, 1)
+    tracker = TaskTracker(session.access_token, poll_interval=1.0)
+    tracker.add(href, timeout=0.3)
+
+    start = time.monotonic()
+    with pytest.raises(TaskTimeoutError) as e:
+        tracker.wait()
+
+    assert time.monotonic() - start < 1.0
+    assert list(e.value.failed) == [href]
+
+
+@pytest.mark.cloud(task_duration=0.1, task_error_rate=1.0)
+def test_timeout_reports_the_failed_tasks_too(cloud, vcd):
+    _, session = vcd
+    failing, = _power_on(cloud, session, 1)
+    cloud.task_duration, cloud.task_error_rate = 5, 0.0
+    slow, = _power_on(cloud, session, 1)
+    tracker = TaskTracker(session.access_token, poll_interval=0.1)
+    tracker.add(failing)
+    tracker.add(slow, timeout=0.5)
+
+    with pytest.raises(TaskTimeoutError) as e:
+        tracker.wait()
+
+    assert list(e.value.timed_out) == [slow]
+    assert set(e.value.failed) == {failing, slow}
+    assert e.value.failed[failing] == "error"
+    assert "timed out" in str(e.value)
+
+
+@pytest.mark.cloud(task_duration=0.1, task_error_rate=1.0)
+def test_failed_task_raises(cloud, vcd):
+    _, session = vcd
+    href, = _power_on(cloud, session, 1)
+    tracker = TaskTracker(session.access_token, poll_interval=0.1)
+    tracker.add(href)
+
+    with pytest.raises(TaskError) as e:
+        tracker.wait()
+
+    assert not isinstance(e.value, TaskTimeoutError)
+    assert e.value.failed == {href: "error"}
+
+
+@pytest.mark.cloud(task_duration=5)
+def test_async_tracker_deadline(cloud, vcd):
+    from lib.aio.client import close_session
+    from lib.aio.tasks import AsyncTaskTracker
+
+    _, session = vcd
+    href, = _power_on(cloud, session, 1)
+    tracker = AsyncTaskTracker(session.access_token, poll_interval=1.0)
+    tracker.add(href, timeout=0.3)
+
+    async def main():
+        try:
+            await asyncio.wait_for(tracker.wait(), 2)
+        finally:
+            await close_session()
+
+    with pytest.raises(TaskTimeoutError):
+        asyncio.run(main())
@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from lib.throttle import AimdLimiter, HostThrottle, ThrottleTimeout, TokenBucket
+
+
+def test_bucket_spaces_requests_at_rate():
+    bucket = TokenBucket(rate=10, burst=1)
+
+    waits = [bucket.reserve() for _ in range(3)]
+
+    assert waits[0] == 0.0
+    assert waits[1] == pytest.approx(0.1, abs=0.01)
+    assert waits[2] == pytest.approx(0.2, abs=0.01)
+
+
+def test_rejected_reservations_are_not_charged():
+    bucket = TokenBucket(rate=10, burst=1)
+
+    accepted = [w for w in (bucket.reserve(timeout=0.5) for _ in range(30)) if w is not None]
+
+    # 0 s, then one token every 0.1 s up to the 0.5 s the callers can wait
+    assert len(accepted) == 6
+    assert bucket.reserve() == pytest.approx(0.6, abs=0.02)
+
+    time.sleep(1.0)
+    assert bucket.reserve() == 0.0
+
+
+def test_slot_times_out_without_a_free_slot():
+    host = HostThrottle("host", rate=0, burst=1, concurrency=1, max_concurrency=1)
+
+    with host.slot() as slot:
+        slot.status = 200
+        with pytest.raises(ThrottleTimeout):
+            with host.slot(timeout=0.05):
+                pass
+
+    assert host.limiter.in_flight == 0
+
+
+def test_timed_out_slots_give_their_token_back():
+    host = HostThrottle("host", rate=1, burst=2, concurrency=1, max_concurrency=1)
+
+    async def timed_out():
+        with pytest.raises(ThrottleTimeout):
+            async with host.async_slot(timeout=0.02):
+                pass
+
+    with host.slot() as slot:
+        slot.status = 200
+        for _ in range(3):
+            with pytest.raises(ThrottleTimeout):
+                with host.slot(timeout=0.02):
+                    pass
+            asyncio.run(timed_out())
+
+    # the token of the slot taken is spent, the one left is still there
+    assert host.bucket.reserve() == 0.0
+    assert host.bucket.reserve() > 0.5
+
+
+def test_limit_halves_on_overload():
+    limiter = AimdLimiter(initial=8, maximum=8)
+
+    assert limiter.acquire()
+    limiter.release(0.01, overloaded=True)
+
+    assert limiter.limit == 4
+
+
+def test_async_waiters_are_woken_by_release():
+    host = HostThrottle("host", rate=0, burst=1, concurrency=4, max_concurrency=4)
+    peak = 0
+
+    async def request():
+        nonlocal peak
+        async with host.async_slot() as slot:
+            peak = max(peak, host.limiter.in_flight)
+            await asyncio.sleep(0.001)
+            slot.status = 200
+
+    async def main():
+        await asyncio.wait_for(asyncio.gather(*(request() for _ in range(2000))), 10)
+
+    asyncio.run(main())
+
+    assert peak == 4
+    assert host.limiter.in_flight == 0
+    assert not host.limiter._async_waiters
+
+
+def test_async_waiter_woken_from_another_thread():
+    host = HostThrottle("host", rate=0, burst=1, concurrency=1, max_concurrency=1)
+    slot = host.slot()
+    slot.__enter__()
+
+    def release():
+        time.sleep(0.1)
+        slot.__exit__(None, None, None)
+
+    async def main():
+        start = time.monotonic()
+        async with host.async_slot(timeout=5) as s:
+            s.status = 200
+        return time.monotonic() - start
+
+    threading.Thread(target=release).start()
+
+    assert asyncio.run(main()) < 1.0
@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+import lib.iam as iam
+from lib.cloud_director import query_vm
+from lib.vcfaas import VmwareSessionPool
+
+
+@pytest.fixture
+def pool():
+    pool = VmwareSessionPool(maxsize=4)
+    yield pool
+    pool.close()
+
+
+def _live(cloud):
+    return len(cloud._sessions)
+
+
+def test_principals_of_one_org_get_their_own_sessions(cloud, pool):
+    org = cloud.orgs[0].name
+    student1 = iam.request_ibm_iam_access_token("student-1")
+    student2 = iam.request_ibm_iam_access_token("student-2")
+
+    session1 = pool.get(student1, cloud.base_url, org)
+    session2 = pool.get(student2, cloud.base_url, org)
+
+    assert session1.user != session2.user
+    assert session1.access_token != session2.access_token
+
+    pool.logout(student1, cloud.base_url, org)
+
+    # the other student's session is still live
+    assert query_vm(cloud.base_url, session2.access_token, "")
+    assert _live(cloud) == 1
+
+
+def test_new_iam_token_of_the_same_principal_reuses_the_session(cloud, pool):
+    org = cloud.orgs[0].name
+    first = pool.get(iam.request_ibm_iam_access_token("student-1"), cloud.base_url, org)
+    second = pool.get(iam.request_ibm_iam_access_token("student-1"), cloud.base_url, org)
+
+    assert second is first
+    assert pool.stats()["created"] == 1
+
+
+def test_expired_session_is_replaced_and_logged_out(cloud, pool):
+    org = cloud.orgs[0].name
+    token = iam.request_ibm_iam_access_token("student-1")
+    first = pool.get(token, cloud.base_url, org)
+    first.expires_at = time.time()
+
+    second = pool.get(token, cloud.base_url, org)
+
+    assert second is not first
+    assert _live(cloud) == 1
+
+
+def test_get_restarts_the_idle_timeout(cloud, pool):
+    token = iam.request_ibm_iam_access_token("student-1")
+    session = pool.get(token, cloud.base_url, cloud.orgs[0].name)
+    session.expires_at = time.time() + 120
+
+    assert pool.get(token, cloud.base_url, cloud.orgs[0].name) is session
+    assert session.expires_at > time.time() + 1000
+
+
+def test_least_recently_used_session_is_evicted(cloud, pool):
+    for i in range(5):
+        pool.get(iam.request_ibm_iam_access_token(f"student-{i}"), cloud.base_url, cloud.orgs[0].name)
+
+    assert pool.stats()["evicted"] == 1
+    assert _live(cloud) == 4
+
+
+def test_rejected_session_is_renewed_for_its_principal(cloud, pool):
+    org = cloud.orgs[0].name
+    token = iam.request_ibm_iam_access_token("student-1")
+    session = pool.get(token, cloud.base_url, org)
+    cloud._sessions.clear()
+
+    renewed = pool.renew(session.access_token)
+
+    assert renewed is not None and renewed != session.access_token
+    assert pool.get(token, cloud.base_url, org).user == session.user